@@ -0,0 +1,427 @@
+"""
+backtest.py
+------------
+Strategy backtests on stored history and the parameter optimizer
+(`python trading.py --backtest ...` / `--optimize ...`).
+"""
+
+import os
+import time
+from datetime import datetime
+
+from config import CONFIG, STRATEGY_PARAMS, np
+from cache import _load_ohlcv_file, _ohlcv_cache_path, _ohlcv_lock, _save_ohlcv_file, symbol_index_for
+from trading import (
+    _parse_symbol_list, _rolling_matrix, add_indicators_matrix, get_public_exchange, ohlcv_matrix,
+    signal_codes_matrix,
+)
+
+
+# --------- اختبار الاستراتيجية على البيانات التاريخية ---------
+# History for backtests lives next to the live OHLCV cache as
+# <symbol>.history.npy and is never trimmed to OHLCV_CACHE_KEEP.
+# <symbol>.history.from holds the earliest start it was fetched from, so a
+# symbol listed after --since is not downloaded again on every run.
+def _history_path(exchange_obj, symbol, timeframe):
+    return _ohlcv_cache_path(exchange_obj, symbol, timeframe)[:-len(".npy")] + ".history.npy"
+
+def _fetch_ohlcv_pages(exchange_obj, symbol, timeframe, cursor, until_ms, page_limit):
+    """Page fetch_ohlcv forward from cursor; returns the bars before until_ms."""
+    pages = []
+    while cursor < until_ms:
+        page = np.asarray(exchange_obj.fetch_ohlcv(symbol, timeframe, since=cursor, limit=page_limit), dtype=np.float64).reshape(-1, 6)
+        if pages:
+            page = page[page[:, 0] > pages[-1][-1, 0]]
+        page = page[page[:, 0] < until_ms]
+        if not len(page):
+            break
+        pages.append(page)
+        cursor = int(page[-1, 0]) + 1
+    return np.concatenate(pages) if pages else np.empty((0, 6))
+
+def fetch_ohlcv_history(exchange_obj, symbol, timeframe, since_ms, until_ms=None, page_limit=1000):
+    """Page fetch_ohlcv forward from since_ms and keep the result on disk.
+
+    Later calls only download bars after the last stored one, plus the head
+    before the stored range when since_ms is earlier than any previous call.
+    """
+    path = _history_path(exchange_obj, symbol, timeframe)
+    from_path = path[:-len(".npy")] + ".from"
+    since_ms = int(since_ms)
+    until_ms = int(until_ms or time.time() * 1000)
+    with _ohlcv_lock(path):
+        stored = _load_ohlcv_file(path)
+        stored = np.array(stored) if stored is not None else np.empty((0, 6))
+        covered = None
+        if len(stored):
+            try:
+                with open(from_path) as fh:
+                    covered = int(fh.read().strip())
+            except (OSError, ValueError):
+                covered = int(stored[0, 0])
+        hist = stored
+        if not len(hist):
+            hist = _fetch_ohlcv_pages(exchange_obj, symbol, timeframe, since_ms, until_ms + 1, page_limit)
+        else:
+            if since_ms < covered:
+                # only the missing head; empty when the symbol listed later
+                head = _fetch_ohlcv_pages(exchange_obj, symbol, timeframe, since_ms, int(hist[0, 0]), page_limit)
+                hist = np.concatenate([head, hist])
+            # the last stored bar is fetched again: it may have been open
+            tail = _fetch_ohlcv_pages(exchange_obj, symbol, timeframe, int(hist[-1, 0]), until_ms + 1, page_limit)
+            hist = np.concatenate([hist[hist[:, 0] < tail[0, 0]], tail]) if len(tail) else hist
+        new_covered = since_ms if covered is None else min(covered, since_ms)
+        if len(hist) and (len(hist) != len(stored) or new_covered != covered or not np.array_equal(hist[-1], stored[-1])):
+            _save_ohlcv_file(path, hist)
+            with open(from_path, 'w') as fh:
+                fh.write(str(new_covered))
+    hist = hist[(hist[:, 0] >= since_ms) & (hist[:, 0] <= until_ms)]
+    return hist
+
+def _first_true(mask_fn, start, end, chunk=256):
+    """Index of the first bar in [start, end) where mask_fn(lo, hi) is True, else None.
+
+    The window grows geometrically, so short trades only look at a few bars.
+    """
+    lo = start
+    while lo < end:
+        hi = min(end, lo + chunk)
+        hits = np.flatnonzero(mask_fn(lo, hi))
+        if len(hits):
+            return lo + int(hits[0])
+        lo = hi
+        chunk *= 2
+    return None
+
+def simulate_exits(time_col, high, low, close, codes, tp_pct=None, sl_pct=None, max_hold_bars=None, fee_pct=0.0, tp_abs=None, sl_abs=None):
+    """Replay entries at signal-bar closes with the tp_pct/sl_pct exit rule.
+
+    One position at a time: an entry is taken at the close of a BUY/SELL bar
+    and exits on the first later bar whose high/low touches TP or SL. When
+    both are inside the same bar the SL is assumed to have hit first. With
+    max_hold_bars the trade is closed at that bar's close ('timeout'); trades
+    still open at the end of the data close at the last close ('eod').
+    tp_abs/sl_abs are optional per-bar price distances (e.g. k * ATR) that
+    replace the percentage levels where they are defined.
+    """
+    tp_pct = CONFIG["tp_pct"] if tp_pct is None else tp_pct
+    sl_pct = CONFIG["sl_pct"] if sl_pct is None else sl_pct
+    n = len(close)
+    trades = []
+    next_free = 0
+    for i in np.flatnonzero(codes != 0):
+        if i < next_free or i >= n - 1 or np.isnan(close[i]):
+            continue
+        side = int(codes[i])
+        entry = float(close[i])
+        tp_d = float(tp_abs[i]) if tp_abs is not None and not np.isnan(tp_abs[i]) else entry * tp_pct
+        sl_d = float(sl_abs[i]) if sl_abs is not None and not np.isnan(sl_abs[i]) else entry * sl_pct
+        end = n if not max_hold_bars else min(n, i + 1 + int(max_hold_bars))
+        if side > 0:
+            tp, sl = entry + tp_d, entry - sl_d
+            j_tp = _first_true(lambda a, b: high[a:b] >= tp, i + 1, end)
+            j_sl = _first_true(lambda a, b: low[a:b] <= sl, i + 1, end if j_tp is None else j_tp + 1)
+        else:
+            tp, sl = entry - tp_d, entry + sl_d
+            j_tp = _first_true(lambda a, b: low[a:b] <= tp, i + 1, end)
+            j_sl = _first_true(lambda a, b: high[a:b] >= sl, i + 1, end if j_tp is None else j_tp + 1)
+        if j_sl is not None and (j_tp is None or j_sl <= j_tp):
+            j, status, ret = j_sl, 'sl', -sl_d / entry
+        elif j_tp is not None:
+            j, status, ret = j_tp, 'tp', tp_d / entry
+        else:
+            j = end - 1
+            status = 'timeout' if end < n else 'eod'
+            ret = side * (float(close[j]) - entry) / entry
+        ret -= 2 * fee_pct
+        trades.append({
+            'entry_ts': int(time_col[i]),
+            'exit_ts': int(time_col[j]),
+            'side': 'BUY' if side > 0 else 'SELL',
+            'entry': entry,
+            'status': status,
+            'return': ret,
+        })
+        next_free = j + 1
+    return trades
+
+def backtest_stats(trades, trade_size_usdt=None):
+    """Trade count, win rate, PnL and max drawdown for a list of simulated trades."""
+    size = CONFIG["trade_size_usdt"] if trade_size_usdt is None else trade_size_usdt
+    trades = sorted(trades, key=lambda t: t['exit_ts'])
+    rets = np.array([t['return'] for t in trades], dtype=np.float64)
+    if not len(rets):
+        return {'trades': 0, 'wins': 0, 'win_rate': None, 'pnl_usdt': 0.0, 'avg_return': None, 'max_drawdown_usdt': 0.0}
+    equity = np.cumsum(rets * size)
+    peak = np.maximum.accumulate(np.concatenate([[0.0], equity]))[1:]
+    return {
+        'trades': int(len(rets)),
+        'wins': int((rets > 0).sum()),
+        'win_rate': float((rets > 0).mean()),
+        'pnl_usdt': float(equity[-1]),
+        'avg_return': float(rets.mean()),
+        'max_drawdown_usdt': float((peak - equity).max()),
+    }
+
+def backtest_universe(histories, tp_pct=None, sl_pct=None, max_hold_bars=None, fee_pct=0.0, chunk=64):
+    """Backtest get_signal + TP/SL over {symbol: (bars, 6) array} histories.
+
+    Indicators are computed with add_indicators_matrix for `chunk` symbols at a
+    time, so long histories across many symbols cost one bar loop per chunk.
+    Returns (summary, {symbol: stats}).
+    """
+    symbols = [sym for sym, arr in histories.items() if len(arr) >= 50]
+    per_symbol, all_trades = {}, []
+    for k in range(0, len(symbols), chunk):
+        group = symbols[k:k + chunk]
+        mats = ohlcv_matrix([histories[sym] for sym in group])
+        codes = signal_codes_matrix(add_indicators_matrix(mats["high"], mats["low"], mats["close"]))
+        for r, sym in enumerate(group):
+            trades = simulate_exits(mats["time"][r], mats["high"][r], mats["low"][r], mats["close"][r],
+                                    codes[r], tp_pct, sl_pct, max_hold_bars, fee_pct)
+            per_symbol[sym] = backtest_stats(trades)
+            all_trades.extend(trades)
+    return backtest_stats(all_trades), per_symbol
+
+def _parse_date_ms(text):
+    from datetime import timezone
+    dt = datetime.fromisoformat(str(text))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+def cli_backtest():
+    import argparse, json, sys
+    p = argparse.ArgumentParser()
+    p.add_argument('--backtest', required=True, help="Symbol(s): 'BTC,ETH', '@file' or '-' for stdin")
+    p.add_argument('--since', required=True, help='Start date, e.g. 2024-01-01')
+    p.add_argument('--until', default=None, help='End date (default: now)')
+    p.add_argument('--tp', type=float, default=None, help='Take profit fraction (default TP_PCT)')
+    p.add_argument('--sl', type=float, default=None, help='Stop loss fraction (default SL_PCT)')
+    p.add_argument('--max-hold-bars', type=int, default=None, help='Close trades after N bars')
+    p.add_argument('--fee-pct', type=float, default=0.0, help='Fee per side as a fraction')
+    args = p.parse_args()
+    ex = get_public_exchange()
+    index = symbol_index_for(ex)
+    since_ms = _parse_date_ms(args.since)
+    until_ms = _parse_date_ms(args.until) if args.until else None
+    histories = {}
+    for raw in _parse_symbol_list(args.backtest):
+        sym = index.resolve(raw) or raw
+        try:
+            histories[sym] = fetch_ohlcv_history(ex, sym, CONFIG["timeframe"], since_ms, until_ms)
+        except Exception as e:
+            print(f"⚠️ خطأ في {sym}: {e}", file=sys.stderr)
+    summary, per_symbol = backtest_universe(histories, args.tp, args.sl, args.max_hold_bars, args.fee_pct)
+    print(json.dumps({'timeframe': CONFIG["timeframe"], 'summary': summary, 'symbols': per_symbol}))
+
+
+# --------- تحسين المعاملات ---------
+# Grid/random search over strategy constants. Indicator series are computed
+# once into a shared-memory block ((fields, symbols, bars) float64) that every
+# worker process maps read-only; each task only re-derives entry codes and
+# replays exits for one parameter combination.
+#
+# Two strategies can be optimized:
+#   signal - get_signal's rule with tp_pct/sl_pct exits (what run_once trades)
+#   votes  - analyze_symbol's weighted votes + score >= 50 with ATR-based
+#            SL/TP (atr_sl_mult / atr_tp_mult); the HTF filter is not modelled
+OPT_FIELDS = ['time', 'high', 'low', 'close', 'EMA50', 'EMA200', 'MACD', 'MACD_signal',
+              'RSI', 'StochRSI', 'ATR', 'vol_vs_ma', 'vol_change']
+OPT_DEFAULT_GRIDS = {
+    'signal': {
+        'tp_pct': [0.02, 0.03, 0.05, 0.08],
+        'sl_pct': [0.01, 0.02, 0.03, 0.05],
+        'stoch_low': [0.1, 0.2, 0.3],
+        'stoch_high': [0.7, 0.8, 0.9],
+    },
+    'votes': {
+        'atr_sl_mult': [1.0, 1.5, 2.0],
+        'atr_tp_mult': [2.0, 3.0, 4.0],
+        'vote_threshold': [3, 4],
+        'w_rsi': [0, 1, 2],
+        'w_vol': [0, 1, 2],
+        'macd_strength_min': [0.0, 0.00005, 0.0002],
+    },
+}
+_OPT_SHARED = {}
+
+def strategy_series(mats, ind):
+    """Volume features analyze_symbol uses, as (symbols, bars) matrices."""
+    volume = mats["volume"]
+    prev_vol = np.concatenate([np.full((volume.shape[0], 1), np.nan), volume[:, :-1]], axis=1)
+    ma_vol = _rolling_matrix(volume, 20, np.mean)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vol_vs_ma = np.where(ma_vol != 0, (volume - ma_vol) / ma_vol, volume - ma_vol)
+        vol_change = np.where(prev_vol != 0, (volume - prev_vol) / np.abs(prev_vol), np.nan)
+    return {'vol_vs_ma': vol_vs_ma, 'vol_change': vol_change}
+
+def vote_codes_matrix(series, params):
+    """analyze_symbol's strong_bull/strong_bear decision at every bar (+1/-1/0)."""
+    p = dict(STRATEGY_PARAMS, **(params or {}))
+    e50, e200 = series['EMA50'], series['EMA200']
+    macd, sig = series['MACD'], series['MACD_signal']
+    rsi, stoch, atr = series['RSI'], series['StochRSI'], series['ATR']
+    close, vol_vs_ma, vol_change = series['close'], series['vol_vs_ma'], series['vol_change']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        strength = np.abs(macd - sig) / np.abs(close)
+        atr_pct = atr / close
+    # confidence score: mean of +/-1 components mapped to 0..100
+    comp_sum = np.zeros(close.shape)
+    comp_n = np.zeros(close.shape)
+    for valid, val in (
+        (~np.isnan(e50) & ~np.isnan(e200), np.where(e50 > e200, 1, -1)),
+        (~np.isnan(macd) & ~np.isnan(sig), np.where(macd > sig, 1, -1)),
+        (stoch < p['stoch_low'], 1),
+        (stoch > p['stoch_high'], -1),
+        (~np.isnan(vol_change), np.where(vol_change > 0, 1, -1)),
+        (~np.isnan(atr_pct) & (close != 0), np.where(atr_pct > 0.25, -1, 1)),
+    ):
+        comp_sum += np.where(valid, val, 0)
+        comp_n += valid
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(comp_n > 0, (comp_sum / comp_n + 1) / 2 * 100, 50.0)
+    bull = (p['w_ema'] * (e50 > e200) + p['w_macd'] * ((macd > sig) & (strength > p['macd_strength_min']))
+            + p['w_rsi'] * ((rsi > 50) & (rsi < 80)) + p['w_vol'] * (vol_vs_ma > 0.05))
+    bear = (p['w_ema'] * (e50 < e200) + p['w_macd'] * ((macd < sig) & (strength > p['macd_strength_min']))
+            + p['w_rsi'] * ((rsi < 50) & (rsi > 20)) + p['w_vol'] * (vol_vs_ma < -0.05))
+    strong_bull = (bull >= p['vote_threshold']) & (score >= 50)
+    strong_bear = (bear >= p['vote_threshold']) & (score >= 50)
+    return np.where(strong_bull, 1, np.where(strong_bear, -1, 0)).astype(np.int8)
+
+def _opt_attach(name, shape):
+    """Worker initializer: map the parent's block, closed again when the worker exits.
+
+    The parent owns the segment. Before Python 3.13 attaching registers it
+    with the worker's resource_tracker, which unlinks it (or warns about a
+    leak) when the worker exits, so registration is skipped there.
+    """
+    import sys
+    from multiprocessing import resource_tracker, shared_memory, util
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+    _OPT_SHARED['shm'] = shm
+    _OPT_SHARED['data'] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    # pool workers leave through os._exit: atexit would not run, finalizers do
+    util.Finalize(None, _opt_detach, exitpriority=10)
+
+def _opt_detach():
+    _OPT_SHARED.pop('data', None)
+    shm = _OPT_SHARED.pop('shm', None)
+    if shm is not None:
+        shm.close()
+
+def _opt_run(strategy, params, max_hold_bars=None, fee_pct=0.0):
+    data = _OPT_SHARED['data']
+    series = {f: data[k] for k, f in enumerate(OPT_FIELDS)}
+    p = dict(STRATEGY_PARAMS, tp_pct=CONFIG["tp_pct"], sl_pct=CONFIG["sl_pct"])
+    p.update(params)
+    if strategy == 'votes':
+        codes = vote_codes_matrix(series, p)
+        tp_abs = series['ATR'] * p['atr_tp_mult']
+        sl_abs = series['ATR'] * p['atr_sl_mult']
+    else:
+        codes = signal_codes_matrix(series, p['stoch_low'], p['stoch_high'])
+        tp_abs = sl_abs = None
+    trades = []
+    for r in range(codes.shape[0]):
+        trades.extend(simulate_exits(series['time'][r], series['high'][r], series['low'][r], series['close'][r],
+                                     codes[r], p['tp_pct'], p['sl_pct'], max_hold_bars, fee_pct,
+                                     None if tp_abs is None else tp_abs[r],
+                                     None if sl_abs is None else sl_abs[r]))
+    return dict(params, **backtest_stats(trades))
+
+def parameter_grid(grid, n_random=None, seed=0):
+    """Expand {param: [values]} into combos; with n_random, sample that many distinct ones."""
+    import itertools, random
+    keys = list(grid)
+    combos = [dict(zip(keys, vals)) for vals in itertools.product(*[grid[k] for k in keys])]
+    if n_random and n_random < len(combos):
+        combos = random.Random(seed).sample(combos, n_random)
+    return combos
+
+def optimize(histories, grid=None, strategy='signal', n_random=None, processes=None,
+             metric='pnl_usdt', max_hold_bars=None, fee_pct=0.0, chunk=64):
+    """Backtest every parameter combination on a process pool; returns rows ranked by metric."""
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+    symbols = [sym for sym, arr in histories.items() if len(arr) >= 50]
+    if not symbols:
+        return []
+    bars = max(len(histories[sym]) for sym in symbols)
+    shape = (len(OPT_FIELDS), len(symbols), bars)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    try:
+        data = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        for k in range(0, len(symbols), chunk):
+            group = symbols[k:k + chunk]
+            mats = ohlcv_matrix([histories[sym] for sym in group], bars)
+            ind = add_indicators_matrix(mats["high"], mats["low"], mats["close"])
+            series = dict(mats, **ind, **strategy_series(mats, ind))
+            for f, name in enumerate(OPT_FIELDS):
+                data[f, k:k + len(group)] = series[name]
+        combos = parameter_grid(grid or OPT_DEFAULT_GRIDS[strategy], n_random)
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count(),
+                                 initializer=_opt_attach, initargs=(shm.name, shape)) as pool:
+            futures = [pool.submit(_opt_run, strategy, c, max_hold_bars, fee_pct) for c in combos]
+            rows = [f.result() for f in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+    rows.sort(key=lambda r: (r.get(metric) is not None, r.get(metric) or 0), reverse=True)
+    for rank, row in enumerate(rows, 1):
+        row['rank'] = rank
+    return rows
+
+def _parse_grid(text):
+    """'tp_pct=0.02,0.05;sl_pct=0.01,0.03' -> {'tp_pct': [0.02, 0.05], 'sl_pct': [0.01, 0.03]}"""
+    grid = {}
+    for part in str(text or '').split(';'):
+        if '=' not in part:
+            continue
+        key, vals = part.split('=', 1)
+        grid[key.strip()] = [float(v) for v in vals.split(',') if v.strip()]
+    return grid
+
+def cli_optimize():
+    import argparse, csv, json, sys
+    p = argparse.ArgumentParser()
+    p.add_argument('--optimize', required=True, help="Symbol(s): 'BTC,ETH', '@file' or '-' for stdin")
+    p.add_argument('--since', required=True, help='Start date, e.g. 2024-01-01')
+    p.add_argument('--until', default=None, help='End date (default: now)')
+    p.add_argument('--strategy', choices=sorted(OPT_DEFAULT_GRIDS), default='signal')
+    p.add_argument('--grid', default=None, help="e.g. 'tp_pct=0.02,0.05;sl_pct=0.01,0.03' (default: built-in grid)")
+    p.add_argument('--random', type=int, default=None, help='Sample N combinations instead of the full grid')
+    p.add_argument('--processes', type=int, default=None)
+    p.add_argument('--metric', default='pnl_usdt', help='Ranking column (pnl_usdt, win_rate, avg_return, ...)')
+    p.add_argument('--max-hold-bars', type=int, default=None)
+    p.add_argument('--fee-pct', type=float, default=0.0)
+    p.add_argument('--out', default='optimize_results.csv', help='Ranked results table (CSV)')
+    args = p.parse_args()
+    ex = get_public_exchange()
+    index = symbol_index_for(ex)
+    since_ms = _parse_date_ms(args.since)
+    until_ms = _parse_date_ms(args.until) if args.until else None
+    histories = {}
+    for raw in _parse_symbol_list(args.optimize):
+        sym = index.resolve(raw) or raw
+        try:
+            histories[sym] = fetch_ohlcv_history(ex, sym, CONFIG["timeframe"], since_ms, until_ms)
+        except Exception as e:
+            print(f"⚠️ خطأ في {sym}: {e}", file=sys.stderr)
+    rows = optimize(histories, _parse_grid(args.grid) or None, args.strategy, args.random,
+                    args.processes, args.metric, args.max_hold_bars, args.fee_pct)
+    if rows:
+        cols = ['rank'] + [c for c in rows[0] if c != 'rank']
+        with open(args.out, 'w', newline='') as fh:
+            w = csv.DictWriter(fh, fieldnames=cols)
+            w.writeheader()
+            w.writerows(rows)
+    print(json.dumps({'strategy': args.strategy, 'combinations': len(rows), 'out': args.out, 'top': rows[:10]}))
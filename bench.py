@@ -0,0 +1,377 @@
+"""
+bench.py
+------------
+Start-up timing (`--startup-bench`) and the replay benchmarks (`--bench`,
+`--bench-record`) for trading.py.
+"""
+
+import importlib
+import os
+import time
+
+from config import CONFIG, np
+from metrics import METRICS
+from cache import ANALYSIS_CACHE, CANDLES, _SYMBOL_INDEXES, load_markets_cached, ohlcv_frame
+import trading
+from trading import (
+    HTF_BARS, HTF_TIMEFRAMES, PositionTracker, _HTF_BIAS_CACHE, _INDICATOR_STATES, _PUBLIC_EXCHANGES,
+    add_indicators, analyze_symbol, get_public_exchange, get_signal, run_once,
+)
+
+
+# --------- زمن الإقلاع ---------
+def startup_benchmark(runs=5, args=('--health',)):
+    """Median wall time of `python trading.py <args>` in fresh processes, plus import cost per library."""
+    import statistics, subprocess, sys
+    script = os.path.abspath(trading.__file__)
+    timings = []
+    for _ in range(max(1, int(runs))):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, script] + list(args), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append(time.perf_counter() - t0)
+    libs = {}
+    for mod in ('ccxt', 'pandas', 'ta'):
+        code = f"import time; t = time.perf_counter(); import {mod}; print(time.perf_counter() - t)"
+        try:
+            out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+            libs[mod] = round(float(out.strip()), 4)
+        except Exception:
+            libs[mod] = None
+    return {
+        'command': ' '.join(['trading.py'] + list(args)),
+        'runs': len(timings),
+        'median_s': round(statistics.median(timings), 4),
+        'min_s': round(min(timings), 4),
+        'import_s': libs,
+    }
+
+
+# --------- قياس السرعة على بيانات مسجلة ---------
+# Benchmarks replay a fixture of recorded exchange responses (markets, tickers
+# and candles for TIMEFRAME and the HTF timeframes) through RecordedExchange,
+# so timings depend only on the code and the machine. --bench-record saves a
+# fixture from the live public API; without one --bench builds a synthetic
+# fixture from a fixed seed. Each run appends one JSON line to the results
+# file and prints the median-time ratio to the last run with the same fixture
+# and settings.
+def _bench_timeframes():
+    tfs = [CONFIG["timeframe"]]
+    return tfs + [tf for tf in HTF_TIMEFRAMES if tf not in tfs]
+
+def _bench_bars():
+    return max(int(CONFIG["limit"]), HTF_BARS + 1) + 100
+
+class RecordedExchange:
+    """ccxt-compatible stand-in that serves a recorded fixture.
+
+    Candle timestamps are shifted so the newest recorded bar is the candle
+    open right now; the OHLCV cache, open-candle and HTF expiry logic then
+    take the same paths as with live data.
+    """
+
+    def __init__(self, fixture, exchange_id=None):
+        self.id = exchange_id or fixture.get('exchange') or 'recorded'
+        self.rateLimit = 0
+        self.enableRateLimit = False
+        self.has = {'fetchTickers': True, 'fetchOHLCV': True}
+        self.options = {}
+        self.markets = None
+        self.currencies = None
+        self.symbols = []
+        self._markets = fixture.get('markets') or {}
+        self._tickers = fixture.get('tickers') or {}
+        self._ohlcv = {}
+        now_ms = int(time.time() * 1000)
+        for tf, by_symbol in (fixture.get('ohlcv') or {}).items():
+            tf_ms = self.parse_timeframe(tf) * 1000
+            for sym, rows in by_symbol.items():
+                arr = np.array(rows, dtype=np.float64).reshape(-1, 6)
+                if len(arr):
+                    arr[:, 0] += (now_ms - now_ms % tf_ms) - arr[-1, 0]
+                self._ohlcv[(sym, tf)] = arr
+
+    @staticmethod
+    def parse_timeframe(timeframe):
+        units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'M': 2592000, 'y': 31536000}
+        return int(timeframe[:-1]) * units[timeframe[-1]]
+
+    def load_markets(self, reload=False, params=None):
+        if self.markets is None or reload:
+            self.set_markets(self._markets)
+        return self.markets
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = dict(markets)
+        self.symbols = sorted(self.markets)
+        self.currencies = currencies
+        return self.markets
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params=None):
+        arr = self._ohlcv.get((symbol, timeframe))
+        if arr is None:
+            raise ValueError(f"no recorded {timeframe} candles for {symbol}")
+        if since is not None:
+            arr = arr[arr[:, 0] >= since]
+            if limit:
+                arr = arr[:limit]
+        elif limit:
+            arr = arr[-limit:]
+        return arr.tolist()
+
+    def fetch_ticker(self, symbol, params=None):
+        if symbol not in self._tickers:
+            raise ValueError(f"no recorded ticker for {symbol}")
+        return dict(self._tickers[symbol])
+
+    def fetch_tickers(self, symbols=None, params=None):
+        return {s: dict(self._tickers[s]) for s in (symbols or self._tickers) if s in self._tickers}
+
+    def amount_to_precision(self, symbol, amount):
+        return str(amount)
+
+def synthetic_fixture(n_symbols=500, bars=None, seed=7, exchange_id='binance'):
+    """Deterministic random-walk markets, tickers and candles for n_symbols USDT pairs."""
+    rng = np.random.default_rng(seed)
+    bars = int(bars or _bench_bars())
+    tfs = _bench_timeframes()
+    quote = CONFIG["symbol_filter"] or 'USDT'
+    markets, tickers, ohlcv = {}, {}, {tf: {} for tf in tfs}
+    for i in range(int(n_symbols)):
+        base = f"BENCH{i:03d}"
+        sym = f"{base}/{quote}"
+        markets[sym] = {
+            'id': base + quote, 'symbol': sym, 'base': base, 'quote': quote, 'type': 'spot',
+            'spot': True, 'active': True, 'precision': {'amount': 0.001, 'price': 0.0001},
+            'limits': {'amount': {'min': 0.001}, 'cost': {'min': 5}},
+        }
+        price0 = float(np.exp(rng.uniform(-3, 8)))
+        for tf in tfs:
+            tf_ms = RecordedExchange.parse_timeframe(tf) * 1000
+            close = price0 * np.exp(np.cumsum(rng.normal(0, 0.01, bars)))
+            open_ = np.concatenate([[price0], close[:-1]])
+            wick = np.abs(rng.normal(0, 0.004, bars)) * close
+            ohlcv[tf][sym] = np.column_stack([
+                np.arange(bars, dtype=np.float64) * tf_ms, open_,
+                np.maximum(open_, close) + wick, np.minimum(open_, close) - wick,
+                close, rng.lognormal(8, 1, bars),
+            ])
+        last = float(ohlcv[tfs[0]][sym][-1, 4])
+        tickers[sym] = {
+            'symbol': sym, 'last': last, 'close': last, 'bid': last * 0.9995, 'ask': last * 1.0005,
+            'quoteVolume': float(rng.lognormal(14, 1.5)), 'baseVolume': None,
+        }
+    return {'exchange': exchange_id, 'source': f'synthetic:{seed}', 'markets': markets, 'tickers': tickers, 'ohlcv': ohlcv}
+
+def record_fixture(exchange_obj, symbols=None, n_symbols=500, bars=None):
+    """Record markets, tickers and candles from a (public) exchange.
+
+    Without symbols the n_symbols most traded SYMBOL_FILTER pairs are used.
+    """
+    bars = int(bars or _bench_bars())
+    markets = load_markets_cached(exchange_obj)
+    tickers = exchange_obj.fetch_tickers()
+    if not symbols:
+        universe = [s for s in markets if str(s).endswith(CONFIG["symbol_filter"]) and s in tickers]
+        universe.sort(key=lambda s: -float((tickers[s] or {}).get('quoteVolume') or 0))
+        symbols = universe[:int(n_symbols)]
+    ohlcv = {tf: {} for tf in _bench_timeframes()}
+    for sym in symbols:
+        try:
+            rows = {tf: np.asarray(exchange_obj.fetch_ohlcv(sym, tf, limit=bars), dtype=np.float64).reshape(-1, 6)
+                    for tf in ohlcv}
+        except Exception as e:
+            print(f"⚠️ Skipping {sym}: {e}")
+            continue
+        for tf, arr in rows.items():
+            ohlcv[tf][sym] = arr
+    kept = set(ohlcv[CONFIG["timeframe"]])
+    return {
+        'exchange': str(getattr(exchange_obj, 'id', '') or 'recorded'),
+        'source': 'recorded:' + time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'markets': {s: m for s, m in markets.items() if s in kept},
+        'tickers': {s: t for s, t in tickers.items() if s in kept},
+        'ohlcv': ohlcv,
+    }
+
+def save_fixture(fixture, path):
+    """Store a fixture as .npz: candles as float64 arrays, the rest as one JSON string."""
+    import json
+    meta = {k: fixture.get(k) for k in ('exchange', 'source', 'markets', 'tickers')}
+    arrays = {f"{tf}|{sym}": np.asarray(rows, dtype=np.float64)
+              for tf, by_symbol in fixture['ohlcv'].items() for sym, rows in by_symbol.items()}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as fh:
+        np.savez_compressed(fh, __meta__=np.array(json.dumps(meta, default=str)), **arrays)
+
+def load_fixture(path):
+    import json
+    with np.load(path, allow_pickle=False) as data:
+        fixture = json.loads(str(data['__meta__']))
+        fixture['ohlcv'] = {}
+        for key in data.files:
+            if key != '__meta__':
+                tf, sym = key.split('|', 1)
+                fixture['ohlcv'].setdefault(tf, {})[sym] = data[key]
+    return fixture
+
+def _bench_summary(timings, per=None):
+    import statistics
+    s = sorted(timings)
+    out = {
+        'runs': len(s),
+        'median_s': round(statistics.median(s), 6),
+        'min_s': round(s[0], 6),
+        'p95_s': round(s[min(len(s) - 1, int(0.95 * len(s)))], 6),
+    }
+    if per:
+        out['per_symbol_ms'] = round(statistics.median(s) / per * 1000, 4)
+    return out
+
+def _bench_times(fn, runs):
+    timings = []
+    for _ in range(max(1, int(runs))):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+def _bench_candle_memory():
+    """CANDLES.memory() next to the same bars held as a DataFrame and as lists of floats."""
+    import sys
+    out = CANDLES.memory()
+    rings = list(CANDLES._rings.values())
+    if rings:
+        bars = rings[0].last()
+        rows = bars.tolist()
+        out['frame_bytes_per_series'] = int(ohlcv_frame(bars).memory_usage(deep=True).sum())
+        out['lists_bytes_per_series'] = sys.getsizeof(rows) + sum(
+            sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r) for r in rows)
+        out['bars_per_series'] = len(bars)
+    return out
+
+def run_benchmarks(fixture, repeats=5, analyze_limit=None):
+    """Time add_indicators, get_signal, analyze_symbol (cold and cached) and run_once against a fixture.
+
+    The recorded exchange replaces the private and pooled public exchanges
+    for the duration, caches live in a temporary directory and print output
+    is discarded. run_once is timed cold (empty caches) and then warm.
+    """
+    import contextlib, io, shutil, tempfile
+    rec = RecordedExchange(fixture)
+    symbols = sorted(s for s in rec._markets if str(s).endswith(CONFIG["symbol_filter"]))
+    if not symbols:
+        raise ValueError("fixture has no SYMBOL_FILTER markets")
+    keys = ('ohlcv_cache_dir', 'dry_run', 'scan_weight_per_min', 'simulate_max_wait_s')
+    saved = ({k: CONFIG.get(k) for k in keys}, trading.exchange, dict(_PUBLIC_EXCHANGES))
+    tmp = tempfile.mkdtemp(prefix='trading-bench-')
+
+    def reset_caches():
+        shutil.rmtree(tmp, ignore_errors=True)
+        rec.markets = None
+        for cache in (_INDICATOR_STATES, _HTF_BIAS_CACHE, _SYMBOL_INDEXES, ANALYSIS_CACHE, CANDLES):
+            cache.clear()
+
+    def scan_pass():
+        tracker = run_once(tracker=PositionTracker(rec, poll_interval_s=3600), wait_positions=False)
+        tracker.stop()
+
+    results = {}
+    try:
+        CONFIG.update({'ohlcv_cache_dir': tmp, 'dry_run': True, 'scan_weight_per_min': 10 ** 9, 'simulate_max_wait_s': 3600})
+        trading.exchange = rec
+        _PUBLIC_EXCHANGES[str(rec.id).lower()] = rec
+        with contextlib.redirect_stdout(io.StringIO()):
+            reset_caches()
+            frame = ohlcv_frame(np.asarray(rec.fetch_ohlcv(symbols[0], CONFIG["timeframe"], limit=CONFIG["limit"]), dtype=np.float64))
+            results['add_indicators'] = _bench_summary(_bench_times(lambda: add_indicators(frame.copy()), repeats * 20))
+            with_ind = add_indicators(frame.copy())
+            results['get_signal'] = _bench_summary(_bench_times(lambda: get_signal(with_ind), repeats * 200))
+
+            sample = symbols[:int(analyze_limit)] if analyze_limit else symbols
+            per_call = [_bench_times(lambda: analyze_symbol(sym, rec.id), 1)[0] for sym in sample]
+            results['analyze_symbol'] = dict(_bench_summary(per_call), symbols=len(sample))
+            per_call = [_bench_times(lambda: analyze_symbol(sym, rec.id), 1)[0] for sym in sample]
+            results['analyze_symbol_cached'] = dict(_bench_summary(per_call), symbols=len(sample))
+
+            reset_caches()
+            results['run_once_cold'] = dict(_bench_summary(_bench_times(scan_pass, 1), per=len(symbols)), symbols=len(symbols))
+            METRICS.reset()
+            results['run_once_warm'] = dict(_bench_summary(_bench_times(scan_pass, repeats), per=len(symbols)), symbols=len(symbols))
+        results['candle_store'] = _bench_candle_memory()
+        stages = METRICS.snapshot()['histograms']
+        results['run_once_warm']['stages_s'] = {k: round(v['sum'] / max(1, repeats), 6)
+                                                 for k, v in stages.items() if k.startswith('stage_seconds')}
+    finally:
+        CONFIG.update(saved[0])
+        trading.exchange = saved[1]
+        _PUBLIC_EXCHANGES.clear()
+        _PUBLIC_EXCHANGES.update(saved[2])
+        for cache in (_INDICATOR_STATES, _HTF_BIAS_CACHE, _SYMBOL_INDEXES, ANALYSIS_CACHE, CANDLES):
+            cache.clear()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+def _bench_environment():
+    import platform, subprocess
+    env = {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()}
+    for mod in ('numpy', 'pandas', 'ta', 'ccxt'):
+        try:
+            env[mod] = getattr(importlib.import_module(mod), '__version__', None)
+        except Exception:
+            env[mod] = None
+    try:
+        env['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        env['commit'] = None
+    return env
+
+def cli_bench():
+    import argparse, json
+    p = argparse.ArgumentParser()
+    p.add_argument('--bench', action='store_true', help='Run the benchmark suite')
+    p.add_argument('--bench-record', metavar='PATH', help='Record a fixture from the live public API and exit')
+    p.add_argument('--bench-fixture', metavar='PATH', help='Fixture to replay (default: synthetic)')
+    p.add_argument('--bench-symbols', type=int, default=500, help='Universe size for synthetic/recorded fixtures')
+    p.add_argument('--bench-repeats', type=int, default=5)
+    p.add_argument('--bench-analyze', type=int, default=None, help='Only time analyze_symbol on the first N symbols')
+    p.add_argument('--bench-out', default=os.environ.get("BENCH_RESULTS", "bench_results.jsonl"))
+    p.add_argument('--exchange', default=None, help='Venue to record from (default: EXCHANGE)')
+    args = p.parse_args()
+    if args.bench_record:
+        fixture = record_fixture(get_public_exchange(args.exchange), n_symbols=args.bench_symbols)
+        save_fixture(fixture, args.bench_record)
+        print(json.dumps({'fixture': args.bench_record, 'symbols': len(fixture['markets']), 'source': fixture['source']}))
+        return
+    fixture = load_fixture(args.bench_fixture) if args.bench_fixture else synthetic_fixture(args.bench_symbols)
+    record = {
+        'ts': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'fixture': args.bench_fixture or fixture.get('source'),
+        'config': {k: CONFIG.get(k) for k in ('timeframe', 'limit', 'scan_concurrency', 'incremental_indicators',
+                                              'vectorized_scan', 'ohlcv_cache', 'prefilter')},
+        'env': _bench_environment(),
+        'results': run_benchmarks(fixture, repeats=args.bench_repeats, analyze_limit=args.bench_analyze),
+    }
+    # compare with the last run on the same fixture and settings
+    previous = None
+    try:
+        with open(args.bench_out) as fh:
+            for line in fh:
+                try:
+                    old = json.loads(line)
+                except ValueError:
+                    continue
+                if old.get('fixture') == record['fixture'] and old.get('config') == record['config']:
+                    previous = old
+    except OSError:
+        pass
+    with open(args.bench_out, 'a') as fh:
+        fh.write(json.dumps(record) + "\n")
+    if previous:
+        ratios = {}
+        for name, res in record['results'].items():
+            prev = (previous.get('results') or {}).get(name) or {}
+            if prev.get('median_s'):
+                ratios[name] = round(res['median_s'] / prev['median_s'], 3)
+        record['vs_previous'] = ratios
+    print(json.dumps(record, indent=2))
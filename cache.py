@@ -0,0 +1,479 @@
+"""
+cache.py
+------------
+Caches under trading.py: candles on disk (OHLCV_CACHE_DIR) and in memory
+(CandleRing/CandleStore), markets and symbol lookups, and analyze results
+(AnalysisCache).
+"""
+
+import os
+import threading
+import time
+
+from config import CONFIG, ccxt, np, pd
+from metrics import METRICS
+
+
+# --------- تخزين الشموع محليًا ---------
+# Candles are kept on disk as float64 .npy arrays of shape (bars, 6) under
+# <OHLCV_CACHE_DIR>/<exchange>/<timeframe>/<symbol>.npy. Repeat fetches only
+# ask the exchange for bars since the last stored timestamp; the last stored
+# bar is always re-fetched because it may have been the still-open candle.
+OHLCV_COLUMNS = ["time","open","high","low","close","volume"]
+_OHLCV_LOCKS = {}
+_OHLCV_LOCKS_GUARD = threading.Lock()
+
+def _ohlcv_cache_path(exchange_obj, symbol, timeframe):
+    venue = str(getattr(exchange_obj, 'id', None) or CONFIG.get("exchange") or "unknown").lower()
+    safe = "".join(c if (c.isalnum() or c in "-.") else "_" for c in str(symbol))
+    return os.path.join(CONFIG["ohlcv_cache_dir"], venue, str(timeframe), safe + ".npy")
+
+def _ohlcv_lock(path):
+    with _OHLCV_LOCKS_GUARD:
+        lock = _OHLCV_LOCKS.get(path)
+        if lock is None:
+            lock = _OHLCV_LOCKS[path] = threading.Lock()
+        return lock
+
+def _timeframe_ms(exchange_obj, timeframe):
+    try:
+        return int(exchange_obj.parse_timeframe(timeframe)) * 1000
+    except Exception:
+        return int(ccxt.Exchange.parse_timeframe(timeframe)) * 1000
+
+def _load_ohlcv_file(path):
+    try:
+        arr = np.load(path, mmap_mode='r')
+        if arr.ndim == 2 and arr.shape[1] == 6:
+            return arr
+    except Exception:
+        pass
+    return None
+
+def _save_ohlcv_file(path, arr):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as fh:
+        np.save(fh, arr)
+    os.replace(tmp, path)
+
+def fetch_ohlcv_cached(exchange_obj, symbol, timeframe, limit):
+    """Return the last `limit` candles as a (bars, 6) float64 array.
+
+    With CANDLE_STORE on this is a read-only view of the series' CandleRing,
+    which also makes repeat calls incremental when OHLCV_CACHE is off. With
+    both disabled this is a plain fetch_ohlcv call.
+    """
+    use_disk = CONFIG.get("ohlcv_cache")
+    if not use_disk and not CONFIG.get("candle_store"):
+        return np.asarray(exchange_obj.fetch_ohlcv(symbol, timeframe, limit=limit), dtype=np.float64).reshape(-1, 6)
+    path = _ohlcv_cache_path(exchange_obj, symbol, timeframe)
+    ring = None
+    if CONFIG.get("candle_store"):
+        venue = str(getattr(exchange_obj, 'id', None) or CONFIG.get("exchange") or "unknown").lower()
+        ring = CANDLES.series(venue, symbol, timeframe, int(limit))
+    with _ohlcv_lock(path):
+        disk = _load_ohlcv_file(path) if use_disk else None
+        stored = ring.last() if ring is not None and len(ring) >= limit else disk
+        tf_ms = _timeframe_ms(exchange_obj, timeframe)
+        now_ms = int(time.time() * 1000)
+        since = None
+        if stored is not None and len(stored) >= limit:
+            last_ts = int(stored[-1, 0])
+            # only incremental when the gap fits in one request; else refetch
+            if now_ms - last_ts < (limit - 1) * tf_ms:
+                since = last_ts
+        if since is None:
+            fresh = np.asarray(exchange_obj.fetch_ohlcv(symbol, timeframe, limit=limit), dtype=np.float64).reshape(-1, 6)
+        else:
+            fresh = np.asarray(exchange_obj.fetch_ohlcv(symbol, timeframe, since=since, limit=limit), dtype=np.float64).reshape(-1, 6)
+        merged = fresh
+        if use_disk:
+            # the file keeps OHLCV_CACHE_KEEP bars, usually more than the ring
+            base = (disk if disk is not None else stored) if since is not None else None
+            if base is not None:
+                merged = np.concatenate([base[base[:, 0] < fresh[0, 0]], fresh]) if len(fresh) else np.array(base)
+            keep_n = max(int(limit), int(CONFIG.get("ohlcv_cache_keep") or 0))
+            merged = merged[-keep_n:]
+            if len(fresh):
+                try:
+                    _save_ohlcv_file(path, merged)
+                except Exception as e:
+                    print(f"⚠️ Failed to write OHLCV cache {path}: {e}")
+        if ring is None:
+            return merged[-int(limit):]
+        if since is None:
+            ring.clear()
+        elif stored is disk:
+            ring.clear()
+            ring.extend(disk[-ring.capacity:])
+        ring.extend(fresh)
+        return ring.last(limit)
+
+def ohlcv_frame(arr):
+    # own copy: ta and callers may write to the frame, arr may be a CandleRing view
+    df = pd.DataFrame(arr, columns=OHLCV_COLUMNS, copy=True)
+    df["time"] = df["time"].astype("int64")
+    return df
+
+# --------- حلقة الشموع في الذاكرة ---------
+# Recent candles of every (venue, symbol, timeframe) the process touches stay
+# in memory in a CandleRing: one preallocated float64 (capacity + slack, 6)
+# array per series, filled in place. last(n) is a read-only NumPy view of the
+# newest n bars, so IndicatorState, ohlcv_matrix and the HTF bias read the
+# store without copying it. When the slack is used up the window moves into a
+# fresh array; views taken earlier keep the old one, so they never change
+# under the reader. Replacing the still-open last bar is copy-on-write: once
+# last() has handed out a view, the window moves to a fresh array before the
+# row is overwritten.
+CANDLE_RING_SLACK = 64
+
+class CandleRing:
+    """Fixed-capacity OHLCV window for one series, newest bar last."""
+
+    __slots__ = ('capacity', 'slack', '_data', '_end', '_size', '_shared')
+
+    def __init__(self, capacity, slack=None):
+        self.capacity = max(1, int(capacity))
+        self.slack = max(1, int(CANDLE_RING_SLACK if slack is None else slack))
+        self._data = np.empty((self.capacity + self.slack, 6), dtype=np.float64)
+        self._end = 0
+        self._size = 0
+        self._shared = False    # a view of _data is out: don't write inside the window
+
+    def __len__(self):
+        return self._size
+
+    def last_time(self):
+        return int(self._data[self._end - 1, 0]) if self._size else None
+
+    def extend(self, bars):
+        """Append bars in time order; returns how many were new.
+
+        A bar with the last bar's timestamp replaces it and older bars are
+        ignored, so overlapping fetches can be passed as they come.
+        """
+        rows = np.asarray(bars, dtype=np.float64).reshape(-1, 6)
+        if self._size and len(rows):
+            last = self._data[self._end - 1, 0]
+            rows = rows[rows[:, 0] >= last]
+            if len(rows) and rows[0, 0] == last:
+                if not np.array_equal(self._data[self._end - 1], rows[0]):
+                    if self._shared:
+                        self._move(self._size)
+                    self._data[self._end - 1] = rows[0]
+                rows = rows[1:]
+        k = len(rows)
+        if not k:
+            return 0
+        if k >= self.capacity:
+            self._move(0)
+            self._data[:self.capacity] = rows[-self.capacity:]
+            self._end = self._size = self.capacity
+            return k
+        if self._end + k > len(self._data):
+            self._move(min(self._size, self.capacity - k))
+        self._data[self._end:self._end + k] = rows
+        self._end += k
+        self._size = min(self.capacity, self._size + k)
+        return k
+
+    def _move(self, keep):
+        """Continue in a fresh array with the newest `keep` bars; old views keep the old one."""
+        data = np.empty_like(self._data)
+        data[:keep] = self._data[self._end - keep:self._end]
+        self._data, self._end, self._size = data, keep, keep
+        self._shared = False
+
+    def append(self, bar):
+        return self.extend([bar])
+
+    def last(self, n=None):
+        """Read-only (n, 6) view of the newest n bars (all of them by default)."""
+        n = self._size if n is None else max(0, min(int(n), self._size))
+        view = self._data[self._end - n:self._end]
+        view.flags.writeable = False
+        self._shared = True
+        return view
+
+    def column(self, name, n=None):
+        return self.last(n)[:, OHLCV_COLUMNS.index(name)]
+
+    def clear(self):
+        self._move(0)
+
+    @property
+    def nbytes(self):
+        import sys
+        return sys.getsizeof(self) + sys.getsizeof(self._data)
+
+class CandleStore:
+    """One CandleRing per (venue, symbol, timeframe), sized to the largest window requested."""
+
+    def __init__(self, slack=None):
+        self.slack = slack
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def series(self, venue, symbol, timeframe, bars):
+        key = (venue, symbol, timeframe)
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None or ring.capacity < bars:
+                grown = CandleRing(bars, self.slack)
+                if ring is not None:
+                    grown.extend(ring.last())
+                ring = self._rings[key] = grown
+            return ring
+
+    def get(self, venue, symbol, timeframe):
+        return self._rings.get((venue, symbol, timeframe))
+
+    def clear(self):
+        with self._lock:
+            self._rings.clear()
+
+    def memory(self):
+        """Measured footprint: bytes held by the rings in total, per series and per symbol."""
+        with self._lock:
+            items = list(self._rings.items())
+        total = sum(ring.nbytes for _, ring in items)
+        symbols = len({key[:2] for key, _ in items})
+        return {
+            'series': len(items),
+            'symbols': symbols,
+            'bars': sum(len(ring) for _, ring in items),
+            'bytes': total,
+            'bytes_per_series': round(total / len(items)) if items else 0,
+            'bytes_per_symbol': round(total / symbols) if symbols else 0,
+        }
+
+CANDLES = CandleStore()
+
+# --------- تخزين بيانات الأسواق ---------
+# load_markets() downloads several MB per venue. Markets are written to
+# <OHLCV_CACHE_DIR>/<exchange>/markets.json and reused for MARKETS_CACHE_TTL_S
+# seconds, so a cold process skips the download entirely.
+PREFERRED_QUOTES = ['USDT', 'USDC', 'BTC', 'ETH']
+_SYMBOL_INDEXES = {}
+
+def _markets_cache_path(exchange_obj):
+    venue = str(getattr(exchange_obj, 'id', None) or CONFIG.get("exchange") or "unknown").lower()
+    return os.path.join(CONFIG["ohlcv_cache_dir"], venue, "markets.json")
+
+def load_markets_cached(exchange_obj):
+    """load_markets() with an on-disk copy that stays valid for the configured TTL."""
+    import json
+    markets = getattr(exchange_obj, 'markets', None)
+    if markets:
+        return markets
+    ttl = CONFIG.get("markets_cache_ttl_s") or 0
+    path = _markets_cache_path(exchange_obj)
+    if ttl > 0:
+        try:
+            if os.path.exists(path) and (time.time() - os.path.getmtime(path)) < ttl:
+                with open(path) as fh:
+                    cached = json.load(fh)
+                exchange_obj.set_markets(cached.get('markets') or {}, cached.get('currencies'))
+                return exchange_obj.markets
+        except Exception as e:
+            print(f"⚠️ Ignoring markets cache {path}: {e}")
+    markets = exchange_obj.load_markets()
+    if ttl > 0:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as fh:
+                json.dump({'markets': markets, 'currencies': getattr(exchange_obj, 'currencies', None)}, fh, default=str)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"⚠️ Failed to write markets cache {path}: {e}")
+    return markets
+
+def _is_spot_market(market):
+    market = market or {}
+    if market.get('spot') is not None:
+        return bool(market.get('spot'))
+    return market.get('type', 'spot') == 'spot'
+
+class SymbolIndex:
+    """Dict lookups for turning user input ('btc', 'BTC-USDT', 'btcusdt') into a market symbol."""
+
+    def __init__(self, markets):
+        self.exact = set()
+        self.lower = {}
+        self.alias = {}
+        self.base_quote = {}
+        self.base_any = {}
+        # spot markets first: first market wins, and 'btc' should not pick a swap
+        items = sorted((markets or {}).items(), key=lambda kv: not _is_spot_market(kv[1]))
+        for mk, m in items:
+            m = m or {}
+            self.exact.add(mk)
+            self.lower.setdefault(mk.lower(), mk)
+            mid = str(m.get('id') or '').lower()
+            if mid:
+                self.alias.setdefault(mid, mk)
+            self.alias.setdefault(mk.replace('/', '').lower(), mk)
+            base = str(m.get('base') or '').upper()
+            quote = str(m.get('quote') or '').upper()
+            if base:
+                self.base_quote.setdefault((base, quote), mk)
+                self.base_any.setdefault(base, mk)
+
+    def resolve(self, raw_symbol):
+        s = str(raw_symbol or '').strip()
+        if not s:
+            return None
+        for cand in (s, s.replace('-', '/'), s.replace('_', '/')):
+            if cand in self.exact:
+                return cand
+            hit = self.lower.get(cand.lower())
+            if hit:
+                return hit
+        hit = self.alias.get(s.replace('-', '').replace('_', '').lower())
+        if hit:
+            return hit
+        # fallback: preferred quote for the base token, then any market with that base
+        base_candidate = (s.replace('-', '/').replace('_', '/').split('/') or [s])[0].upper()
+        for q in PREFERRED_QUOTES:
+            hit = self.base_quote.get((base_candidate, q))
+            if hit:
+                return hit
+        return self.base_any.get(base_candidate)
+
+def symbol_index_for(exchange_obj):
+    """Return the SymbolIndex for an exchange's current markets, rebuilding it if they changed."""
+    markets = load_markets_cached(exchange_obj)
+    key = str(getattr(exchange_obj, 'id', '') or '').lower()
+    cached = _SYMBOL_INDEXES.get(key)
+    if cached is not None and cached[0] is markets:
+        return cached[1]
+    index = SymbolIndex(markets if isinstance(markets, dict) else {})
+    _SYMBOL_INDEXES[key] = (markets, index)
+    return index
+
+# --------- ذاكرة نتائج التحليل ---------
+# analyze_symbol results are cached per (venue, symbol, timeframe, open time
+# of the current candle) and expire when that candle closes. The in-memory
+# copy is an LRU capped at ANALYZE_CACHE_MAX_MB; ANALYZE_CACHE_DB adds a SQLite
+# file that separate processes (e.g. spawned --analyze calls) share.
+# Concurrent misses for one key wait for the first computation.
+class AnalysisCache:
+    """Candle-aligned LRU of analyze results with an optional SQLite backing."""
+
+    def __init__(self, max_bytes=None, db_path=None):
+        from collections import OrderedDict
+        self.max_bytes = int(CONFIG["analyze_cache_max_mb"] * 1024 * 1024 if max_bytes is None else max_bytes)
+        self.db_path = CONFIG.get("analyze_cache_db") if db_path is None else db_path
+        self.entries = OrderedDict()    # key -> (expires_ms, verbose, size, result)
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._db_puts = 0
+
+    def _conn(self):
+        if self._db is None and self.db_path:
+            import sqlite3
+            if os.path.dirname(self.db_path):
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS analysis (key TEXT PRIMARY KEY, expires_ms INTEGER NOT NULL, "
+                       "verbose INTEGER NOT NULL, data TEXT NOT NULL)")
+            self._db = db
+        return self._db
+
+    def _remember(self, key, expires_ms, verbose, result, size):
+        with self._lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self.entries[key] = (expires_ms, verbose, size, result)
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                _, dropped = self.entries.popitem(last=False)
+                self.bytes -= dropped[2]
+
+    def get(self, key, verbose=True, now_ms=None):
+        """Cached result for key, or None; a non-verbose entry does not satisfy a verbose request."""
+        import json
+        now_ms = now_ms or int(time.time() * 1000)
+        with self._lock:
+            hit = self.entries.get(key)
+            if hit is not None and hit[0] <= now_ms:
+                self.entries.pop(key)
+                self.bytes -= hit[2]
+                hit = None
+            if hit is not None and (hit[1] or not verbose):
+                self.entries.move_to_end(key)
+                return hit[3]
+        if not self.db_path:
+            return None
+        try:
+            with self._db_lock:
+                row = self._conn().execute("SELECT expires_ms, verbose, data FROM analysis WHERE key = ? AND expires_ms > ?",
+                                           ("|".join(map(str, key)), now_ms)).fetchone()
+        except Exception as e:
+            print(f"⚠️ Analysis cache read failed: {e}")
+            return None
+        if row is None or not (row[1] or not verbose):
+            return None
+        result = json.loads(row[2])
+        self._remember(key, row[0], bool(row[1]), result, len(row[2]))
+        return result
+
+    def put(self, key, result, expires_ms, verbose=True):
+        import json
+        data = json.dumps(result, default=str)
+        self._remember(key, expires_ms, verbose, result, len(data))
+        if not self.db_path:
+            return
+        try:
+            with self._db_lock:
+                db = self._conn()
+                db.execute("INSERT OR REPLACE INTO analysis (key, expires_ms, verbose, data) VALUES (?, ?, ?, ?)",
+                           ("|".join(map(str, key)), int(expires_ms), int(bool(verbose)), data))
+                self._db_puts += 1
+                if self._db_puts % 100 == 0:
+                    db.execute("DELETE FROM analysis WHERE expires_ms <= ?", (int(time.time() * 1000),))
+        except Exception as e:
+            print(f"⚠️ Analysis cache write failed: {e}")
+
+    def get_or_compute(self, key, expires_ms, verbose, compute):
+        result = self.get(key, verbose)
+        if result is not None:
+            METRICS.inc('analysis_cache_total', result='hit')
+            return result
+        flight = (key, bool(verbose))
+        with self._lock:
+            done = self._inflight.get(flight)
+            owner = done is None
+            if owner:
+                done = self._inflight[flight] = threading.Event()
+        if not owner:
+            done.wait(60)
+            result = self.get(key, verbose)
+            if result is not None:
+                METRICS.inc('analysis_cache_total', result='coalesced')
+                return result
+            return compute()
+        try:
+            METRICS.inc('analysis_cache_total', result='miss')
+            result = compute()
+            if isinstance(result, dict) and 'error' not in result:
+                self.put(key, result, expires_ms, verbose)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(flight, None)
+            done.set()
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes = 0
+
+ANALYSIS_CACHE = AnalysisCache()
@@ -112,18 +112,56 @@ function getUserTradeHistory(userId) {
   } catch (e) { return { ok: false, err: String(e) }; }
 }
 
-// Analyze a symbol by invoking trading.py --analyze and returning parsed JSON
+// Long-lived `trading.py --serve` child shared by all analyze calls. It keeps warm
+// exchange instances per venue so each analysis skips the python/ccxt cold start.
+/** @type {any} */
+let analyzeServer = null;
+
 /**
- * Analyze a symbol by invoking trading.py --analyze and returning parsed JSON.
- * Accepts an optional opts object: { platform: 'mexc' } which will set EXCHANGE for the child python process.
- * Backwards compatible: analyzeSymbol(userId, symbol) still works.
- *
- * @param {string} userId
+ * Start (or reuse) the persistent analyze server.
+ * @returns {any}
+ */
+function _getAnalyzeServer() {
+  if (analyzeServer && !analyzeServer.dead) return analyzeServer;
+  const { spawn } = require('child_process');
+  const script = path.join(process.cwd(), 'trading.py');
+  const py = spawn('python3', [script, '--serve'], { env: Object.assign({}, process.env) });
+  /** @type {any} */
+  const srv = { py, nextId: 1, pending: new Map(), buf: '', dead: false };
+  py.stdout.on('data', (d) => {
+    srv.buf += String(d || '');
+    let idx;
+    while ((idx = srv.buf.indexOf('\n')) >= 0) {
+      const line = srv.buf.slice(0, idx).trim();
+      srv.buf = srv.buf.slice(idx + 1);
+      if (!line) continue;
+      try {
+        const msg = JSON.parse(line);
+        const cb = srv.pending.get(msg.id);
+        if (cb) { srv.pending.delete(msg.id); cb(msg); }
+      } catch (e) {}
+    }
+  });
+  py.stderr.on('data', () => {});
+  const onExit = () => {
+    srv.dead = true;
+    for (const cb of srv.pending.values()) cb({ ok: false, err: 'server_exited' });
+    srv.pending.clear();
+    if (analyzeServer === srv) analyzeServer = null;
+  };
+  py.on('close', onExit);
+  py.on('error', onExit);
+  analyzeServer = srv;
+  return srv;
+}
+
+/**
+ * Analyze a symbol with a one-off `trading.py --analyze` child process.
  * @param {string} symbol
- * @param {{platform?:string}} [opts]
+ * @param {string} platform
  * @returns {Promise<any>}
  */
-function analyzeSymbol(userId, symbol, opts) {
+function _analyzeSymbolSpawn(symbol, platform) {
   return new Promise((resolve) => {
     try {
       const { spawn } = require('child_process');
@@ -131,10 +169,7 @@ function analyzeSymbol(userId, symbol, opts) {
       const args = [script, '--analyze', String(symbol)];
       // Prepare env for child: allow overriding EXCHANGE per-call (platform), fallback to existing env
       const childEnv = Object.assign({}, process.env);
-      try {
-        const platform = opts && opts.platform ? String(opts.platform).trim() : (process.env.EXCHANGE || '');
-        if (platform) childEnv.EXCHANGE = platform;
-      } catch (e) {}
+      if (platform) childEnv.EXCHANGE = platform;
       const py = spawn('python3', args, { env: childEnv });
       let out = '';
       let err = '';
@@ -150,6 +185,50 @@ function analyzeSymbol(userId, symbol, opts) {
   });
 }
 
+// Analyze a symbol via the persistent trading.py server and return parsed JSON
+/**
+ * Analyze a symbol via the persistent `trading.py --serve` process and return parsed JSON.
+ * Accepts an optional opts object: { platform: 'mexc' } which selects the exchange for this request.
+ * Set CEX_ANALYZE_SERVER=false to fall back to one `trading.py --analyze` process per call.
+ * A request the server has not answered within CEX_ANALYZE_TIMEOUT_MS (default 30000) falls back too.
+ * Backwards compatible: analyzeSymbol(userId, symbol) still works.
+ *
+ * @param {string} userId
+ * @param {string} symbol
+ * @param {{platform?:string}} [opts]
+ * @returns {Promise<any>}
+ */
+function analyzeSymbol(userId, symbol, opts) {
+  let platform = '';
+  try {
+    platform = opts && opts.platform ? String(opts.platform).trim() : (process.env.EXCHANGE || '');
+  } catch (e) {}
+  if (String(process.env.CEX_ANALYZE_SERVER || '').toLowerCase() === 'false') {
+    return _analyzeSymbolSpawn(symbol, platform);
+  }
+  return new Promise((resolve) => {
+    try {
+      const srv = _getAnalyzeServer();
+      const id = srv.nextId++;
+      // a hung server must not hang the caller: give up on it after the timeout
+      const timeoutMs = Number(process.env.CEX_ANALYZE_TIMEOUT_MS || 30000);
+      const timer = setTimeout(() => {
+        if (!srv.pending.delete(id)) return;
+        resolve(_analyzeSymbolSpawn(symbol, platform));
+      }, timeoutMs);
+      srv.pending.set(id, (/** @type {any} */ msg) => {
+        clearTimeout(timer);
+        if (msg && msg.data) return resolve({ ok: true, data: msg.data });
+        // server unavailable or protocol error: retry once with a one-off process
+        return resolve(_analyzeSymbolSpawn(symbol, platform));
+      });
+      const req = { id, symbol: String(symbol) };
+      if (platform) /** @type {any} */ (req).exchange = platform;
+      srv.py.stdin.write(JSON.stringify(req) + '\n');
+    } catch (e) { return resolve(_analyzeSymbolSpawn(symbol, platform)); }
+  });
+}
+
 // Simple confirm flow for enabling live trading per-user
 const pendingLiveConfirm = new Set();
 /**
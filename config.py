@@ -0,0 +1,123 @@
+"""
+config.py
+------------
+Settings shared by trading.py and its modules: CONFIG (environment
+variables with safe defaults), STRATEGY_PARAMS, and lazy proxies for the
+heavy libraries (ccxt, numpy, pandas, ta).
+"""
+
+import importlib
+import os
+import threading
+
+
+class _Lazy:
+    """Build an object on first attribute access.
+
+    ccxt (hundreds of exchange modules), pandas and ta take most of the
+    startup time, and the private exchange is only needed by run_once. Keeping
+    them behind this proxy means `import trading`, --serve start-up and
+    --health touch neither the heavy libraries nor the network.
+    """
+
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_obj', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _resolve(self):
+        obj = object.__getattribute__(self, '_obj')
+        if obj is None:
+            with object.__getattribute__(self, '_lock'):
+                obj = object.__getattribute__(self, '_obj')
+                if obj is None:
+                    obj = object.__getattribute__(self, '_factory')()
+                    object.__setattr__(self, '_obj', obj)
+        return obj
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __dir__(self):
+        return dir(self._resolve())
+
+    def __repr__(self):
+        obj = object.__getattribute__(self, '_obj')
+        return repr(obj) if obj is not None else '<lazy (not loaded)>'
+
+
+ccxt = _Lazy(lambda: importlib.import_module('ccxt'))
+np = _Lazy(lambda: importlib.import_module('numpy'))
+pd = _Lazy(lambda: importlib.import_module('pandas'))
+ta = _Lazy(lambda: importlib.import_module('ta'))
+
+# ---------------- إعداد المستخدم ----------------
+CONFIG = {
+    "exchange": os.environ.get("EXCHANGE", "binance"),        # binance أو mexc
+    "apiKey": os.environ.get("API_KEY", "YOUR_API_KEY"),
+    "secret": os.environ.get("API_SECRET", "YOUR_API_SECRET"),
+    "symbol_filter": os.environ.get("SYMBOL_FILTER", "USDT"),      # نراقب فقط الأزواج المنتهية بـ USDT
+    "timeframe": os.environ.get("TIMEFRAME", "15m"),           # الإطار الزمني
+    "limit": int(os.environ.get("LIMIT", 200)),
+    "trade_size_usdt": float(os.environ.get("TRADE_SIZE_USDT", 50)),        # حجم الصفقة بالدولار
+    "tp_pct": float(os.environ.get("TP_PCT", 0.05)),               # الهدف: 5%
+    "sl_pct": float(os.environ.get("SL_PCT", 0.03)),               # وقف الخسارة: 3%
+    "dry_run": os.environ.get("DRY_RUN", "true").lower() in ("1", "true", "yes"),              # أولاً نجرب المحاكاة
+    "poll_interval_s": int(os.environ.get("POLL_INTERVAL_S", 10)),
+    "simulate_max_wait_s": int(os.environ.get("SIMULATE_MAX_WAIT_S", 60*30)),  # 30 دقيقة افتراضيًا
+    "scan_concurrency": int(os.environ.get("SCAN_CONCURRENCY", 8)),             # عدد الرموز التي تُفحص بالتوازي
+    "scan_weight_per_min": int(os.environ.get("SCAN_WEIGHT_PER_MIN", 0)),       # 0 = حسب حدود المنصة
+    "ohlcv_cache": os.environ.get("OHLCV_CACHE", "true").lower() in ("1", "true", "yes"),  # تخزين الشموع محليًا
+    "ohlcv_cache_dir": os.environ.get("OHLCV_CACHE_DIR", "ohlcv_cache"),
+    "ohlcv_cache_keep": int(os.environ.get("OHLCV_CACHE_KEEP", 1000)),          # أقصى عدد شموع محفوظة لكل رمز
+    "candle_store": os.environ.get("CANDLE_STORE", "true").lower() in ("1", "true", "yes"),  # آخر الشموع في الذاكرة لكل رمز/إطار
+    "incremental_indicators": os.environ.get("INCREMENTAL_INDICATORS", "true").lower() in ("1", "true", "yes"),  # مؤشرات تراكمية بنفس نتائج ta
+    "markets_cache_ttl_s": int(os.environ.get("MARKETS_CACHE_TTL_S", 6*3600)),  # 0 = بدون تخزين الأسواق
+    "scan_spread_fraction": float(os.environ.get("SCAN_SPREAD_FRACTION", 0.5)),  # جزء الشمعة الذي تتوزع عليه الطلبات
+    "scan_settle_s": float(os.environ.get("SCAN_SETTLE_S", 2)),                # انتظار بعد إغلاق الشمعة
+    "prefilter": os.environ.get("PREFILTER", "true").lower() in ("1", "true", "yes"),   # فلترة أولية قبل حساب المؤشرات
+    "prefilter_min_quote_volume": float(os.environ.get("PREFILTER_MIN_QUOTE_VOLUME", os.environ.get("CEX_MIN_VOLUME_USDT", 10000))),
+    "prefilter_max_spread_pct": float(os.environ.get("PREFILTER_MAX_SPREAD_PCT", 0.01)),
+    "prefilter_min_price": float(os.environ.get("PREFILTER_MIN_PRICE", 0)),
+    "prefilter_max_price": float(os.environ.get("PREFILTER_MAX_PRICE", 0)),    # 0 = بدون حد أعلى
+    "vectorized_scan": os.environ.get("VECTORIZED_SCAN", "false").lower() in ("1", "true", "yes"),  # مؤشرات كل الرموز دفعة واحدة
+    "metrics": os.environ.get("METRICS", "true").lower() in ("1", "true", "yes"),    # عدادات وأزمنة المراحل
+    "metrics_port": int(os.environ.get("METRICS_PORT", 0)),                    # 0 = بدون خادم /metrics
+    "metrics_dump": os.environ.get("METRICS_DUMP", ""),                        # ملف JSON دوري للمقاييس
+    "metrics_dump_interval_s": float(os.environ.get("METRICS_DUMP_INTERVAL_S", 60)),
+    "order_price_max_age_s": float(os.environ.get("ORDER_PRICE_MAX_AGE_S", 5)),  # أقدم سعر مقبول للأمر
+    "price_feed_batch": int(os.environ.get("PRICE_FEED_BATCH", 0)),           # رموز لكل طلب fetch_tickers، 0 = طلب واحد
+    "exchanges": os.environ.get("EXCHANGES", ""),                              # عدة منصات: binance,mexc,bybit
+    "analyze_cache": os.environ.get("ANALYZE_CACHE", "true").lower() in ("1", "true", "yes"),  # نتائج التحليل حتى إغلاق الشمعة
+    "analyze_cache_max_mb": float(os.environ.get("ANALYZE_CACHE_MAX_MB", 64)),
+    "analyze_cache_db": os.environ.get("ANALYZE_CACHE_DB", ""),                # ملف SQLite مشترك بين العمليات
+    "serve_concurrency": int(os.environ.get("SERVE_CONCURRENCY", 8)),          # طلبات --serve المتزامنة
+    "coalesce_requests": os.environ.get("COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes"),  # دمج الطلبات المتطابقة المتزامنة
+    "rate_scheduler": os.environ.get("RATE_SCHEDULER", "true").lower() in ("1", "true", "yes"),  # أولوية الأوامر على الفحص
+}
+
+# Strategy constants used by get_signal and analyze_symbol. Defaults are the
+# original hand-picked values; `python trading.py --optimize ...` searches
+# them and STRATEGY_PARAMS='{"stoch_low": 0.15, ...}' applies the result.
+STRATEGY_PARAMS = {
+    "stoch_low": 0.2,           # StochRSI oversold -> bullish
+    "stoch_high": 0.8,          # StochRSI overbought -> bearish
+    "atr_sl_mult": 1.5,         # SL distance in ATRs
+    "atr_tp_mult": 3.0,         # furthest TP distance in ATRs
+    "w_ema": 2,
+    "w_macd": 2,
+    "w_rsi": 1,
+    "w_vol": 1,
+    "vote_threshold": 3,        # weighted votes needed for a strong setup
+    "macd_strength_min": 0.00005,
+}
+try:
+    import json as _json
+    STRATEGY_PARAMS.update(_json.loads(os.environ.get("STRATEGY_PARAMS") or "{}"))
+except Exception as _e:
+    import sys as _sys
+    print(f"⚠️ Ignoring invalid STRATEGY_PARAMS: {_e}", file=_sys.stderr)
+# -------------------------------------------------
@@ -0,0 +1,263 @@
+"""
+metrics.py
+------------
+Counters, latency histograms and their exporters (Prometheus text on
+METRICS_PORT, a JSON file on METRICS_DUMP) for trading.py and its modules.
+"""
+
+import os
+import threading
+import time
+
+from config import CONFIG
+
+
+# --------- قياس الأداء ---------
+# In-process counters and latency histograms. Stages of run_once and
+# analyze_symbol are timed with METRICS.span(), instrument_exchange() counts
+# calls per ccxt method and raw HTTP requests, and RateBudget adds the time it
+# spends waiting. METRICS_PORT serves /metrics (Prometheus text format) and
+# /metrics.json on localhost; METRICS_DUMP writes the JSON snapshot to a file
+# every METRICS_DUMP_INTERVAL_S seconds and on exit.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class _Span:
+    __slots__ = ('metrics', 'stage', 'labels', 't0')
+
+    def __init__(self, metrics, stage, labels):
+        self.metrics, self.stage, self.labels = metrics, stage, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe('stage_seconds', time.perf_counter() - self.t0, stage=self.stage, **self.labels)
+        return False
+
+class Metrics:
+    """Thread-safe counters and fixed-bucket histograms keyed by (name, labels)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, enabled=True, prefix='trading_'):
+        self.buckets = tuple(buckets)
+        self.enabled = enabled
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}    # key -> [per-bucket counts..., +Inf count, sum]
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+    def inc(self, name, value=1.0, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        with self.lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            h[i] += 1
+            h[-1] += seconds
+
+    def span(self, stage, **labels):
+        """Context manager that records its duration in stage_seconds{stage=...}."""
+        return _Span(self, stage, labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    @staticmethod
+    def _series(name, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return name
+        return name + '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs) + '}'
+
+    def snapshot(self):
+        """JSON-friendly copy: counters by series name, histograms with count/sum/cumulative buckets."""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {k: list(v) for k, v in self.histograms.items()}
+        out = {'ts': int(time.time() * 1000), 'counters': {}, 'histograms': {}}
+        for (name, labels), v in sorted(counters.items()):
+            out['counters'][self._series(name, labels)] = v
+        for (name, labels), h in sorted(histograms.items()):
+            cum, buckets = 0, {}
+            for le, n in zip(self.buckets, h):
+                cum += n
+                buckets[str(le)] = cum
+            count = cum + h[len(self.buckets)]
+            out['histograms'][self._series(name, labels)] = {
+                'count': count, 'sum': h[-1], 'avg': (h[-1] / count) if count else None, 'buckets': buckets,
+            }
+        return out
+
+    def prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {k: list(v) for k, v in self.histograms.items()}
+        lines, typed = [], set()
+        for (name, labels), v in sorted(counters.items()):
+            full = self.prefix + name
+            if full not in typed:
+                typed.add(full)
+                lines.append(f'# TYPE {full} counter')
+            lines.append(f'{self._series(full, labels)} {v!r}')
+        for (name, labels), h in sorted(histograms.items()):
+            full = self.prefix + name
+            if full not in typed:
+                typed.add(full)
+                lines.append(f'# TYPE {full} histogram')
+            cum = 0
+            for le, n in zip(self.buckets, h):
+                cum += n
+                lines.append(f'{self._series(full + "_bucket", labels, [("le", le)])} {cum}')
+            cum += h[len(self.buckets)]
+            lines.append(f'{self._series(full + "_bucket", labels, [("le", "+Inf")])} {cum}')
+            lines.append(f'{self._series(full + "_sum", labels)} {h[-1]!r}')
+            lines.append(f'{self._series(full + "_count", labels)} {cum}')
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics(enabled=CONFIG["metrics"])
+
+# unified ccxt methods counted by instrument_exchange()
+INSTRUMENTED_METHODS = (
+    'load_markets', 'fetch_ohlcv', 'fetch_ticker', 'fetch_tickers', 'fetch_order_book',
+    'fetch_balance', 'fetch_order', 'create_order', 'create_market_buy_order',
+    'create_market_sell_order', 'cancel_order',
+)
+
+def instrument_exchange(exchange_obj):
+    """Count and time ccxt calls on an exchange instance (patched in place).
+
+    ccxt_calls_total/ccxt_call_seconds are per unified method,
+    ccxt_http_requests_total counts the HTTP requests underneath them and
+    ccxt_throttle_wait_seconds_total is time spent in ccxt's own rate limiter.
+    """
+    if not METRICS.enabled or getattr(exchange_obj, '_metrics_instrumented', False):
+        return exchange_obj
+    venue = str(getattr(exchange_obj, 'id', '') or '').lower() or None
+
+    def timed(method, fn):
+        def call(*args, **kwargs):
+            t0 = time.perf_counter()
+            status = 'ok'
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                status = type(e).__name__
+                raise
+            finally:
+                METRICS.inc('ccxt_calls_total', venue=venue, method=method, status=status)
+                METRICS.observe('ccxt_call_seconds', time.perf_counter() - t0, venue=venue, method=method)
+        return call
+
+    def counted_fetch(fn):
+        def call(url, method='GET', *args, **kwargs):
+            METRICS.inc('ccxt_http_requests_total', venue=venue, http_method=method)
+            return fn(url, method, *args, **kwargs)
+        return call
+
+    def timed_throttle(fn):
+        def call(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                METRICS.inc('ccxt_throttle_wait_seconds_total', time.perf_counter() - t0, venue=venue)
+        return call
+
+    try:
+        for method in INSTRUMENTED_METHODS:
+            fn = getattr(exchange_obj, method, None)
+            if callable(fn):
+                setattr(exchange_obj, method, timed(method, fn))
+        if callable(getattr(exchange_obj, 'fetch', None)):
+            exchange_obj.fetch = counted_fetch(exchange_obj.fetch)
+        if callable(getattr(exchange_obj, 'throttle', None)):
+            exchange_obj.throttle = timed_throttle(exchange_obj.throttle)
+        exchange_obj._metrics_instrumented = True
+    except Exception as e:
+        print(f"⚠️ Metrics instrumentation skipped: {e}")
+    return exchange_obj
+
+def dump_metrics(path=None):
+    """Write METRICS.snapshot() as JSON to path (atomic replace)."""
+    import json
+    path = path or CONFIG.get("metrics_dump")
+    if not path:
+        return
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as fh:
+        json.dump(METRICS.snapshot(), fh)
+    os.replace(tmp, path)
+
+def serve_metrics(port, host='127.0.0.1'):
+    """Serve /metrics and /metrics.json on a daemon thread; returns the server."""
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/metrics.json'):
+                body, ctype = json.dumps(METRICS.snapshot()).encode(), 'application/json'
+            elif self.path.startswith('/metrics'):
+                body, ctype = METRICS.prometheus().encode(), 'text/plain; version=0.0.4'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, int(port)), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+_METRICS_EXPORTERS_STARTED = False
+
+def start_metrics_exporters():
+    """Start the METRICS_PORT endpoint and METRICS_DUMP writer if configured (once)."""
+    global _METRICS_EXPORTERS_STARTED
+    if _METRICS_EXPORTERS_STARTED or not METRICS.enabled:
+        return
+    _METRICS_EXPORTERS_STARTED = True
+    if CONFIG.get("metrics_port"):
+        try:
+            serve_metrics(CONFIG["metrics_port"])
+        except Exception as e:
+            print(f"⚠️ Metrics endpoint failed to start: {e}")
+    if CONFIG.get("metrics_dump"):
+        import atexit
+        interval = max(1.0, float(CONFIG.get("metrics_dump_interval_s") or 60))
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    dump_metrics()
+                except Exception as e:
+                    print(f"⚠️ Metrics dump failed: {e}")
+        threading.Thread(target=loop, name='metrics-dump', daemon=True).start()
+        atexit.register(dump_metrics)
@@ -0,0 +1,144 @@
+"""
+serve.py
+------------
+Long-lived analyze server (`python trading.py --serve`) on stdin/stdout or
+a Unix socket.
+"""
+
+import os
+import threading
+import time
+
+from config import CONFIG
+from metrics import METRICS
+from trading import analyze_symbol, compact_schema, to_compact
+
+
+# --------- وضع الخادم (تحليل مستمر) ---------
+# Long-lived analyze server: one request per line as JSON, one JSON line back.
+#   request:  {"id": 1, "symbol": "BTC/USDT", "exchange": "mexc"}
+#   response: {"id": 1, "ok": true, "data": {...analyze_symbol result...}}
+# "exchange" is optional and defaults to CONFIG["exchange"]; {"op": "ping"}
+# answers {"ok": true, "pong": true} for health checks. With "format": "compact"
+# "data" is the to_compact() array instead ({"op": "schema"} lists its fields);
+# {"op": "metrics"} returns METRICS.snapshot(). Up to SERVE_CONCURRENCY requests
+# run at once, so responses can arrive out of order: match them by "id".
+# On stdin/stdout, stdout carries nothing but responses: sys.stdout points at
+# stderr while serving, so warnings and verbose analyze output can't break
+# the stream.
+def _handle_request_line(line):
+    import json
+    req_id = None
+    try:
+        req = json.loads(line)
+        if not isinstance(req, dict):
+            raise ValueError("request must be a JSON object")
+        req_id = req.get('id')
+        if req.get('op') == 'ping':
+            return json.dumps({'id': req_id, 'ok': True, 'pong': True})
+        if req.get('op') == 'schema':
+            return json.dumps({'id': req_id, 'ok': True, 'data': compact_schema()})
+        if req.get('op') == 'metrics':
+            return json.dumps({'id': req_id, 'ok': True, 'data': METRICS.snapshot()})
+        symbol = req.get('symbol')
+        if not symbol:
+            raise ValueError("missing symbol")
+        compact = req.get('format') == 'compact'
+        t0 = time.perf_counter()
+        out = analyze_symbol(symbol, exchange_name=req.get('exchange'), verbose=not compact or bool(req.get('text')))
+        METRICS.inc('serve_requests_total', ok='false' if 'error' in out else 'true')
+        with METRICS.span('serialize', op='serve'):
+            if compact and 'error' not in out:
+                line = json.dumps({'id': req_id, 'ok': True, 'data': to_compact(out)})
+            else:
+                line = json.dumps({'id': req_id, 'ok': 'error' not in out, 'data': out})
+        METRICS.observe('serve_request_seconds', time.perf_counter() - t0)
+        return line
+    except Exception as e:
+        return json.dumps({'id': req_id, 'ok': False, 'err': str(e)})
+
+def _serve_lines(lines, write):
+    """Handle request lines on a bounded pool; write(response) is called under a lock.
+
+    Responses go out in completion order, tagged with the request id, so one
+    slow symbol does not hold up the requests queued behind it.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    lock = threading.Lock()
+    workers = max(1, int(CONFIG.get("serve_concurrency") or 1))
+
+    def answer(line):
+        out = _handle_request_line(line)
+        with lock:
+            write(out + "\n")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for line in lines:
+            line = line.strip()
+            if line:
+                pool.submit(answer, line)
+
+def serve_stdin(out=None):
+    """Answer newline-delimited JSON analyze requests from stdin until EOF.
+
+    Responses are written to `out` (default: the current sys.stdout); every
+    other print goes to stderr until the server returns.
+    """
+    import sys
+    out = out if out is not None else sys.stdout
+    saved, sys.stdout = sys.stdout, sys.stderr
+
+    def write(text):
+        out.write(text)
+        out.flush()
+    try:
+        _serve_lines(sys.stdin, write)
+    finally:
+        sys.stdout = saved
+
+def serve_unix_socket(path):
+    """Answer newline-delimited JSON analyze requests on a Unix socket.
+
+    Each connection is handled on its own thread; all of them share the pooled
+    public exchanges so markets are only loaded once per venue.
+    """
+    import socketserver, sys
+
+    class _Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            def write(text):
+                try:
+                    self.wfile.write(text.encode('utf-8'))
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            _serve_lines((raw.decode('utf-8', errors='replace') for raw in self.rfile), write)
+
+    class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    try:
+        if os.path.exists(path):
+            os.unlink(path)
+    except Exception:
+        pass
+    with _Server(path, _Handler) as server:
+        print(f"[serve] listening on {path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            try:
+                os.unlink(path)
+            except Exception:
+                pass
+
+def cli_serve(out=None):
+    import argparse
+    p = argparse.ArgumentParser()
+    p.add_argument('--serve', action='store_true', help='Run as a long-lived analyze server')
+    p.add_argument('--socket', help='Unix socket path (default: read requests from stdin)')
+    args = p.parse_args()
+    if args.socket:
+        serve_unix_socket(args.socket)
+    else:
+        serve_stdin(out)
@@ -0,0 +1,263 @@
+"""
+stream.py
+------------
+WebSocket scanning on ccxt.pro (`python trading.py --stream`), plus an
+offline replay of stored history through the same code path.
+"""
+
+from config import CONFIG, np
+from cache import CandleRing, load_markets_cached, symbol_index_for
+import trading
+from trading import (
+    IndicatorState, PositionTracker, _parse_symbol_list, _place_order_on_tp, _ticker_price,
+    get_public_exchange, order_executor, prefilter_symbols, signal_from_values,
+)
+from backtest import _parse_date_ms, fetch_ohlcv_history
+
+
+# --------- البث المباشر (WebSocket) ---------
+# Streaming data layer on ccxt.pro: watch_ohlcv per symbol keeps an in-memory
+# candle buffer and a closed-bar IndicatorState, and fires on_close the moment
+# the first update of a new candle arrives (i.e. right after the previous one
+# closed) instead of on the next REST poll. watch_tickers feeds live prices to
+# on_ticker, e.g. PositionTracker.on_tick.
+def init_stream_exchange(name=None):
+    """Construct the ccxt.pro (async, WebSocket) class for a venue."""
+    import ccxt.pro as ccxtpro
+    name = str(name or CONFIG.get("exchange") or "").strip().lower()
+    alias_map = {'mxc': 'mexc'}
+    cls_name = alias_map.get(name, name)
+    for attr in dir(ccxtpro):
+        if attr.lower() == cls_name.lower():
+            return getattr(ccxtpro, attr)({"enableRateLimit": True})
+    raise ValueError(f"❌ ccxt.pro does not support exchange '{name}'")
+
+class ReplayStreamExchange:
+    """Offline stand-in for a ccxt.pro exchange that replays stored candles.
+
+    fetch_ohlcv returns the first `seed` bars of each history; every
+    watch_ohlcv call then emits the next bar after `interval_s` seconds, and
+    raises EOFError once the history is exhausted. tickers=False drops
+    watchTickers, like a venue without a ticker stream. Useful for dry runs
+    and for exercising CandleStream without a network connection.
+    """
+
+    id = 'replay'
+
+    def __init__(self, histories, seed=200, interval_s=0.0, tickers=True):
+        self.histories = {sym: np.asarray(arr, dtype=np.float64) for sym, arr in histories.items()}
+        self.seed = int(seed)
+        self.interval_s = interval_s
+        self.cursor = {sym: self.seed for sym in self.histories}
+        self.has = {'watchOHLCV': True, 'watchTickers': bool(tickers)}
+
+    async def fetch_ohlcv(self, symbol, timeframe='15m', since=None, limit=None, params=None):
+        arr = self.histories[symbol][:self.seed]
+        return arr[-int(limit):].tolist() if limit else arr.tolist()
+
+    async def watch_ohlcv(self, symbol, timeframe='15m', since=None, limit=None, params=None):
+        import asyncio
+        await asyncio.sleep(self.interval_s)
+        i = self.cursor[symbol]
+        if i >= len(self.histories[symbol]):
+            raise EOFError(symbol)
+        self.cursor[symbol] = i + 1
+        return [self.histories[symbol][i].tolist()]
+
+    async def watch_tickers(self, symbols=None, params=None):
+        import asyncio
+        await asyncio.sleep(self.interval_s or 0.01)
+        out = {}
+        for sym in (symbols or list(self.histories)):
+            i = min(self.cursor[sym], len(self.histories[sym])) - 1
+            if i >= 0:
+                close = float(self.histories[sym][i][4])
+                out[sym] = {'symbol': sym, 'last': close, 'close': close}
+        if all(self.cursor[sym] >= len(self.histories[sym]) for sym in self.histories):
+            raise EOFError("tickers")
+        return out
+
+    async def close(self):
+        return None
+
+class CandleStream:
+    """Live candle buffers, closed-bar indicators and signals for many symbols.
+
+    on_close(symbol, bar, values, signal) is called once per closed candle;
+    on_ticker({symbol: price}) on every ticker update, and
+    on_ticker_state(live) whenever the ticker stream comes up or goes down.
+    """
+
+    def __init__(self, exchange_obj, symbols, timeframe=None, limit=None, on_close=None, on_ticker=None,
+                 on_ticker_state=None):
+        self.exchange = exchange_obj
+        self.symbols = list(symbols)
+        self.timeframe = timeframe or CONFIG["timeframe"]
+        self.limit = int(limit or CONFIG["limit"])
+        self.on_close = on_close
+        self.on_ticker = on_ticker
+        self.on_ticker_state = on_ticker_state
+        self.tickers_live = False
+        self.buffers = {sym: CandleRing(self.limit) for sym in self.symbols}
+        self.states = {sym: IndicatorState(self.limit) for sym in self.symbols}
+        self.prices = {}
+        self.running = False
+
+    async def _seed(self, symbol):
+        bars = await self.exchange.fetch_ohlcv(symbol, self.timeframe, limit=self.limit)
+        buf = self.buffers[symbol]
+        buf.extend(bars)
+        # the last REST bar is usually still open: keep it out of the indicator state
+        for bar in buf.last()[:-1]:
+            self.states[symbol].update(bar)
+
+    def _apply(self, symbol, bar):
+        buf = self.buffers[symbol]
+        last_ts = buf.last_time()
+        if last_ts is not None and int(bar[0]) <= last_ts:
+            # update of the open candle (or a stale one): replaced or ignored
+            buf.append(bar)
+            return
+        closed = buf.last(1)[0].tolist() if last_ts is not None else None
+        buf.append(bar)
+        if closed is None:
+            return
+        values = self.states[symbol].update(closed)
+        signal = "HOLD"
+        if self.states[symbol].bars >= 50:
+            signal = signal_from_values(values['EMA50'], values['EMA200'], values['MACD'],
+                                        values['MACD_signal'], values['StochRSI'])
+        if self.on_close:
+            try:
+                self.on_close(symbol, closed, values, signal)
+            except Exception as e:
+                print(f"⚠️ on_close failed for {symbol}: {e}")
+
+    async def _watch_symbol(self, symbol):
+        import asyncio
+        try:
+            await self._seed(symbol)
+        except Exception as e:
+            print(f"⚠️ خطأ في {symbol}: {e}")
+            return
+        while self.running:
+            try:
+                for bar in await self.exchange.watch_ohlcv(symbol, self.timeframe):
+                    self._apply(symbol, bar)
+            except EOFError:
+                return
+            except Exception as e:
+                print(f"⚠️ stream error for {symbol}: {e}")
+                await asyncio.sleep(1)
+
+    def _set_tickers_live(self, live):
+        if live == self.tickers_live:
+            return
+        self.tickers_live = live
+        if self.on_ticker_state:
+            try:
+                self.on_ticker_state(live)
+            except Exception as e:
+                print(f"⚠️ on_ticker_state failed: {e}")
+
+    async def _watch_tickers(self):
+        import asyncio
+        try:
+            while self.running:
+                try:
+                    tickers = await self.exchange.watch_tickers(self.symbols)
+                except EOFError:
+                    return
+                except Exception as e:
+                    print(f"⚠️ ticker stream error: {e}")
+                    self._set_tickers_live(False)
+                    await asyncio.sleep(1)
+                    continue
+                self._set_tickers_live(True)
+                self._publish_tickers(tickers)
+        finally:
+            self._set_tickers_live(False)
+
+    def _publish_tickers(self, tickers):
+        for sym, t in (tickers or {}).items():
+            price = _ticker_price(t)
+            if price is not None:
+                self.prices[sym] = price
+        if self.on_ticker:
+            try:
+                self.on_ticker(dict(self.prices))
+            except Exception as e:
+                print(f"⚠️ on_ticker failed: {e}")
+
+    async def run(self):
+        import asyncio
+        self.running = True
+        tasks = [self._watch_symbol(sym) for sym in self.symbols]
+        if (getattr(self.exchange, 'has', {}) or {}).get('watchTickers'):
+            tasks.append(self._watch_tickers())
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self.running = False
+            try:
+                await self.exchange.close()
+            except Exception:
+                pass
+
+    def stop(self):
+        self.running = False
+
+def run_stream(symbols=None, exchange_obj=None):
+    """Trade on closed-candle signals from the WebSocket stream until interrupted."""
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    # TP hits come in on the event loop (ticker stream); the order is a REST
+    # call, so it runs on its own thread instead of stalling every socket
+    orders = ThreadPoolExecutor(max_workers=4, thread_name_prefix='orders')
+    tracker = PositionTracker(trading.exchange, on_close=lambda pos: orders.submit(_place_order_on_tp, pos))
+    if symbols is None:
+        markets = load_markets_cached(trading.exchange)
+        symbols = [s for s in (list(markets.keys()) if isinstance(markets, dict) else markets) if str(s).endswith(CONFIG["symbol_filter"])]
+        symbols, _ = prefilter_symbols(trading.exchange, symbols, markets)
+    order_executor().warm()
+
+    def on_close(symbol, bar, values, signal):
+        if signal in ["BUY", "SELL"]:
+            tracker.open(symbol, signal, float(bar[4]))
+
+    def on_ticker_state(live):
+        # REST polling only while no ticker stream feeds the tracker
+        if live:
+            tracker.stop()
+        else:
+            tracker.start()
+
+    stream = CandleStream(exchange_obj or init_stream_exchange(), symbols, on_close=on_close,
+                          on_ticker=tracker.on_tick, on_ticker_state=on_ticker_state)
+    tracker.start()
+    try:
+        asyncio.run(stream.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tracker.stop()
+        orders.shutdown(wait=True)
+    return tracker
+
+def cli_stream():
+    import argparse
+    p = argparse.ArgumentParser()
+    p.add_argument('--stream', nargs='?', const='', default='', help="Symbols ('BTC/USDT,ETH/USDT', '@file'); default: all filtered markets")
+    p.add_argument('--replay-since', default=None, help='Replay stored history from this date instead of connecting')
+    p.add_argument('--replay-interval', type=float, default=0.0, help='Seconds between replayed bars')
+    args = p.parse_args()
+    symbols = _parse_symbol_list(args.stream) if args.stream else None
+    print(f"Starting stream: dry_run={CONFIG['dry_run']}, exchange={CONFIG['exchange']}")
+    ex = None
+    if args.replay_since:
+        public = get_public_exchange()
+        index = symbol_index_for(public)
+        symbols = [index.resolve(s) or s for s in (symbols or [])]
+        histories = {sym: fetch_ohlcv_history(public, sym, CONFIG["timeframe"], _parse_date_ms(args.replay_since)) for sym in symbols}
+        ex = ReplayStreamExchange(histories, seed=CONFIG["limit"], interval_s=args.replay_interval)
+    run_stream(symbols, ex)
@@ -0,0 +1,90 @@
+"""AnalysisCache: LRU by size, expiry at candle close, SQLite sharing, copies handed out."""
+import json
+
+import trading
+from cache import AnalysisCache
+
+
+def entry(n):
+    return {'symbol': f'S{n}', 'signal': 'HOLD', 'indicators': {'RSI': 50.0 + n}}
+
+
+def size(result):
+    return len(json.dumps(result, default=str))
+
+
+def test_lru_evicts_least_recently_used_by_bytes():
+    cache = AnalysisCache(max_bytes=3 * size(entry(1)), db_path='')
+    for n in (1, 2, 3):
+        cache.put(('ex', f'S{n}'), entry(n), expires_ms=10_000)
+    assert cache.get(('ex', 'S1'), now_ms=1) == entry(1)    # S1 is now the most recent
+    cache.put(('ex', 'S4'), entry(4), expires_ms=10_000)
+    assert cache.get(('ex', 'S2'), now_ms=1) is None
+    assert [k[1] for k in cache.entries] == ['S3', 'S1', 'S4']
+    assert cache.bytes == sum(size(entry(n)) for n in (3, 1, 4))
+
+
+def test_entry_expires_when_the_candle_closes():
+    cache = AnalysisCache(max_bytes=1 << 20, db_path='')
+    cache.put(('ex', 'BTC/USDT', '15m', 0), entry(1), expires_ms=900_000)
+    assert cache.get(('ex', 'BTC/USDT', '15m', 0), now_ms=899_999) == entry(1)
+    assert cache.get(('ex', 'BTC/USDT', '15m', 0), now_ms=900_000) is None
+    assert not cache.entries and cache.bytes == 0
+
+
+def test_quiet_entry_does_not_answer_a_verbose_request():
+    cache = AnalysisCache(max_bytes=1 << 20, db_path='')
+    cache.put(('ex', 'S1'), entry(1), expires_ms=10_000, verbose=False)
+    assert cache.get(('ex', 'S1'), verbose=True, now_ms=1) is None
+    assert cache.get(('ex', 'S1'), verbose=False, now_ms=1) == entry(1)
+
+
+def test_sqlite_round_trip_between_instances(tmp_path):
+    db = str(tmp_path / 'analysis.sqlite')
+    writer = AnalysisCache(max_bytes=1 << 20, db_path=db)
+    writer.put(('binance', 'BTC/USDT', '15m', 0), entry(1), expires_ms=900_000)
+    writer.put(('binance', 'ETH/USDT', '15m', 0), entry(2), expires_ms=900_000, verbose=False)
+
+    reader = AnalysisCache(max_bytes=1 << 20, db_path=db)
+    assert reader.get(('binance', 'BTC/USDT', '15m', 0), now_ms=1) == entry(1)
+    assert ('binance', 'BTC/USDT', '15m', 0) in reader.entries     # promoted to memory
+    assert reader.get(('binance', 'ETH/USDT', '15m', 0), verbose=True, now_ms=1) is None
+    assert reader.get(('binance', 'ETH/USDT', '15m', 0), verbose=False, now_ms=1) == entry(2)
+    assert AnalysisCache(max_bytes=1 << 20, db_path=db).get(
+        ('binance', 'BTC/USDT', '15m', 0), now_ms=900_000) is None
+
+
+class FakeIndex:
+    def resolve(self, symbol):
+        return symbol
+
+
+def test_analyze_symbol_hands_out_copies(monkeypatch):
+    calls = []
+
+    def analyze(symbol, exchange_name=None, verbose=True):
+        calls.append(symbol)
+        return {'symbol': symbol, 'signal': 'BUY', 'indicators': {'RSI': 25.0}, 'reasons': ['oversold']}
+
+    clock = [1_000_000.0]
+    monkeypatch.setitem(trading.CONFIG, 'analyze_cache', True)
+    monkeypatch.setattr(trading, 'ANALYSIS_CACHE', AnalysisCache(max_bytes=1 << 20, db_path=''))
+    monkeypatch.setattr(trading, 'get_public_exchange', lambda name=None: type('Ex', (), {'id': 'fake'})())
+    monkeypatch.setattr(trading, 'symbol_index_for', lambda ex: FakeIndex())
+    monkeypatch.setattr(trading, '_timeframe_ms', lambda ex, tf: 900_000)
+    monkeypatch.setattr(trading, '_analyze_symbol', analyze)
+    monkeypatch.setattr(trading.time, 'time', lambda: clock[0])
+
+    first = trading.analyze_symbol('BTC/USDT')
+    first['indicators']['RSI'] = -1
+    first['reasons'].append('tampered')
+    second = trading.analyze_symbol('BTC/USDT')
+    assert second == {'symbol': 'BTC/USDT', 'signal': 'BUY', 'indicators': {'RSI': 25.0}, 'reasons': ['oversold']}
+    assert second is not first and len(calls) == 1
+
+    clock[0] = 1_000_799.999    # still the same 15m candle
+    trading.analyze_symbol('BTC/USDT')
+    assert len(calls) == 1
+    clock[0] = 1_000_800.0      # candle closed
+    trading.analyze_symbol('BTC/USDT')
+    assert len(calls) == 2
@@ -0,0 +1,88 @@
+"""simulate_exits/backtest_stats on hand-made bars, and the history cache."""
+import numpy as np
+import pytest
+
+import backtest
+import trading
+
+
+def flat_bars(n, price=100.0):
+    time_col = np.arange(n, dtype=np.float64) * 60_000
+    high = np.full(n, price + 0.1)
+    low = np.full(n, price - 0.1)
+    close = np.full(n, price)
+    return time_col, high, low, close
+
+
+def test_simulate_exits_tp_sl_timeout():
+    t, high, low, close = flat_bars(20)
+    codes = np.zeros(20, dtype=np.int8)
+    codes[1] = 1      # BUY @100: TP 102 touched on bar 3
+    high[3] = 102.5
+    codes[5] = -1     # SELL @100: SL 101 touched on bar 7
+    high[7] = 101.2
+    codes[6] = 1      # ignored, the SELL is still open
+    codes[10] = 1     # BUY @100: nothing touched, closed after 3 bars
+    close[13] = 100.5
+    trades = backtest.simulate_exits(t, high, low, close, codes, tp_pct=0.02, sl_pct=0.01, max_hold_bars=3)
+    assert [(tr['side'], tr['status'], tr['exit_ts']) for tr in trades] == [
+        ('BUY', 'tp', int(t[3])), ('SELL', 'sl', int(t[7])), ('BUY', 'timeout', int(t[13]))]
+    assert [tr['return'] for tr in trades] == pytest.approx([0.02, -0.01, 0.005])
+
+    stats = backtest.backtest_stats(trades, trade_size_usdt=100)
+    assert stats['trades'] == 3 and stats['wins'] == 2
+    assert stats['win_rate'] == pytest.approx(2 / 3)
+    assert stats['pnl_usdt'] == pytest.approx(1.5)
+    assert stats['max_drawdown_usdt'] == pytest.approx(1.0)
+
+
+def test_simulate_exits_same_bar_counts_as_sl():
+    t, high, low, close = flat_bars(6)
+    codes = np.zeros(6, dtype=np.int8)
+    codes[0] = 1
+    high[2], low[2] = 103.0, 98.0
+    trades = backtest.simulate_exits(t, high, low, close, codes, tp_pct=0.02, sl_pct=0.01, fee_pct=0.001)
+    assert [tr['status'] for tr in trades] == ['sl']
+    assert trades[0]['return'] == pytest.approx(-0.012)
+
+
+def test_backtest_stats_empty():
+    assert backtest.backtest_stats([])['trades'] == 0
+
+
+class PagedExchange:
+    id = 'paged'
+
+    def __init__(self, bars):
+        self.bars = bars
+        self.calls = []
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append(since)
+        rows = self.bars[self.bars[:, 0] >= since][:limit]
+        return rows.tolist()
+
+
+def test_history_keeps_bars_of_symbol_listed_after_since(tmp_path, monkeypatch):
+    monkeypatch.setitem(trading.CONFIG, "ohlcv_cache_dir", str(tmp_path))
+    tf = 60_000
+    listed = 1_000 * tf
+    bars = np.column_stack([listed + np.arange(250) * tf] + [np.full(250, 1.0)] * 5)
+    ex = PagedExchange(bars)
+    until = int(bars[-1, 0])
+    first = backtest.fetch_ohlcv_history(ex, "NEW/USDT", "1m", 0, until, page_limit=100)
+    assert len(first) == 250 and ex.calls == [0, bars[99, 0] + 1, bars[199, 0] + 1]
+
+    # same range again: only the last stored bar is asked for
+    ex.calls.clear()
+    again = backtest.fetch_ohlcv_history(ex, "NEW/USDT", "1m", 0, until, page_limit=100)
+    assert np.array_equal(again, first)
+    assert ex.calls == [until]
+
+    # an earlier start than any before fetches the head once, then not again
+    ex.calls.clear()
+    backtest.fetch_ohlcv_history(ex, "NEW/USDT", "1m", -5 * tf, until, page_limit=100)
+    assert ex.calls == [-5 * tf, until]
+    ex.calls.clear()
+    backtest.fetch_ohlcv_history(ex, "NEW/USDT", "1m", -5 * tf, until, page_limit=100)
+    assert ex.calls == [until]
@@ -0,0 +1,108 @@
+"""CandleRing windows and the fetch_ohlcv_cached merge."""
+import time
+
+import numpy as np
+
+import cache
+import trading
+
+
+def bars(start, n, tf=60_000, t0=0):
+    ts = t0 + (start + np.arange(n)) * tf
+    close = 100.0 + start + np.arange(n)
+    return np.column_stack([ts, close, close + 1, close - 1, close, np.ones(n)])
+
+
+def test_extend_replaces_last_bar_and_skips_older_ones():
+    ring = cache.CandleRing(20)
+    assert ring.extend(bars(0, 10)) == 10
+    overlap = bars(7, 5)
+    overlap[2, 4] = 999.0      # bar 9, the last stored one, changed
+    assert ring.extend(overlap) == 2
+    got = ring.last()
+    assert len(got) == 12 and got[9, 4] == 999.0
+    assert np.array_equal(got[:9], bars(0, 9))
+    assert ring.extend(bars(3, 4)) == 0 and len(ring) == 12
+
+
+def test_window_wraps_into_fresh_array_and_keeps_old_views():
+    ring = cache.CandleRing(5, slack=2)
+    ring.extend(bars(0, 5))
+    before = ring.last()
+    snapshot = before.copy()
+    for i in range(5, 17):
+        ring.append(bars(i, 1)[0])
+        assert np.array_equal(ring.last(), bars(i - 4, 5))
+    assert np.array_equal(before, snapshot)
+    assert ring.last_time() == 16 * 60_000
+
+
+def test_extend_trims_to_capacity():
+    ring = cache.CandleRing(5, slack=2)
+    ring.extend(bars(0, 3))
+    assert ring.extend(bars(3, 12)) == 12
+    assert np.array_equal(ring.last(), bars(10, 5))
+    assert np.array_equal(ring.last(2), bars(13, 2))
+
+
+def test_replacing_open_bar_does_not_change_handed_out_view():
+    ring = cache.CandleRing(10)
+    ring.extend(bars(0, 6))
+    view = ring.last(3)
+    snapshot = view.copy()
+    update = bars(5, 1)
+    update[0, 4] = 123.0
+    ring.extend(update)
+    assert np.array_equal(view, snapshot)
+    assert ring.last(1)[0, 4] == 123.0
+    # nobody holds a view now: the next replacement is written in place
+    data = ring._data
+    update[0, 4] = 124.0
+    ring._shared = False
+    ring.extend(update)
+    assert ring._data is data and ring.last(1)[0, 4] == 124.0
+
+
+class CandleExchange:
+    id = 'candles-test'
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def parse_timeframe(self, timeframe):
+        return 60
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append(since)
+        rows = self.rows if since is None else self.rows[self.rows[:, 0] >= since]
+        return (rows[:limit] if since is not None else rows[-limit:]).tolist()
+
+
+def test_fetch_ohlcv_cached_merges_new_bars(tmp_path, monkeypatch):
+    monkeypatch.setitem(trading.CONFIG, "ohlcv_cache", True)
+    monkeypatch.setitem(trading.CONFIG, "candle_store", True)
+    monkeypatch.setitem(trading.CONFIG, "ohlcv_cache_dir", str(tmp_path))
+    monkeypatch.setattr(cache, "CANDLES", cache.CandleStore())
+    t0 = (int(time.time() * 1000) // 60_000 - 60) * 60_000
+    ex = CandleExchange(bars(0, 50, t0=t0))
+    first = cache.fetch_ohlcv_cached(ex, "X/USDT", "1m", 20)
+    assert ex.calls == [None] and np.array_equal(first, bars(30, 20, t0=t0))
+
+    # the open bar moved on and two new bars arrived
+    rows = bars(0, 52, t0=t0)
+    rows[49, 4] = 555.0
+    ex.rows = rows
+    second = cache.fetch_ohlcv_cached(ex, "X/USDT", "1m", 20)
+    assert ex.calls[-1] == t0 + 49 * 60_000
+    assert np.array_equal(second, rows[-20:])
+    assert np.array_equal(first, bars(30, 20, t0=t0))     # earlier view untouched
+
+    # a fresh process (empty store) merges from the disk cache
+    monkeypatch.setattr(cache, "CANDLES", cache.CandleStore())
+    rows = bars(0, 53, t0=t0)
+    rows[49, 4] = 555.0
+    ex.rows = rows
+    third = cache.fetch_ohlcv_cached(ex, "X/USDT", "1m", 20)
+    assert ex.calls[-1] == t0 + 51 * 60_000
+    assert np.array_equal(third, ex.rows[-20:])
@@ -0,0 +1,65 @@
+"""Compact analyze format: to_compact -> pack -> unpack -> from_compact round trip."""
+import struct
+
+import pytest
+
+import trading
+
+
+def analysis(symbol='BTC/USDT'):
+    return {
+        'symbol': symbol, 'ts': 1_700_000_100_000, 'close': 101.5, 'prev_close': 100.0,
+        'close_change': 0.015, 'volume': 1234.5, 'prev_volume': 1000.0, 'volume_change': 0.2345,
+        'signal': 'BUY', 'score': 3, 'trend': 'BULL', 'position_sizing': 'aggressive',
+        'indicators': {'EMA50': 99.0, 'EMA200': 95.0, 'EMA_diff': 4.0, 'MACD': 0.5,
+                       'MACD_signal': 0.25, 'MACD_hist': 0.25, 'StochRSI': 0.15},
+        'rsi': 41.0, 'atr': 1.2, 'atr_pct': 0.0118, 'ema_slope': 0.01, 'macd_strength': 0.0025,
+        'vol_vs_ma': 1.3,
+        'votes': {'vote_ema': 1, 'vote_macd': 1, 'vote_rsi': 0, 'vote_vol': 1,
+                  'bull_weight': 3.0, 'bear_weight': 0.0, 'htf_allows_bull': True, 'htf_allows_bear': False},
+        'higher_timeframe_bias': {tf: label for tf, label in zip(trading.HTF_TIMEFRAMES, ('BULL', 'BEAR'))},
+        'recommendation': {'action': 'enter_long', 'entry': 101.5, 'entry_zone': [101.0, 102.0],
+                           'sl': 99.0, 'tps': [103.0, 105.0], 'risk_pct': 0.0246},
+        'advice': 'not part of the compact record',
+    }
+
+
+def test_pack_unpack_round_trip():
+    results = [analysis(), analysis('ÄÖ/USDT'), {'symbol': 'EMPTY/USDT', 'signal': 'HOLD'}]
+    records = [trading.to_compact(r) for r in results]
+    assert all(len(rec) == 1 + len(trading.COMPACT_FIELDS) for rec in records)
+
+    buf = trading.compact_header() + b''.join(trading.pack_compact(rec) for rec in records)
+    assert list(trading.unpack_compact(buf)) == records
+
+    flat = trading.from_compact(records[0])
+    assert flat['symbol'] == 'BTC/USDT' and flat['ts'] == 1_700_000_100_000
+    assert (flat['signal'], flat['trend'], flat['position_sizing'], flat['action']) == \
+        ('BUY', 'BULL', 'aggressive', 'enter_long')
+    assert [flat[f'htf_{tf}'] for tf in trading.HTF_TIMEFRAMES] == ['BULL', 'BEAR']
+    assert (flat['entry_low'], flat['entry_high'], flat['tp1'], flat['tp2'], flat['tp3']) == \
+        (101.0, 102.0, 103.0, 105.0, None)
+    assert (flat['htf_allows_bull'], flat['htf_allows_bear']) == (1.0, 0.0)
+    assert flat['stoch_rsi'] == 0.15
+
+    empty = trading.from_compact(records[2])
+    assert empty['signal'] == 'HOLD'
+    assert all(v is None for k, v in empty.items() if k not in ('symbol', 'signal'))
+
+
+def test_nan_is_missing():
+    result = analysis()
+    result['close_change'] = float('nan')
+    rec = trading.to_compact(result)
+    assert rec[1 + trading.COMPACT_FIELDS.index('close_change')] is None
+    buf = trading.compact_header() + trading.pack_compact(rec)
+    assert trading.from_compact(next(trading.unpack_compact(buf)))['close_change'] is None
+
+
+def test_unpack_rejects_foreign_or_stale_streams():
+    rec = trading.pack_compact(trading.to_compact(analysis()))
+    with pytest.raises(ValueError, match='not a compact'):
+        list(trading.unpack_compact(b'JUNK' + rec))
+    stale = b'TPCR' + struct.pack('<BH', trading.COMPACT_SCHEMA_VERSION, len(trading.COMPACT_FIELDS) - 1)
+    with pytest.raises(ValueError, match='schema mismatch'):
+        list(trading.unpack_compact(stale + rec))
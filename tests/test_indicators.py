@@ -0,0 +1,122 @@
+"""IndicatorState must reproduce add_indicators (ta) when fed the same bars."""
+import math
+
+import numpy as np
+import pytest
+
+ta = pytest.importorskip("ta")
+
+import trading
+
+
+def random_bars(n=400, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.005, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.005, n))
+    volume = rng.uniform(10, 1000, n)
+    ts = np.arange(n, dtype=np.float64) * 900_000 + 1_700_000_000_000
+    return np.column_stack([ts, open_, high, low, close, volume])
+
+
+def assert_close(got, want, name, i):
+    if want is None or (isinstance(want, float) and math.isnan(want)):
+        return
+    assert got is not None, f"{name} missing at bar {i}"
+    assert got == pytest.approx(want, rel=1e-9, abs=1e-9), f"{name} differs at bar {i}"
+
+
+def test_state_matches_add_indicators_bar_by_bar():
+    bars = random_bars()
+    df = trading.add_indicators(trading.ohlcv_frame(bars))
+    rsi = ta.momentum.RSIIndicator(df["close"]).rsi()
+    atr = ta.volatility.AverageTrueRange(df["high"], df["low"], df["close"]).average_true_range()
+    state = trading.IndicatorState(window=len(bars))
+    for i, bar in enumerate(bars):
+        v = state.update(bar)
+        if i < 50:
+            continue
+        for name in ("EMA50", "MACD", "MACD_signal", "StochRSI"):
+            assert_close(v[name], float(df[name].iloc[i]), name, i)
+        if i >= 199:
+            assert_close(v["EMA200"], float(df["EMA200"].iloc[i]), "EMA200", i)
+        assert_close(v["RSI"], float(rsi.iloc[i]), "RSI", i)
+        if i >= 14:
+            assert_close(v["ATR"], float(atr.iloc[i]), "ATR", i)
+
+
+def expected(window):
+    df = trading.add_indicators(trading.ohlcv_frame(window))
+    out = {name: df[name].iloc[-1] for name in ("EMA50", "EMA200", "MACD", "MACD_signal", "StochRSI")}
+    out = {name: None if value is None else float(value) for name, value in out.items()}
+    out["RSI"] = float(ta.momentum.RSIIndicator(df["close"]).rsi().iloc[-1])
+    out["ATR"] = float(ta.volatility.AverageTrueRange(df["high"], df["low"], df["close"]).average_true_range().iloc[-1])
+    return out
+
+
+def test_state_matches_limit_window_of_longer_history():
+    # the scanner's cache outgrows LIMIT: values must be those of ta on the
+    # last LIMIT bars, not of the whole history
+    bars = random_bars(n=700, seed=5)
+    state = trading.IndicatorState(window=200)
+    for i, bar in enumerate(bars):
+        v = state.update(bar)
+        if i >= 60 and i % 13 == 0:
+            for name, want in expected(bars[max(0, i - 199):i + 1]).items():
+                assert_close(v[name], want, name, i)
+
+
+def test_update_many_follows_sliding_fetches():
+    bars = random_bars(n=520, seed=8)
+    state = trading.IndicatorState(window=200)
+    end = 200
+    while end <= len(bars):
+        rows = bars[end - 200:end]
+        v = state.update_many(rows)
+        for name, want in expected(rows).items():
+            assert_close(v[name], want, name, end)
+        # closed_only drops the open bar: one row fewer, ending a bar earlier
+        v = state.update_many(rows[:-1])
+        for name, want in expected(rows[:-1]).items():
+            assert_close(v[name], want, name, end - 1)
+        end += 37
+
+
+def test_saved_state_resumes():
+    bars = random_bars(n=450, seed=4)
+    state = trading.IndicatorState(window=200)
+    state.update_many(bars[150:350])
+    restored = trading.IndicatorState.from_dict(state.to_dict())
+    state.update_many(bars[250:450])
+    v = restored.update_many(bars[250:450])
+    assert v == state.values()
+    for name, want in expected(bars[250:450]).items():
+        assert_close(v[name], want, name, 449)
+
+
+def test_signal_matches_get_signal_on_same_window():
+    bars = random_bars(n=300, seed=11)
+    for end in range(250, 301, 10):
+        window = bars[end - 250:end]
+        state = trading.IndicatorState()
+        v = state.update_many(window)
+        want = trading.get_signal(trading.add_indicators(trading.ohlcv_frame(window)))
+        got = trading.signal_from_values(v["EMA50"], v["EMA200"], v["MACD"], v["MACD_signal"], v["StochRSI"])
+        assert got == want
+
+
+def test_same_timestamp_replaces_open_bar():
+    bars = random_bars(n=120)
+    state = trading.IndicatorState()
+    state.update_many(bars[:-1])
+    provisional = bars[-1].copy()
+    provisional[4] *= 1.05
+    state.update(provisional)
+    state.update(bars[-1])
+    fresh = trading.IndicatorState()
+    fresh.update_many(bars)
+    assert state.bars == fresh.bars
+    for name, value in fresh.values().items():
+        if value is not None:
+            assert state.values()[name] == pytest.approx(value, rel=1e-12)
@@ -0,0 +1,27 @@
+"""optimize() on a process pool must rank exactly like a serial backtest."""
+import os
+
+import pytest
+
+import backtest
+from test_indicators import random_bars
+
+
+def test_parallel_sweep_ranks_like_serial():
+    histories = {f"S{k}/USDT": random_bars(300, seed=k) for k in range(4)}
+    grid = {'tp_pct': [0.01, 0.02, 0.04], 'sl_pct': [0.01, 0.03]}
+    before = set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+
+    rows = backtest.optimize(histories, grid, processes=2)
+
+    serial = []
+    for combo in backtest.parameter_grid(grid):
+        summary, _ = backtest.backtest_universe(histories, combo['tp_pct'], combo['sl_pct'])
+        serial.append(dict(combo, **summary))
+    serial.sort(key=lambda r: r['pnl_usdt'] or 0, reverse=True)
+
+    assert [(r['tp_pct'], r['sl_pct']) for r in rows] == [(r['tp_pct'], r['sl_pct']) for r in serial]
+    assert [r['pnl_usdt'] for r in rows] == pytest.approx([r['pnl_usdt'] for r in serial])
+    assert [r['rank'] for r in rows] == list(range(1, len(serial) + 1))
+    if before:
+        assert set(os.listdir('/dev/shm')) <= before
@@ -0,0 +1,112 @@
+"""OrderExecutor.prepare checks against market rules, without touching an exchange."""
+import pytest
+
+import trading
+
+MARKETS = {
+    'BTC/USDT': {
+        'base': 'BTC', 'spot': True,
+        'precision': {'amount': 0.001},
+        'limits': {'amount': {'min': 0.001, 'max': 100.0}, 'cost': {'min': 10.0}},
+    },
+    'BTC/USDT:USDT': {
+        'base': 'BTC', 'spot': False, 'type': 'swap',
+        'precision': {'amount': 0.001},
+        'limits': {'amount': {'min': 0.001}, 'cost': {'min': 5.0}},
+    },
+}
+
+
+class FakeExchange:
+    """Just enough of ccxt for prepare(): no amount_to_precision, so rules do the rounding."""
+    id = 'fake'
+    precisionMode = 4
+
+    def __init__(self, free_btc=1.0):
+        self.free_btc = free_btc
+        self.balance_calls = 0
+
+    def load_markets(self):
+        return MARKETS
+
+    def fetch_balance(self):
+        self.balance_calls += 1
+        return {'free': {'BTC': self.free_btc}}
+
+
+def executor(free_btc=1.0):
+    ex = FakeExchange(free_btc)
+    return trading.OrderExecutor(ex, prices=trading.PriceCache(), feed=object()).warm(MARKETS), ex
+
+
+@pytest.fixture(autouse=True)
+def live(monkeypatch):
+    monkeypatch.setitem(trading.CONFIG, 'dry_run', False)
+
+
+def test_prepare_rounds_down_to_the_lot_step():
+    ex, _ = executor()
+    amount, price = ex.prepare('BTC/USDT', 'BUY', 100.0, price=30_000.0)
+    assert (amount, price) == (0.003, 30_000.0)
+
+
+@pytest.mark.parametrize('symbol, action, usdt, price, message', [
+    ('BTC/USDT', 'HOLD', 100.0, 30_000.0, 'unknown side'),
+    ('ETH/USDT', 'BUY', 100.0, 3_000.0, 'unknown market'),
+    ('BTC/USDT', 'BUY', 20.0, 30_000.0, 'below lot size'),          # 0.000666 -> 0
+    ('BTC/USDT', 'BUY', 3_030_000.0, 30_000.0, 'above lot size'),   # 101 BTC
+    ('BTC/USDT', 'BUY', 9.99, 1_000.0, 'buy cost'),                 # 0.009 BTC = 9 USDT < 10
+])
+def test_prepare_rejections(symbol, action, usdt, price, message):
+    ex, _ = executor()
+    with pytest.raises(trading.OrderRejected, match=message):
+        ex.prepare(symbol, action, usdt, price=price)
+
+
+def test_min_notional_uses_the_rounded_amount_on_both_sides():
+    ex, _ = executor()
+    # 10.5 USDT at 1000 buys 0.0105 -> 0.010 BTC = 10.0 notional: exactly the minimum
+    assert ex.prepare('BTC/USDT', 'BUY', 10.5, price=1_000.0)[0] == pytest.approx(0.010)
+    with pytest.raises(trading.OrderRejected, match='sell proceeds'):
+        ex.prepare('BTC/USDT', 'SELL', 9.99, price=1_000.0)
+
+
+def test_spot_sell_needs_free_base_balance():
+    ex, fake = executor(free_btc=0.002)
+    with pytest.raises(trading.OrderRejected, match='insufficient BTC'):
+        ex.prepare('BTC/USDT', 'SELL', 100.0, price=30_000.0)
+    # derivatives sell short: no balance request
+    assert ex.prepare('BTC/USDT:USDT', 'SELL', 100.0, price=30_000.0)[0] == 0.003
+    assert fake.balance_calls == 1
+
+
+def test_dry_run_skips_the_balance_check(monkeypatch):
+    monkeypatch.setitem(trading.CONFIG, 'dry_run', True)
+    ex, fake = executor(free_btc=0.0)
+    assert ex.prepare('BTC/USDT', 'SELL', 100.0, price=30_000.0)[0] == 0.003
+    assert fake.balance_calls == 0
+
+
+def test_market_rules_precision_modes():
+    market = {'precision': {'amount': 3}, 'limits': {'market': {'min': 0.01}, 'amount': {'min': 0.001}}}
+    decimal_places = trading._market_rules(market, precision_mode=2)
+    assert decimal_places['amount_step'] == pytest.approx(0.001)
+    assert decimal_places['min_amount'] == 0.01     # market-order lot size wins
+
+    tick = trading._market_rules({'precision': {'amount': 0.05}}, precision_mode=4)
+    assert tick['amount_step'] == 0.05
+    assert tick['spot'] is True
+
+    significant = trading._market_rules({'precision': {'amount': 4}}, precision_mode=3)
+    assert significant['amount_step'] is None
+
+
+@pytest.mark.parametrize('value, step, want', [
+    (0.0036666, 0.001, 0.003),
+    (0.3, 0.1, 0.3),            # 0.3 / 0.1 is 2.9999999999999996 in floats
+    (12.345, 0.05, 12.3),
+    (7.0, 1.0, 7.0),
+    (0.00099, 0.001, 0.0),
+])
+def test_floor_to_step(value, step, want):
+    assert trading._floor_to_step(value, step) == want
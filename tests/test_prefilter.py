@@ -0,0 +1,71 @@
+"""prefilter_symbols: one fetch_tickers call decides which symbols are worth scanning."""
+import trading
+
+TICKERS = {
+    'OK/USDT': {'last': 10.0, 'quoteVolume': 50_000, 'bid': 9.99, 'ask': 10.01},
+    'THIN/USDT': {'last': 10.0, 'quoteVolume': 500, 'bid': 9.99, 'ask': 10.01},
+    'BASEVOL/USDT': {'last': 2.0, 'quoteVolume': None, 'baseVolume': 1_000, 'bid': 1.99, 'ask': 2.01},
+    'WIDE/USDT': {'last': 10.0, 'quoteVolume': 50_000, 'bid': 9.5, 'ask': 10.5},
+    'PENNY/USDT': {'last': 0.0001, 'quoteVolume': 50_000},
+    'DEAD/USDT': {'last': 10.0, 'quoteVolume': 50_000},
+    'ZERO/USDT': {'last': 0, 'quoteVolume': 50_000},
+}
+MARKETS = {sym: {'active': sym != 'DEAD/USDT'} for sym in TICKERS}
+
+
+class FakeExchange:
+    id = 'prefilter'
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def fetch_tickers(self):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError('boom')
+        return TICKERS
+
+
+def configure(monkeypatch, **overrides):
+    settings = dict(prefilter=True, prefilter_min_quote_volume=10_000, prefilter_max_spread_pct=0.01,
+                    prefilter_min_price=0.001, prefilter_max_price=0)
+    settings.update(overrides)
+    for key, value in settings.items():
+        monkeypatch.setitem(trading.CONFIG, key, value)
+
+
+def test_volume_spread_price_and_status(monkeypatch):
+    configure(monkeypatch)
+    ex = FakeExchange()
+    symbols = list(TICKERS) + ['GONE/USDT']
+    survivors, dropped = trading.prefilter_symbols(ex, symbols, markets=MARKETS)
+    assert survivors == ['OK/USDT']
+    assert dropped == {
+        'THIN/USDT': 'low_volume',
+        'BASEVOL/USDT': 'low_volume',      # 1000 base * 2.0 = 2000 quote
+        'WIDE/USDT': 'wide_spread',
+        'PENNY/USDT': 'low_price',
+        'DEAD/USDT': 'inactive',
+        'ZERO/USDT': 'no_ticker',
+        'GONE/USDT': 'no_ticker',
+    }
+    assert ex.calls == 1
+    assert ex.price_feed.prices.get('OK/USDT') == 10.0
+
+
+def test_thresholds_of_zero_disable_a_check(monkeypatch):
+    configure(monkeypatch, prefilter_min_quote_volume=0, prefilter_max_spread_pct=0, prefilter_min_price=0,
+              prefilter_max_price=5.0)
+    survivors, dropped = trading.prefilter_symbols(FakeExchange(), list(TICKERS), markets=MARKETS)
+    assert survivors == ['BASEVOL/USDT', 'PENNY/USDT']
+    assert dropped['OK/USDT'] == 'high_price'
+
+
+def test_everything_survives_when_disabled_or_tickers_fail(monkeypatch):
+    configure(monkeypatch)
+    assert trading.prefilter_symbols(FakeExchange(fail=True), list(TICKERS)) == (list(TICKERS), {})
+    configure(monkeypatch, prefilter=False)
+    ex = FakeExchange()
+    assert trading.prefilter_symbols(ex, list(TICKERS)) == (list(TICKERS), {})
+    assert ex.calls == 0
@@ -0,0 +1,122 @@
+"""RateBudget lane priority and backoff, and schedule_exchange's per-call headers."""
+import threading
+import time
+
+import pytest
+
+import trading
+
+
+def test_execution_lane_is_served_before_waiting_scan():
+    budget = trading.RateBudget(6000, headroom=1.0)   # 100 weight/s
+    budget.tokens = 0.0
+    order = []
+
+    def take(lane):
+        budget.acquire(50, lane)
+        order.append(lane)
+
+    scan = threading.Thread(target=take, args=('scan',))
+    scan.start()
+    time.sleep(0.05)
+    execution = threading.Thread(target=take, args=('execution',))
+    execution.start()
+    scan.join(5)
+    execution.join(5)
+    assert order == ['execution', 'scan']
+
+
+def test_backoff_pauses_and_slows_every_lane():
+    budget = trading.RateBudget(6000, headroom=1.0)
+    budget.backoff(429, '0.3')
+    assert budget.scale == pytest.approx(0.5)
+    t0 = time.monotonic()
+    budget.acquire(1, 'execution')
+    assert time.monotonic() - t0 >= 0.25
+    # without Retry-After consecutive 429s double the pause
+    budget.backoff(429)
+    assert budget.paused_until - time.monotonic() == pytest.approx(2.0, abs=0.1)
+    budget.note_headers({})
+    assert budget.strikes == 0
+
+
+class HeaderExchange:
+    """Answers fetch_ticker through on_rest_response like ccxt's fetch() does."""
+
+    rateLimit = 50
+
+    def __init__(self, venue):
+        self.id = venue
+        self.last_response_headers = None
+        self.has = {}
+        self.gate = threading.Event()
+
+    def on_rest_response(self, code, reason, url, method, headers, body, request_headers=None, request_body=None):
+        self.last_response_headers = headers
+        return body
+
+    def fetch_ticker(self, symbol, used=None, slow=False, retry_after=None):
+        headers = {'x-mbx-used-weight-1m': str(used)}
+        if retry_after is not None:
+            headers['Retry-After'] = retry_after
+        self.on_rest_response(200, 'OK', '/ticker', 'GET', headers, '{}')
+        if slow:
+            self.gate.wait(5)
+        if retry_after is not None:
+            raise RateLimited(symbol)
+        return {'symbol': symbol}
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class RateLimited(RateLimitExceeded):
+    pass
+
+
+def test_scheduled_calls_read_their_own_headers():
+    ex = trading.schedule_exchange(HeaderExchange('hdr-test'))
+    budget = ex.rate_budget
+    slow = threading.Thread(target=ex.fetch_ticker, args=('A',), kwargs={'used': 100, 'slow': True})
+    slow.start()
+    time.sleep(0.05)
+    ex.fetch_ticker('B', used=900)       # overwrites the shared attribute meanwhile
+    assert budget.used_weight == 900
+    ex.gate.set()
+    slow.join(5)
+    assert budget.used_weight == 100     # A's own response, not B's
+
+
+def test_rate_limit_error_backs_off_with_its_retry_after():
+    ex = trading.schedule_exchange(HeaderExchange('hdr-test-429'))
+    ex.last_response_headers = {'Retry-After': '30'}
+    with pytest.raises(RateLimited):
+        ex.fetch_ticker('A', used=10, retry_after='0.5')
+    assert ex.rate_budget.paused_until - time.monotonic() == pytest.approx(0.5, abs=0.1)
+
+
+class MarketsExchange(HeaderExchange):
+    """load_markets makes three HTTP requests through fetch2, like ccxt's binance."""
+
+    def calculate_rate_limiter_cost(self, api, method, path, params, config):
+        return 4
+
+    def fetch2(self, path, api='public', method='GET', params={}, headers=None, body=None, config={}):
+        return {}
+
+    def load_markets(self, reload=False):
+        for path in ('spot', 'linear', 'inverse'):
+            self.fetch2(path)
+        return {}
+
+
+def test_load_markets_pays_for_every_request():
+    ex = trading.schedule_exchange(MarketsExchange('markets-test'))
+    charged = []
+    acquire = ex.rate_budget.acquire
+    ex.rate_budget.acquire = lambda weight=1, lane=None: (charged.append(weight), acquire(weight, lane))
+    ex.load_markets()
+    # first request at the method weight (1 here), then 4 rateLimit slots
+    # of 50 ms each = 4 weight on a 1200/min venue
+    assert charged == [1, 4.0, 4.0]
@@ -0,0 +1,64 @@
+"""Candle-close scheduling: closed bars only, one re-score per symbol per boundary."""
+import pytest
+
+import trading
+from test_indicators import random_bars
+
+TF_MS = 900_000
+
+
+class FakeExchange:
+    id = 'sched'
+
+    def parse_timeframe(self, timeframe):
+        return TF_MS // 1000
+
+
+def test_drop_open_candle(monkeypatch):
+    bars = random_bars(5)
+    last_open = bars[-1][0]
+    monkeypatch.setattr(trading.time, 'time', lambda: (last_open + TF_MS - 1) / 1000)
+    assert len(trading._drop_open_candle(bars, '15m', FakeExchange())) == 4
+    monkeypatch.setattr(trading.time, 'time', lambda: (last_open + TF_MS) / 1000)
+    assert len(trading._drop_open_candle(bars, '15m', FakeExchange())) == 5
+    assert len(trading._drop_open_candle(bars[:0], '15m', FakeExchange())) == 0
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_closed_only_scores_the_last_closed_bar(monkeypatch, incremental):
+    bars = random_bars(300, seed=11)
+    bars[-1, 4] = bars[-2, 4] * 1.5       # a wild open candle that must not count
+    symbol = f'CLOSED{int(incremental)}/USDT'
+    monkeypatch.setitem(trading.CONFIG, 'incremental_indicators', incremental)
+    monkeypatch.setitem(trading.CONFIG, 'ohlcv_cache', False)
+    monkeypatch.setitem(trading.CONFIG, 'timeframe', '15m')
+    monkeypatch.setattr(trading, 'fetch_ohlcv_cached', lambda ex, sym, tf, limit: bars)
+    monkeypatch.setattr(trading.time, 'time', lambda: (bars[-1][0] + TF_MS / 2) / 1000)
+
+    signal, price = trading.scan_symbol(symbol, closed_only=True, exchange_obj=FakeExchange())
+    closed = trading.add_indicators(trading.ohlcv_frame(bars[-trading.CONFIG['limit'] - 1:-1]))
+    assert price == pytest.approx(bars[-2, 4])
+    assert signal == trading.get_signal(closed)
+
+
+def test_each_symbol_rescored_once_per_boundary():
+    symbols = [f'S{k}/USDT' for k in range(20)]
+    sched = trading.CandleScheduler(symbols, '15m', spread_fraction=0.5, settle_s=2, exchange_obj=FakeExchange())
+    start = 100 * TF_MS + 123
+    runs = {sym: [] for sym in symbols}
+    now = start
+    while now < start + 4 * TF_MS:
+        for sym in sched.due(now):
+            runs[sym].append(now)
+            sched.mark(sym, now)
+        nxt = sched.next_run_ms(now)
+        assert nxt > now                  # everything due now has been marked
+        now = max(now + 1_000, min(nxt, now + 60_000))
+    for sym, times in runs.items():
+        closed = [sched.last_closed(t) for t in times]
+        # the candle that closed before start, then exactly one pass per boundary
+        assert closed == [(99 + k) * TF_MS for k in range(4)]
+        assert 2_000 <= sched.offsets[sym] < 2_000 + TF_MS // 2
+        for t in times:
+            offset = t - sched.last_closed(t) - TF_MS
+            assert sched.offsets[sym] <= offset < sched.offsets[sym] + 60_000
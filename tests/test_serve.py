@@ -0,0 +1,42 @@
+"""--serve must keep stdout pure NDJSON: one response per request line."""
+import io
+import json
+import os
+import subprocess
+import sys
+
+import serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_serve_stdin_keeps_diagnostics_off_stdout(monkeypatch, capsys):
+    def noisy_analyze(symbol, exchange_name=None, verbose=True):
+        print("[prefilter] 1/1 symbols kept")
+        print("⚠️ rate limited, backing off")
+        return {'symbol': symbol, 'signal': 'HOLD'}
+
+    monkeypatch.setattr(serve, "analyze_symbol", noisy_analyze)
+    requests = [{'id': 1, 'symbol': 'BTC/USDT'}, {'id': 2, 'op': 'ping'}, {'id': 3, 'symbol': 'ETH/USDT'}]
+    monkeypatch.setattr(sys, "stdin", io.StringIO("\n".join(json.dumps(r) for r in requests) + "\nnot json\n"))
+    serve.serve_stdin()
+    out, err = capsys.readouterr()
+    lines = out.splitlines()
+    assert len(lines) == 4
+    responses = [json.loads(line) for line in lines]
+    assert {r['id'] for r in responses} == {1, 2, 3, None}
+    assert "[prefilter]" in err and "backing off" in err
+    assert sys.stdout is not sys.stderr
+
+
+def test_serve_process_stdout_is_ndjson():
+    env = dict(os.environ, STRATEGY_PARAMS="{broken")
+    proc = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "trading.py"), "--serve"],
+        input='{"id": 1, "op": "ping"}\n{"id": 2, "op": "schema"}\n[]\n',
+        capture_output=True, text=True, timeout=60, env=env, cwd=ROOT)
+    assert proc.returncode == 0, proc.stderr
+    responses = [json.loads(line) for line in proc.stdout.splitlines()]
+    assert sorted(r['id'] for r in responses if r['id'] is not None) == [1, 2]
+    assert len(responses) == 3
+    assert "STRATEGY_PARAMS" in proc.stderr
@@ -0,0 +1,96 @@
+"""SingleFlight/coalesce_exchange: concurrent identical calls share one request."""
+import threading
+import time
+
+import trading
+
+N = 8
+
+
+def run_together(flight, key, fn):
+    """Start N callers of flight.do(key, fn); fn is released once all N have joined."""
+    release = threading.Event()
+    outcomes = [None] * N
+
+    def gated():
+        release.wait(5)
+        return fn()
+
+    def worker(i):
+        try:
+            outcomes[i] = ('ok', flight.do(key, gated))
+        except Exception as e:
+            outcomes[i] = ('error', e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(N)]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 5
+    while flight.stats()['coalesced'] < N - 1 and time.time() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join(5)
+    return outcomes
+
+
+def test_one_call_shared_by_all_waiters():
+    flight = trading.SingleFlight('test')
+    calls = []
+    result = {'price': 1.0}
+    outcomes = run_together(flight, ('fetch_ticker', 'BTC'), lambda: calls.append(1) or result)
+    assert len(calls) == 1
+    assert all(kind == 'ok' and value is result for kind, value in outcomes)
+    assert flight.stats() == {'calls': 1, 'coalesced': N - 1, 'in_flight': 0}
+
+
+def test_error_reaches_every_waiter_and_key_is_released():
+    flight = trading.SingleFlight('test')
+    boom = RuntimeError('exchange down')
+
+    def fail():
+        raise boom
+
+    outcomes = run_together(flight, ('fetch_ticker', 'BTC'), fail)
+    assert all(kind == 'error' and value is boom for kind, value in outcomes)
+    assert flight.stats()['in_flight'] == 0
+    # the failed key does not stick: the next call runs again
+    assert flight.do(('fetch_ticker', 'BTC'), lambda: 42) == 42
+    assert flight.stats()['calls'] == 2
+
+
+class FakeExchange:
+    id = 'fake'
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        self.calls.append((symbol, timeframe, limit))
+        self.release.wait(5)
+        return [[0, 1, 1, 1, 1, 1]]
+
+
+def test_coalesce_exchange_keys_on_arguments(monkeypatch):
+    monkeypatch.setitem(trading.CONFIG, 'coalesce_requests', True)
+    ex = trading.coalesce_exchange(FakeExchange())
+    assert trading.coalesce_exchange(ex) is ex
+    results = []
+    args = [('BTC/USDT', '15m')] * N + [('ETH/USDT', '15m'), ('BTC/USDT', '1h')]
+    threads = [threading.Thread(target=lambda a=a: results.append(ex.fetch_ohlcv(*a, limit=200)))
+               for a in args]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 5
+    while ex.single_flight.stats()['coalesced'] < N - 1 and time.time() < deadline:
+        time.sleep(0.001)
+    ex.release.set()
+    for t in threads:
+        t.join(5)
+    assert sorted(ex.calls) == [('BTC/USDT', '15m', 200), ('BTC/USDT', '1h', 200), ('ETH/USDT', '15m', 200)]
+    assert len(results) == len(args)
+    assert ex.single_flight.stats() == {'calls': 3, 'coalesced': N - 1, 'in_flight': 0}
+    # nothing in flight any more: a repeat call goes to the exchange again
+    ex.fetch_ohlcv('BTC/USDT', '15m', limit=200)
+    assert len(ex.calls) == 4
@@ -0,0 +1,89 @@
+"""CandleStream replayed offline must signal like the vectorized reference."""
+import asyncio
+
+import numpy as np
+
+import stream
+import trading
+
+from test_indicators import random_bars
+
+
+def replay(histories, seed=200, tickers=True, interval_s=0.0):
+    ex = stream.ReplayStreamExchange(histories, seed=seed, interval_s=interval_s, tickers=tickers)
+    closed, states = [], []
+
+    def on_close(symbol, bar, values, signal):
+        closed.append((symbol, int(bar[0]), signal))
+
+    candles = stream.CandleStream(ex, list(histories), limit=seed, on_close=on_close,
+                                  on_ticker_state=states.append)
+    asyncio.run(candles.run())
+    return closed, states
+
+
+def test_streamed_signals_match_signal_codes_matrix():
+    histories = {f"S{k}/USDT": random_bars(600, seed=k) for k in range(4)}
+    closed, _ = replay(histories)
+    syms = list(histories)
+    stack = np.stack([histories[s] for s in syms])
+    names = {1: "BUY", -1: "SELL", 0: "HOLD"}
+    codes = {}
+    seen = {s: 0 for s in syms}
+    for symbol, ts, signal in closed:
+        row = syms.index(symbol)
+        i = int(np.searchsorted(histories[symbol][:, 0], ts))
+        seen[symbol] += 1
+        if signal == "HOLD" and i % 4:
+            continue  # every BUY/SELL, a sample of the HOLDs
+        if i not in codes:
+            # like scan_universe_vectorized: the LIMIT bars ending at the closed one
+            win = stack[:, i - 199:i + 1]
+            ind = trading.add_indicators_matrix(win[:, :, 2], win[:, :, 3], win[:, :, 4])
+            codes[i] = trading.signal_codes_matrix(ind)[:, -1]
+        assert signal == names[int(codes[i][row])], f"{symbol} bar {i}"
+    # every bar from the last seed bar up to the still-open final one closes once
+    assert all(n == 600 - 200 for n in seen.values())
+    assert any(sig != "HOLD" for _, _, sig in closed)
+
+
+def test_ticker_state_reports_stream_up_and_down():
+    histories = {"A/USDT": random_bars(260)}
+    _, states = replay(histories, interval_s=0.002)
+    assert states[0] is True and states[-1] is False
+    _, states = replay(histories, tickers=False, interval_s=0.002)
+    assert states == []
+
+
+class QuietExchange:
+    id = 'quiet'
+
+    def fetch_tickers(self, symbols=None):
+        return {}
+
+
+def test_stream_orders_run_off_the_event_loop(monkeypatch):
+    placed = []
+
+    def place(pos):
+        try:
+            asyncio.get_running_loop()
+            on_loop = True
+        except RuntimeError:
+            on_loop = False
+        placed.append(on_loop)
+
+    class Executor:
+        def warm(self):
+            return self
+
+    monkeypatch.setattr(trading, "exchange", QuietExchange())
+    monkeypatch.setattr(stream, "order_executor", Executor)
+    monkeypatch.setattr(stream, "_place_order_on_tp", place)
+    monkeypatch.setitem(trading.CONFIG, "tp_pct", 1e-6)
+    monkeypatch.setitem(trading.CONFIG, "sl_pct", 1e-6)
+    histories = {f"S{k}/USDT": random_bars(400, seed=k) for k in range(4)}
+    ex = stream.ReplayStreamExchange(histories, seed=200, interval_s=0.002)
+    tracker = stream.run_stream(list(histories), ex)
+    assert tracker.closed and placed
+    assert not any(placed)
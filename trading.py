@@ -20,36 +20,286 @@ Configuration is read from environment variables by default. The script
 contains safe defaults (dry-run enabled) but review before enabling live orders.
 """
 
-import ccxt
 import inspect
-import inspect
-import pandas as pd
-import ta
 import time
+import threading
 import os
-from datetime import datetime
-
-# ---------------- إعداد المستخدم ----------------
-CONFIG = {
-    "exchange": os.environ.get("EXCHANGE", "binance"),        # binance أو mexc
-    "apiKey": os.environ.get("API_KEY", "YOUR_API_KEY"),
-    "secret": os.environ.get("API_SECRET", "YOUR_API_SECRET"),
-    "symbol_filter": os.environ.get("SYMBOL_FILTER", "USDT"),      # نراقب فقط الأزواج المنتهية بـ USDT
-    "timeframe": os.environ.get("TIMEFRAME", "15m"),           # الإطار الزمني
-    "limit": int(os.environ.get("LIMIT", 200)),
-    "trade_size_usdt": float(os.environ.get("TRADE_SIZE_USDT", 50)),        # حجم الصفقة بالدولار
-    "tp_pct": float(os.environ.get("TP_PCT", 0.05)),               # الهدف: 5%
-    "sl_pct": float(os.environ.get("SL_PCT", 0.03)),               # وقف الخسارة: 3%
-    "dry_run": os.environ.get("DRY_RUN", "true").lower() in ("1", "true", "yes"),              # أولاً نجرب المحاكاة
-    "poll_interval_s": int(os.environ.get("POLL_INTERVAL_S", 10)),
-    "simulate_max_wait_s": int(os.environ.get("SIMULATE_MAX_WAIT_S", 60*30)),  # 30 دقيقة افتراضيًا
+import sys
+
+if __name__ == '__main__':
+    # backtest.py, serve.py, ... `import trading`: when run as a script that
+    # must be this module, not a second copy with its own exchange and caches
+    sys.modules.setdefault('trading', sys.modules[__name__])
+
+from config import CONFIG, STRATEGY_PARAMS, _Lazy, ccxt, np, pd, ta
+from metrics import METRICS, instrument_exchange, start_metrics_exporters
+from cache import (
+    ANALYSIS_CACHE, CANDLES, OHLCV_COLUMNS, _is_spot_market, _ohlcv_cache_path, _timeframe_ms,
+    fetch_ohlcv_cached, load_markets_cached, ohlcv_frame, symbol_index_for,
+)
+
+# --------- دمج الطلبات المتطابقة ---------
+# Single-flight layer on top of an exchange: while a fetch_ohlcv/fetch_ticker/
+# ... call is in flight, identical calls from other threads wait for it and
+# get the same result object (treat it as read-only) instead of spending
+# rate-limit weight on a duplicate request. Applied after instrument_exchange,
+# so ccxt_calls_total only counts requests that actually went out.
+COALESCED_METHODS = ('fetch_ohlcv', 'fetch_ticker', 'fetch_tickers', 'fetch_order_book', 'load_markets', 'fetch_markets')
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers with the same key share its outcome."""
+
+    def __init__(self, venue=None):
+        self.venue = venue
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = {'done': threading.Event(), 'result': None, 'error': None}
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        METRICS.inc('singleflight_total', venue=self.venue, method=key[0], result='call' if leader else 'coalesced')
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call['done'].set()
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._inflight)}
+
+def coalesce_exchange(exchange_obj):
+    """Patch COALESCED_METHODS on an exchange instance to go through a SingleFlight."""
+    if not CONFIG.get("coalesce_requests") or getattr(exchange_obj, 'single_flight', None) is not None:
+        return exchange_obj
+    flight = SingleFlight(str(getattr(exchange_obj, 'id', '') or '').lower() or None)
+
+    def shared(method, fn):
+        def call(*args, **kwargs):
+            try:
+                key = (method, repr(args), repr(sorted(kwargs.items())))
+            except Exception:
+                return fn(*args, **kwargs)
+            return flight.do(key, lambda: fn(*args, **kwargs))
+        return call
+
+    try:
+        for method in COALESCED_METHODS:
+            fn = getattr(exchange_obj, method, None)
+            if callable(fn):
+                setattr(exchange_obj, method, shared(method, fn))
+        exchange_obj.single_flight = flight
+    except Exception as e:
+        print(f"⚠️ Request coalescing skipped: {e}")
+    return exchange_obj
+
+# --------- جدولة الطلبات حسب الأولوية ---------
+# ccxt's enableRateLimit is one FIFO queue per exchange instance, so an order
+# or a TP/SL price check waits behind every candle request of a bulk scan.
+# schedule_exchange() replaces it with the venue's shared RateBudget: each
+# call is charged its request weight in the lane of the calling thread
+# (REQUEST_LANES, highest priority first; threads default to 'scan'), 429/418
+# responses pause and slow the venue, and the used-weight headers the
+# exchange returns keep the bucket in line with what the server has counted.
+# Headers are taken from the responses of the call itself (ccxt's
+# on_rest_response hook, per thread), never from the last_response_headers
+# every pool thread writes to. The method weight pays for a call's first
+# HTTP request; further ones (load_markets fetches several endpoints) are
+# charged at ccxt's own endpoint cost, converted to the venue's weight.
+REQUEST_LANES = ('execution', 'position', 'analyze', 'scan')
+SCHEDULED_METHODS = (
+    'load_markets', 'fetch_ohlcv', 'fetch_ticker', 'fetch_tickers', 'fetch_order_book',
+    'fetch_balance', 'fetch_order', 'create_order', 'cancel_order',
+)
+# weight of the calls not covered by VENUE_OHLCV_WEIGHT/VENUE_TICKERS_WEIGHT
+VENUE_METHOD_WEIGHT = {
+    'binance': {'load_markets': 20, 'fetch_ticker': 2, 'fetch_order_book': 5, 'fetch_balance': 20, 'fetch_order': 4},
+    'binanceus': {'load_markets': 20, 'fetch_ticker': 2, 'fetch_order_book': 5, 'fetch_balance': 20, 'fetch_order': 4},
+    'binanceusdm': {'load_markets': 1, 'fetch_order_book': 5, 'fetch_balance': 5},
+    'binancecoinm': {'load_markets': 1, 'fetch_order_book': 5, 'fetch_balance': 5},
 }
-# -------------------------------------------------
+USED_WEIGHT_HEADERS = ('x-mbx-used-weight-1m', 'x-mbx-used-weight')
+RATE_BACKOFF_BASE_S = 1.0       # first 429 pause, doubled per consecutive 429
+RATE_BACKOFF_MAX_S = 60.0
+RATE_BAN_BACKOFF_S = 120.0      # 418 = IP ban; without Retry-After wait this long
+RATE_RECOVERY_PER_S = 1.0 / 60  # rate multiplier regained per second after a backoff
+
+_LANE = threading.local()
+_CALL = threading.local()       # .frame: the scheduled call running on this thread
+
+def current_lane():
+    return getattr(_LANE, 'name', 'scan')
+
+class request_lane:
+    """Context manager that runs this thread's exchange calls in a REQUEST_LANES lane."""
 
-def init_exchange():
-    params = {"apiKey": CONFIG["apiKey"], "secret": CONFIG["secret"], "enableRateLimit": True}
+    def __init__(self, name):
+        if name not in REQUEST_LANES:
+            raise ValueError(f"unknown request lane {name!r}")
+        self.name = name
+
+    def __enter__(self):
+        self.prev = getattr(_LANE, 'name', None)
+        _LANE.name = self.name
+        return self
+
+    def __exit__(self, *exc):
+        if self.prev is None:
+            del _LANE.name
+        else:
+            _LANE.name = self.prev
+        return False
+
+def in_current_lane(fn):
+    """Wrap fn to run in the caller's lane; thread pool workers otherwise default to 'scan'."""
+    lane = current_lane()
+
+    def call(*args, **kwargs):
+        with request_lane(lane):
+            return fn(*args, **kwargs)
+    return call
+
+def request_weight(venue, method, args=(), kwargs=None):
+    """Request weight of one ccxt call on a venue (1 when unknown)."""
+    if method == 'fetch_ohlcv':
+        return VENUE_OHLCV_WEIGHT.get(venue, 1)
+    if method == 'fetch_tickers':
+        symbols = args[0] if args else (kwargs or {}).get('symbols')
+        full = VENUE_TICKERS_WEIGHT.get(venue, 1)
+        return min(full, 2 * len(symbols)) if symbols else full
+    return VENUE_METHOD_WEIGHT.get(venue, {}).get(method, 1)
+
+def _header(headers, name):
+    if not headers:
+        return None
+    name = name.lower()
+    for k, v in headers.items():
+        if str(k).lower() == name:
+            return v
+    return None
+
+def _rate_limit_status(error):
+    """429 for ccxt.RateLimitExceeded, 418 for other DDoSProtection errors, else None."""
+    names = {c.__name__ for c in type(error).__mro__}
+    if 'RateLimitExceeded' in names:
+        return 429
+    if 'DDoSProtection' in names:
+        return 418
+    return None
+
+_VENUE_BUDGETS = {}
+_VENUE_BUDGETS_LOCK = threading.Lock()
+
+def venue_rate_budget(exchange_obj):
+    """One RateBudget per venue id, shared by every exchange instance of that venue."""
+    venue = str(getattr(exchange_obj, 'id', '') or '').lower()
+    with _VENUE_BUDGETS_LOCK:
+        budget = _VENUE_BUDGETS.get(venue)
+        if budget is None:
+            budget = _VENUE_BUDGETS[venue] = rate_budget_for(exchange_obj)
+        return budget
+
+def schedule_exchange(exchange_obj):
+    """Route SCHEDULED_METHODS through the venue RateBudget instead of ccxt's throttle (patched in place)."""
+    if not CONFIG.get("rate_scheduler") or getattr(exchange_obj, 'rate_budget', None) is not None:
+        return exchange_obj
+    venue = str(getattr(exchange_obj, 'id', '') or '').lower()
+    budget = venue_rate_budget(exchange_obj)
+
+    def scheduled(method, fn):
+        def call(*args, **kwargs):
+            budget.acquire(request_weight(venue, method, args, kwargs))
+            prev = getattr(_CALL, 'frame', None)
+            frame = _CALL.frame = {'exchange': exchange_obj, 'requests': 0, 'headers': None}
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                status = _rate_limit_status(e)
+                if status:
+                    budget.backoff(status, _header(frame['headers'], 'retry-after'))
+                raise
+            finally:
+                _CALL.frame = prev
+            budget.note_headers(frame['headers'])
+            return result
+        return call
+
+    def own_frame():
+        frame = getattr(_CALL, 'frame', None)
+        return frame if frame is not None and frame['exchange'] is exchange_obj else None
+
+    on_rest = getattr(exchange_obj, 'on_rest_response', None)
+    fetch2 = getattr(exchange_obj, 'fetch2', None)
+    cost_fn = getattr(exchange_obj, 'calculate_rate_limiter_cost', None)
+
+    def on_rest_response(code, reason, url, method, headers, *rest):
+        frame = own_frame()
+        if frame is not None:
+            frame['headers'] = headers
+        return on_rest(code, reason, url, method, headers, *rest)
+
+    def charged_fetch2(path, api='public', method='GET', params={}, headers=None, body=None, config={}):
+        frame = own_frame()
+        if frame is not None:
+            if frame['requests']:
+                try:
+                    # ccxt costs are in rateLimit slots; the budget counts venue weight
+                    unit = budget.limit * float(getattr(exchange_obj, 'rateLimit', 0) or 0) / 60000.0
+                    budget.acquire(max(1.0, float(cost_fn(api, method, path, params, config)) * (unit or 1.0)))
+                except Exception as e:
+                    print(f"⚠️ request cost for {path} unknown: {e}")
+            frame['requests'] += 1
+        return fetch2(path, api, method, params, headers, body, config)
+
+    try:
+        for method in SCHEDULED_METHODS:
+            fn = getattr(exchange_obj, method, None)
+            if callable(fn):
+                setattr(exchange_obj, method, scheduled(method, fn))
+        if callable(on_rest):
+            exchange_obj.on_rest_response = on_rest_response
+        if callable(fetch2) and callable(cost_fn):
+            exchange_obj.fetch2 = charged_fetch2
+        # ccxt's own FIFO throttle would put orders back behind the scan
+        exchange_obj.enableRateLimit = False
+        exchange_obj.rate_budget = budget
+    except Exception as e:
+        print(f"⚠️ Request scheduler skipped: {e}")
+    return exchange_obj
+
+def _exchange_credentials(name):
+    """API keys for a venue: <VENUE>_API_KEY/<VENUE>_API_SECRET, else API_KEY/API_SECRET for EXCHANGE."""
+    prefix = "".join(c if c.isalnum() else "_" for c in name).upper()
+    key = os.environ.get(f"{prefix}_API_KEY")
+    secret = os.environ.get(f"{prefix}_API_SECRET")
+    if key and secret:
+        return {"apiKey": key, "secret": secret}
+    if name == str(CONFIG.get("exchange") or "").strip().lower():
+        return {"apiKey": CONFIG["apiKey"], "secret": CONFIG["secret"]}
+    return {}
+
+def init_exchange(name=None):
     # allow several common aliases and try getattr on ccxt for flexibility
-    name = str(CONFIG.get("exchange") or "").strip().lower()
+    name = str(name or CONFIG.get("exchange") or "").strip().lower()
+    params = dict(_exchange_credentials(name), enableRateLimit=True)
     # common mapping: user-friendly names -> ccxt class attribute
     alias_map = {
         'binance': 'binance',
@@ -95,7 +345,7 @@ def init_exchange():
         try:
             classes = [n for n in dir(ccxt) if inspect.isclass(getattr(ccxt, n))]
             similar = [n for n in classes if cls_name.lower() in n.lower()]
-            print("[ccxt-init-debug] Failed to initialize exchange:", CONFIG.get('exchange'))
+            print("[ccxt-init-debug] Failed to initialize exchange:", name)
             print("[ccxt-init-debug] Exception:", e)
             print("[ccxt-init-debug] ccxt classes (sample):", classes[:80])
             if similar:
@@ -103,16 +353,16 @@ def init_exchange():
         except Exception:
             # best-effort diagnostic; ignore if introspection fails
             pass
-        raise RuntimeError(f"Failed to initialize exchange '{CONFIG.get('exchange')}' via ccxt: {e}")
-    raise ValueError(f"❌ Exchange غير مدعوم أو لم يتم العثور على موصِّف ccxt لَـ '{CONFIG.get('exchange')}'")
+        raise RuntimeError(f"Failed to initialize exchange '{name}' via ccxt: {e}")
+    raise ValueError(f"❌ Exchange غير مدعوم أو لم يتم العثور على موصِّف ccxt لَـ '{name}'")
 
-exchange = init_exchange()
+# private (keyed) exchange, constructed on first use
+exchange = _Lazy(lambda: coalesce_exchange(schedule_exchange(instrument_exchange(init_exchange()))))
 
 # --------- جلب البيانات ---------
 def get_ohlcv(symbol):
-    ohlcv = exchange.fetch_ohlcv(symbol, CONFIG["timeframe"], limit=CONFIG["limit"])
-    df = pd.DataFrame(ohlcv, columns=["time","open","high","low","close","volume"])
-    df["close"] = df["close"].astype(float)
+    ohlcv = fetch_ohlcv_cached(exchange, symbol, CONFIG["timeframe"], CONFIG["limit"])
+    df = ohlcv_frame(ohlcv)
     return df
 
 # --------- حساب المؤشرات ---------
@@ -147,13 +397,16 @@ def get_signal(df):
     except Exception:
         return "HOLD"
 
+    return signal_from_values(ema50, ema200, macd, macd_signal, stoch)
+
+def signal_from_values(ema50, ema200, macd, macd_signal, stoch):
     ema_bull = (ema50 is not None and ema200 is not None and ema50 > ema200)
     ema_bear = (ema50 is not None and ema200 is not None and ema50 < ema200)
     macd_bull = (macd is not None and macd_signal is not None and macd > macd_signal)
     macd_bear = (macd is not None and macd_signal is not None and macd < macd_signal)
     # Correct StochRSI logic: oversold <0.2 -> bullish, overbought >0.8 -> bearish
-    stoch_bull = (stoch is not None and stoch < 0.2)
-    stoch_bear = (stoch is not None and stoch > 0.8)
+    stoch_bull = (stoch is not None and stoch < STRATEGY_PARAMS["stoch_low"])
+    stoch_bear = (stoch is not None and stoch > STRATEGY_PARAMS["stoch_high"])
 
     if ema_bull and macd_bull and stoch_bull:
         return "BUY"
@@ -162,208 +415,1612 @@ def get_signal(df):
     else:
         return "HOLD"
 
-# --------- تنفيذ محاكاة ---------
-def simulate_trade(symbol, action, entry_price, max_wait_s=None):
-    tp = entry_price * (1 + CONFIG["tp_pct"]) if action=="BUY" else entry_price * (1 - CONFIG["tp_pct"])
-    sl = entry_price * (1 - CONFIG["sl_pct"]) if action=="BUY" else entry_price * (1 + CONFIG["sl_pct"])
+# --------- مؤشرات تراكمية ---------
+class IndicatorState:
+    """Streaming EMA50/EMA200/MACD/StochRSI/RSI/ATR over the last `window` bars.
+
+    ta seeds every recursion at the first bar of the frame it is given (ewm
+    adjust=False starts from the first value, Wilder RSI from a zero move,
+    ATR from the mean of the first 14 true ranges), so add_indicators over
+    LIMIT bars depends on where that window starts. Each bar therefore keeps
+    unseeded running sums plus the seed correction for a window that would
+    start at it; values() adds the correction stored at the window's first
+    bar to the sums at its last, which gives add_indicators' numbers for the
+    same bars in O(1) whatever LIMIT is. Updating with the timestamp of the
+    last bar replaces it, which lets the still-open candle be refreshed on
+    every poll.
+    """
+
+    WINDOW = 14
+    SLACK = 64
+    # one row per bar: ts, close, high-low, true range, running sums, then
+    # the seed corrections (close - previous sum) of the four price EMAs
+    TS, CLOSE, HL, TR, G50, G200, G12, G26, SIG, UP, DN, ATR, D50, D200, D12, D26 = range(16)
+
+    def __init__(self, window=None):
+        self.window = max(50, int(window or CONFIG["limit"]))
+        self.last_ts = None
+        self._rows = np.empty((self.window + 1 + self.SLACK, 16))
+        self._start = 0
+        self._end = 0
+
+    @property
+    def bars(self):
+        """Bars in the current window (what len(df) is for add_indicators)."""
+        return min(self._end - self._start, self.window)
+
+    def _push(self, bar):
+        ts = int(bar[0])
+        if self.last_ts is not None and ts < self.last_ts:
+            return
+        if self.last_ts is not None and ts == self.last_ts:
+            # same candle again (still open): drop it and re-apply
+            self._end -= 1
+        high, low, close = float(bar[2]), float(bar[3]), float(bar[4])
+        if self._end == self._start:
+            g50 = g200 = g12 = g26 = close
+            sig = up = dn = 0.0
+            tr = high - low
+            atr = tr / self.WINDOW
+            d50 = d200 = d12 = d26 = 0.0
+        else:
+            p = self._rows[self._end - 1]
+            pc = float(p[self.CLOSE])
+            a, r = 1.0 / self.WINDOW, 1.0 - 1.0 / self.WINDOW
+            d50, d200 = close - float(p[self.G50]), close - float(p[self.G200])
+            d12, d26 = close - float(p[self.G12]), close - float(p[self.G26])
+            g50 = float(p[self.G50]) + d50 * (2.0 / 51)
+            g200 = float(p[self.G200]) + d200 * (2.0 / 201)
+            g12 = float(p[self.G12]) + d12 * (2.0 / 13)
+            g26 = float(p[self.G26]) + d26 * (2.0 / 27)
+            sig = 0.8 * float(p[self.SIG]) + 0.2 * (g12 - g26)
+            diff = close - pc
+            up = r * float(p[self.UP]) + a * (diff if diff > 0 else 0.0)
+            dn = r * float(p[self.DN]) + a * (-diff if diff < 0 else 0.0)
+            tr = max(high - low, abs(high - pc), abs(low - pc))
+            atr = r * float(p[self.ATR]) + a * tr
+        if self._end == len(self._rows):
+            keep = self.window + 1
+            self._rows[:keep] = self._rows[self._end - keep:self._end]
+            self._start, self._end = 0, keep
+        self._rows[self._end] = (ts, close, high - low, tr, g50, g200, g12, g26, sig, up, dn, atr,
+                                 d50, d200, d12, d26)
+        self._end += 1
+        # one bar more than the window, so the last one can still be replaced
+        self._start = max(self._start, self._end - self.window - 1)
+        self.last_ts = ts
+
+    def update(self, bar):
+        """Feed one [ts, open, high, low, close, volume] bar; returns values()."""
+        self._push(bar)
+        return self.values()
+
+    def update_many(self, rows):
+        """Feed bars from a fetch; returns the values add_indicators gives for rows.
+
+        Reseeds when the stored bars don't cover rows (a gap, rows older than
+        the state, or more rows than the window keeps).
+        """
+        if rows is None or len(rows) == 0:
+            return self.values()
+        first, last = int(rows[0][0]), int(rows[-1][0])
+        if len(rows) > self.window:
+            self.window = len(rows)
+            self._rows = np.empty((self.window + 1 + self.SLACK, 16))
+            self.reset()
+        if (self.last_ts is None or first > self.last_ts or last < self.last_ts
+                or int(self._rows[self._start, self.TS]) > first):
+            self.reset()
+        for bar in rows:
+            if self.last_ts is None or int(bar[0]) >= self.last_ts:
+                self._push(bar)
+        return self.values(len(rows))
+
+    def reset(self):
+        self.last_ts = None
+        self._start = self._end = 0
+
+    def values(self, window=None):
+        """Indicators of the last bar over the last `window` bars (default: self.window)."""
+        n = self._end - self._start
+        if n == 0:
+            return {}
+        w = min(n, self.window if window is None else int(window))
+        rows = self._rows[self._end - w:self._end]
+        first, last = rows[0], rows[-1]
+        i = w - 1
+        r50, r200, r12, r26, r9 = 49.0 / 51, 199.0 / 201, 11.0 / 13, 25.0 / 27, 0.8
+        out = {
+            'time': int(last[self.TS]), 'close': float(last[self.CLOSE]),
+            'EMA50': None, 'EMA200': None, 'MACD': None, 'MACD_signal': None,
+            'StochRSI': None, 'RSI': None, 'ATR': None,
+        }
+        if i >= 49:
+            out['EMA50'] = float(last[self.G50] + r50 ** w * first[self.D50])
+        if i >= 199:
+            out['EMA200'] = float(last[self.G200] + r200 ** w * first[self.D200])
+        d12, d26 = float(first[self.D12]), float(first[self.D26])
+        if i >= 25:
+            out['MACD'] = float(last[self.G12] - last[self.G26] + r12 ** w * d12 - r26 ** w * d26)
+        if i >= 33:
+            # ta seeds the signal EMA with the first MACD value, at bar 25
+            k0 = rows[25]
+            j = i - 25
+            m0 = float(k0[self.G12] - k0[self.G26]) + r12 ** 26 * d12 - r26 ** 26 * d26
+            tail = (d12 * r12 ** 27 * (r12 ** j - r9 ** j) / (r12 - r9)
+                    - d26 * r26 ** 27 * (r26 ** j - r9 ** j) / (r26 - r9))
+            out['MACD_signal'] = float(last[self.SIG] + r9 ** j * (m0 - k0[self.SIG]) + 0.2 * tail)
+        n14 = self.WINDOW
+        r = 1.0 - 1.0 / n14
+        if i >= n14 - 1:
+            js = np.arange(max(n14 - 1, i - n14 + 1), i + 1)
+            decay = r ** js
+            up = rows[js, self.UP] - decay * first[self.UP]
+            dn = rows[js, self.DN] - decay * first[self.DN]
+            # a window without down (up) moves must give exactly 0, not rounding noise
+            dn[dn <= 1e-10 * decay * first[self.DN]] = 0.0
+            up[up <= 1e-10 * decay * first[self.UP]] = 0.0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rsi = np.where(dn == 0, 100.0, 100.0 - 100.0 / (1.0 + up / dn))
+            out['RSI'] = float(rsi[-1])
+            if len(rsi) == n14:
+                mn, mx = float(rsi.min()), float(rsi.max())
+                if mx - mn > 1e-9:
+                    out['StochRSI'] = (float(rsi[-1]) - mn) / (mx - mn)
+            # ATR starts from the mean of the first 14 true ranges, the first
+            # one being high-low since ta has no previous close there
+            seed = (float(rows[:n14, self.TR].sum()) - float(first[self.TR]) + float(first[self.HL])) / n14
+            out['ATR'] = float(last[self.ATR] + r ** (i - n14 + 1) * (seed - rows[n14 - 1, self.ATR]))
+        return out
+
+    def to_dict(self):
+        return {'window': self.window, 'last_ts': self.last_ts,
+                'rows': self._rows[self._start:self._end].tolist()}
+
+    @classmethod
+    def from_dict(cls, d, window=None):
+        obj = cls(window or d.get('window'))
+        rows = d.get('rows')
+        if rows:
+            # states saved before the windowed format have no rows: reseed
+            rows = np.asarray(rows, dtype=np.float64)[-(obj.window + 1):]
+            obj._rows[:len(rows)] = rows
+            obj._end = len(rows)
+            obj.last_ts = int(rows[-1][cls.TS])
+        return obj
+
+    def save(self, path):
+        import json
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as fh:
+            json.dump(self.to_dict(), fh)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, window=None):
+        import json
+        with open(path) as fh:
+            return cls.from_dict(json.load(fh), window)
+
+_INDICATOR_STATES = {}
+_INDICATOR_STATES_LOCK = threading.Lock()
+
+def _indicator_state_path(exchange_obj, symbol, timeframe):
+    return _ohlcv_cache_path(exchange_obj, symbol, timeframe)[:-len(".npy")] + ".ind.json"
 
-    print(f"\n🔍 محاكاة {action} على {symbol} @ {entry_price:.8f} | TP={tp:.8f}, SL={sl:.8f}")
+def indicator_state_for(exchange_obj, symbol, timeframe):
+    """Return the in-memory IndicatorState for a venue/symbol/timeframe.
 
-    start = time.time()
-    max_wait_s = max_wait_s if max_wait_s is not None else CONFIG.get("simulate_max_wait_s")
-    while True:
+    On first use it is restored from disk next to the OHLCV cache when present.
+    """
+    key = (str(getattr(exchange_obj, 'id', '') or '').lower(), symbol, timeframe)
+    with _INDICATOR_STATES_LOCK:
+        st = _INDICATOR_STATES.get(key)
+        if st is None:
+            st = IndicatorState(CONFIG["limit"])
+            path = _indicator_state_path(exchange_obj, symbol, timeframe)
+            if CONFIG.get("ohlcv_cache") and os.path.exists(path):
+                try:
+                    st = IndicatorState.load(path, CONFIG["limit"])
+                except Exception:
+                    st = IndicatorState(CONFIG["limit"])
+            _INDICATOR_STATES[key] = st
+        return st
+
+def save_indicator_states(exchange_obj):
+    """Persist every in-memory IndicatorState for a venue next to its OHLCV cache."""
+    venue = str(getattr(exchange_obj, 'id', '') or '').lower()
+    with _INDICATOR_STATES_LOCK:
+        items = [(k, v) for k, v in _INDICATOR_STATES.items() if k[0] == venue]
+    for (_, symbol, timeframe), st in items:
         try:
-            ticker = exchange.fetch_ticker(symbol)
-            price = float(ticker.get("last") or ticker.get("close") or 0)
+            st.save(_indicator_state_path(exchange_obj, symbol, timeframe))
         except Exception as e:
-            print(f"⚠️ Failed to fetch ticker for {symbol}: {e}")
-            price = None
-        if price is not None:
-            if action=="BUY":
-                if price >= tp:
-                    print(f"✅ الصفقة نجحت (TP Hit) {symbol} @ {price:.8f}")
-                    return True
-                elif price <= sl:
-                    print(f"❌ الصفقة فشلت (SL Hit) {symbol} @ {price:.8f}")
-                    return False
-            else:  # SELL
-                if price <= tp:
-                    print(f"✅ الصفقة نجحت (TP Hit) {symbol} @ {price:.8f}")
-                    return True
-                elif price >= sl:
-                    print(f"❌ الصفقة فشلت (SL Hit) {symbol} @ {price:.8f}")
+            print(f"⚠️ Failed to save indicator state for {symbol}: {e}")
+
+# --------- مؤشرات مصفوفية (عدة رموز) ---------
+# Batched version of add_indicators/get_signal over a (symbols x bars) matrix.
+# Rows are right-aligned (latest bar in the last column) and left-padded with
+# NaN when a symbol has fewer bars. Recurrences run once per bar column and are
+# vectorized across all symbols, so pandas/ta per-call overhead is paid once
+# per universe instead of once per symbol.
+def ohlcv_matrix(arrays, bars=None):
+    """Stack per-symbol (n, 6) OHLCV arrays into a dict of (symbols, bars) matrices."""
+    bars = int(bars or max([len(a) for a in arrays] or [0]))
+    out = {col: np.full((len(arrays), bars), np.nan) for col in OHLCV_COLUMNS}
+    for i, arr in enumerate(arrays):
+        arr = np.asarray(arr, dtype=np.float64).reshape(-1, 6)[-bars:]
+        if len(arr) == 0:
+            continue
+        for j, col in enumerate(OHLCV_COLUMNS):
+            out[col][i, bars - len(arr):] = arr[:, j]
+    return out
+
+def _ema_matrix(x, alpha, min_periods):
+    out = np.full(x.shape, np.nan)
+    state = np.full(x.shape[0], np.nan)
+    count = np.zeros(x.shape[0])
+    for t in range(x.shape[1]):
+        xt = x[:, t]
+        valid = ~np.isnan(xt)
+        state = np.where(valid, np.where(np.isnan(state), xt, alpha * xt + (1 - alpha) * state), state)
+        count += valid
+        out[:, t] = np.where(count >= min_periods, state, np.nan)
+    return out
+
+def _rolling_matrix(x, window, fn):
+    out = np.full(x.shape, np.nan)
+    if x.shape[1] >= window:
+        view = np.lib.stride_tricks.sliding_window_view(x, window, axis=1)
+        out[:, window - 1:] = fn(view, axis=-1)
+    return out
+
+def add_indicators_matrix(high, low, close, window=14):
+    """Compute EMA50/EMA200/MACD/MACD_signal/RSI/StochRSI/ATR for every row.
+
+    Same formulas as add_indicators (ta) and IndicatorState; returns a dict of
+    (symbols, bars) arrays with NaN where a value is not yet defined.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    bars = close.shape[1]
+    ema50 = _ema_matrix(close, 2.0 / 51, 50)
+    ema200 = _ema_matrix(close, 2.0 / 201, 200)
+    macd = _ema_matrix(close, 2.0 / 13, 12) - _ema_matrix(close, 2.0 / 27, 26)
+    macd_signal = _ema_matrix(macd, 2.0 / 10, 9)
+
+    prev_close = np.concatenate([np.full((close.shape[0], 1), np.nan), close[:, :-1]], axis=1)
+    # first bar of each row has no previous close: ta treats its change as 0
+    diff = np.where(np.isnan(close), np.nan, np.nan_to_num(close - prev_close, nan=0.0))
+    up = _ema_matrix(np.where(diff > 0, diff, np.where(np.isnan(diff), np.nan, 0.0)), 1.0 / window, window)
+    dn = _ema_matrix(np.where(diff < 0, -diff, np.where(np.isnan(diff), np.nan, 0.0)), 1.0 / window, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(dn == 0, 100.0, 100.0 - (100.0 / (1.0 + up / dn)))
+        rsi = np.where(np.isnan(up) | np.isnan(dn), np.nan, rsi)
+        lo = _rolling_matrix(rsi, window, np.min)
+        hi = _rolling_matrix(rsi, window, np.max)
+        stoch = np.where(hi != lo, (rsi - lo) / (hi - lo), np.nan)
+
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    atr = np.full(close.shape, np.nan)
+    state = np.zeros(close.shape[0])
+    count = np.zeros(close.shape[0])
+    for t in range(bars):
+        trt = tr[:, t]
+        valid = ~np.isnan(trt)
+        count += valid
+        warm = valid & (count <= window)
+        state = np.where(warm, state + np.nan_to_num(trt), state)
+        state = np.where(valid & (count == window), state / window, state)
+        state = np.where(valid & (count > window), (state * (window - 1) + np.nan_to_num(trt)) / window, state)
+        atr[:, t] = np.where(count >= window, state, np.nan)
+
+    return {
+        'EMA50': ema50,
+        'EMA200': ema200,
+        'MACD': macd,
+        'MACD_signal': macd_signal,
+        'RSI': rsi,
+        'StochRSI': stoch,
+        'ATR': atr,
+    }
+
+def signal_codes_matrix(ind, stoch_low=None, stoch_high=None):
+    """get_signal's rule at every bar: +1 = BUY, -1 = SELL, 0 = HOLD."""
+    stoch_low = STRATEGY_PARAMS["stoch_low"] if stoch_low is None else stoch_low
+    stoch_high = STRATEGY_PARAMS["stoch_high"] if stoch_high is None else stoch_high
+    ema50, ema200 = ind['EMA50'], ind['EMA200']
+    macd, macd_signal = ind['MACD'], ind['MACD_signal']
+    stoch = ind['StochRSI']
+    # NaN compares False everywhere, which is get_signal's "missing" behaviour
+    buy = (ema50 > ema200) & (macd > macd_signal) & (stoch < stoch_low)
+    sell = (ema50 < ema200) & (macd < macd_signal) & (stoch > stoch_high)
+    return buy.astype(np.int8) - sell.astype(np.int8)
+
+def get_signal_matrix(ind, col=-1):
+    """Evaluate get_signal's BUY/SELL/HOLD rule for every row at one bar column."""
+    codes = signal_codes_matrix({k: v[:, col:col + 1 or None] for k, v in ind.items()})[:, 0]
+    return np.where(codes > 0, "BUY", np.where(codes < 0, "SELL", "HOLD"))
+
+# --------- تنفيذ محاكاة ---------
+def simulate_trade(symbol, action, entry_price, max_wait_s=None):
+    """Block until TP (True), SL or timeout (False) for one simulated trade.
+
+    The position is watched on the exchange's shared PriceFeed, so several
+    simulate_trade calls in parallel still cost one fetch_tickers per interval.
+    """
+    tracker = PositionTracker(exchange, max_wait_s=max_wait_s).start()
+    try:
+        pos = tracker.open(symbol, action, entry_price)
+        tracker.wait()
+    finally:
+        tracker.stop()
+    return pos['status'] == 'tp'
+
+# --------- متابعة الصفقات المفتوحة ---------
+def _ticker_price(ticker):
+    try:
+        return float((ticker or {}).get("last") or (ticker or {}).get("close") or 0) or None
+    except Exception:
+        return None
+
+class PositionTracker:
+    """Watch every open simulated trade at once instead of blocking per trade.
+
+    Each position is a dict (symbol, action, entry, tp, sl, status, ...).
+    Once started, the open symbols are watched on the exchange's shared
+    PriceFeed, which polls them with the other consumers' symbols in one
+    fetch_tickers call per interval; streaming sources can push prices
+    directly with on_tick({symbol: price}). When TP, SL or the timeout is
+    reached the position is closed and on_close(position) is called.
+    """
+
+    def __init__(self, exchange_obj=None, poll_interval_s=None, max_wait_s=None, on_close=None, feed=None):
+        self.exchange = exchange_obj
+        self.poll_interval_s = poll_interval_s if poll_interval_s is not None else CONFIG.get("poll_interval_s", 10)
+        self.max_wait_s = max_wait_s if max_wait_s is not None else CONFIG.get("simulate_max_wait_s")
+        self.on_close = on_close
+        if feed is None:
+            ex = exchange_obj if exchange_obj is not None else exchange
+            shared = price_feed_for(ex)
+            # a custom interval gets its own poller on the venue's price cache
+            feed = shared if poll_interval_s is None else PriceFeed(ex, poll_interval_s, prices=shared.prices)
+        self.feed = feed
+        self.positions = {}
+        self.closed = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._started = False
+
+    def open(self, symbol, action, entry_price):
+        tp = entry_price * (1 + CONFIG["tp_pct"]) if action=="BUY" else entry_price * (1 - CONFIG["tp_pct"])
+        sl = entry_price * (1 - CONFIG["sl_pct"]) if action=="BUY" else entry_price * (1 + CONFIG["sl_pct"])
+        print(f"\n🔍 محاكاة {action} على {symbol} @ {entry_price:.8f} | TP={tp:.8f}, SL={sl:.8f}")
+        with self._lock:
+            pos = {
+                'id': self._next_id,
+                'symbol': symbol,
+                'action': action,
+                'entry': entry_price,
+                'tp': tp,
+                'sl': sl,
+                'opened_at': time.time(),
+                'status': 'open',
+                'exit_price': None,
+                'closed_at': None,
+            }
+            self._next_id += 1
+            self.positions[pos['id']] = pos
+            self._changed.notify_all()
+        self._watch()
+        return pos
+
+    def open_symbols(self):
+        with self._lock:
+            return sorted({p['symbol'] for p in self.positions.values()})
+
+    def _watch(self):
+        if self._started:
+            self.feed.watch(self, self.open_symbols())
+
+    def on_tick(self, prices):
+        """Check TP/SL for every open position against a {symbol: price} map."""
+        done = []
+        now = time.time()
+        self.feed.prices.update(prices, now)
+        with self._lock:
+            for pid, pos in list(self.positions.items()):
+                price = prices.get(pos['symbol'])
+                status = None
+                if price is not None:
+                    if pos['action'] == "BUY":
+                        if price >= pos['tp']: status = 'tp'
+                        elif price <= pos['sl']: status = 'sl'
+                    else:  # SELL
+                        if price <= pos['tp']: status = 'tp'
+                        elif price >= pos['sl']: status = 'sl'
+                if status is None and self.max_wait_s and (now - pos['opened_at']) > self.max_wait_s:
+                    status = 'timeout'
+                if status is not None:
+                    pos.update({'status': status, 'exit_price': price, 'closed_at': now})
+                    del self.positions[pid]
+                    self.closed.append(pos)
+                    done.append(pos)
+            if done:
+                self._changed.notify_all()
+        if done:
+            self._watch()
+        for pos in done:
+            symbol, price = pos['symbol'], pos['exit_price']
+            if pos['status'] == 'tp':
+                print(f"✅ الصفقة نجحت (TP Hit) {symbol} @ {price:.8f}")
+            elif pos['status'] == 'sl':
+                print(f"❌ الصفقة فشلت (SL Hit) {symbol} @ {price:.8f}")
+            else:
+                print(f"⏱️ انتهاء المهلة لمحاكاة الصفقة على {symbol} بعد {self.max_wait_s} ثانية")
+            if self.on_close:
+                try:
+                    self.on_close(pos)
+                except Exception as e:
+                    print(f"⚠️ on_close failed for {symbol}: {e}")
+        return done
+
+    def fetch_prices(self, symbols):
+        with request_lane('position'):
+            return self.feed.fetch(symbols)
+
+    def poll_once(self):
+        return self.on_tick(self.fetch_prices(self.open_symbols()))
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            self.feed.subscribe(self.on_tick)
+            self._watch()
+        return self
+
+    def stop(self):
+        if self._started:
+            self._started = False
+            self.feed.unwatch(self)
+            self.feed.unsubscribe(self.on_tick)
+        with self._lock:
+            self._changed.notify_all()
+
+    def wait(self, timeout=None):
+        """Block until no positions are open; returns False on timeout."""
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._lock:
+            while self.positions:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
                     return False
-        if max_wait_s and (time.time() - start) > max_wait_s:
-            print(f"⏱️ انتهاء المهلة لمحاكاة الصفقة على {symbol} بعد {max_wait_s} ثانية")
-            return False
-        time.sleep(CONFIG.get("poll_interval_s", 10))  # تحديث دوري
+                self._changed.wait(remaining if remaining is not None else 1.0)
+        return True
 
 # --------- تنفيذ أمر حقيقي ---------
-def place_real_order(symbol, action, usdt_size):
-    if CONFIG["dry_run"]:
-        print(f"[DRY RUN] 🚀 تنفيذ {action} حقيقي على {symbol} بمبلغ {usdt_size} USDT")
-        return None
-    try:
-        ticker = exchange.fetch_ticker(symbol)
-        price = float(ticker.get("last") or ticker.get("close") or 0)
-        if price <= 0:
-            raise ValueError("Invalid ticker price")
+# Orders go through OrderExecutor: lot size, min-notional and precision rules
+# are indexed per symbol when markets load, the price is the latest one seen
+# by the price feed/stream/prefilter (the venue's PriceCache, PRICES for
+# EXCHANGE) when it is fresh enough, and the amount is truncated with ccxt's
+# amount_to_precision, which understands every precisionMode
+# (round(amount, prec) breaks on tick-size markets).
+class PriceCache:
+    """Latest price per symbol and when it was seen."""
+
+    def __init__(self):
+        self._prices = {}
+        self._lock = threading.Lock()
+
+    def update(self, prices, ts=None):
+        ts = ts or time.time()
+        with self._lock:
+            for sym, price in prices.items():
+                if price:
+                    self._prices[sym] = (float(price), ts)
+
+    def get(self, symbol, max_age_s=None):
+        hit = self._prices.get(symbol)
+        if hit is None or (max_age_s is not None and time.time() - hit[1] > max_age_s):
+            return None
+        return hit[0]
+
+PRICES = PriceCache()
+
+class OrderRejected(ValueError):
+    pass
+
+def _market_rules(market, precision_mode=None):
+    """Pre-compute the numbers an order check needs from a ccxt market."""
+    limits = market.get('limits') or {}
+    lot = limits.get('market') or {}
+    amount_limits = limits.get('amount') or {}
+    precision = market.get('precision') or {}
+    step = precision.get('amount')
+    # ccxt precisionMode: 2 = DECIMAL_PLACES, 3 = SIGNIFICANT_DIGITS, 4 = TICK_SIZE
+    if step is not None and precision_mode == 2:
+        step = 10.0 ** -float(step)
+    elif precision_mode == 3:
+        step = None
+    return {
+        'amount_step': float(step) if step else None,
+        'min_amount': lot.get('min') or amount_limits.get('min'),
+        'max_amount': lot.get('max') or amount_limits.get('max'),
+        'min_cost': (limits.get('cost') or {}).get('min'),
+        'base': market.get('base'),
+        'spot': _is_spot_market(market),
+    }
+
+def _floor_to_step(value, step):
+    from decimal import Decimal, ROUND_FLOOR
+    d = Decimal(repr(step))
+    return float((Decimal(repr(value)) / d).to_integral_value(ROUND_FLOOR) * d)
+
+class OrderExecutor:
+    """Validate and submit market orders with rules and prices already in memory."""
+
+    def __init__(self, exchange_obj=None, prices=None, max_price_age_s=None, feed=None):
+        self.exchange = exchange_obj if exchange_obj is not None else exchange
+        self.feed = feed if feed is not None else price_feed_for(self.exchange)
+        self.prices = prices if prices is not None else self.feed.prices
+        self.max_price_age_s = CONFIG.get("order_price_max_age_s") if max_price_age_s is None else max_price_age_s
+        self.rules = {}
+        self._markets = None
+        self._lock = threading.Lock()
+
+    def warm(self, markets=None):
+        """Index order rules for every market (no-op if these markets are already indexed)."""
+        markets = markets if markets is not None else load_markets_cached(self.exchange)
+        if markets is self._markets:
+            return self
+        mode = getattr(self.exchange, 'precisionMode', None)
+        rules = {sym: _market_rules(m or {}, mode) for sym, m in (markets or {}).items()}
+        with self._lock:
+            self.rules, self._markets = rules, markets
+        return self
+
+    def price(self, symbol):
+        price = self.prices.get(symbol, self.max_price_age_s)
+        if price is None:
+            METRICS.inc('order_price_fetch_total')
+            price = self.feed.price(symbol, self.max_price_age_s)
+            if not price:
+                raise OrderRejected("invalid ticker price")
+            self.prices.update({symbol: price})
+        return price
+
+    def free_balance(self, currency):
+        """Free amount of one currency on the account (one fetch_balance call)."""
+        balance = self.exchange.fetch_balance() or {}
+        free = (balance.get('free') or {}).get(currency)
+        if free is None:
+            free = (balance.get(currency) or {}).get('free')
+        return float(free or 0.0)
+
+    def prepare(self, symbol, action, usdt_size, price=None):
+        """Return (amount, price) for a market order of usdt_size, or raise OrderRejected.
+
+        A spot SELL must be covered by the free base balance (not checked in
+        dry run, where nothing is held); min-notional applies to the rounded
+        amount on both sides.
+        """
+        if action not in ("BUY", "SELL"):
+            raise OrderRejected(f"unknown side {action}")
+        if symbol not in self.rules:
+            self.warm()
+        r = self.rules.get(symbol)
+        if r is None:
+            raise OrderRejected(f"unknown market {symbol}")
+        price = float(price or self.price(symbol))
         amount = usdt_size / price
-        # apply exchange precision if available
-        market = exchange.markets.get(symbol) if hasattr(exchange, 'markets') else None
-        if market and 'precision' in market and 'amount' in market['precision']:
-            prec = market['precision']['amount']
-            amount = float(round(amount, prec))
-        if action == "BUY":
-            order = exchange.create_market_buy_order(symbol, amount)
+        try:
+            amount = float(self.exchange.amount_to_precision(symbol, amount))
+        except Exception:
+            if r['amount_step']:
+                amount = _floor_to_step(amount, r['amount_step'])
+        if amount <= 0 or (r['min_amount'] and amount < r['min_amount']):
+            raise OrderRejected(f"amount {amount} below lot size {r['min_amount']}")
+        if r['max_amount'] and amount > r['max_amount']:
+            raise OrderRejected(f"amount {amount} above lot size {r['max_amount']}")
+        notional = amount * price
+        if r['min_cost'] and notional < r['min_cost']:
+            side = "buy cost" if action == "BUY" else "sell proceeds"
+            raise OrderRejected(f"{side} {notional:.8f} below minimum notional {r['min_cost']}")
+        # last: the balance check is the only one that costs a request
+        if action == "SELL" and r['spot'] and r['base'] and not CONFIG["dry_run"]:
+            held = self.free_balance(r['base'])
+            if held < amount:
+                raise OrderRejected(f"insufficient {r['base']}: {held} free, {amount} to sell")
+        return amount, price
+
+    def execute(self, symbol, action, usdt_size, signal_ts=None, price=None):
+        """Validate and submit in one step; signal_ts (epoch seconds) is used for the latency log."""
+        with request_lane('execution'):
+            try:
+                amount, price = self.prepare(symbol, action, usdt_size, price)
+            except Exception as e:
+                METRICS.inc('orders_rejected_total')
+                print(f"❌ Failed to place real order for {symbol}: {e}")
+                return None
+            if CONFIG["dry_run"]:
+                order = None
+                print(f"[DRY RUN] 🚀 تنفيذ {action} حقيقي على {symbol} بمبلغ {usdt_size} USDT (amount={amount} @ {price})")
+            else:
+                try:
+                    if action == "BUY":
+                        order = self.exchange.create_market_buy_order(symbol, amount)
+                    else:
+                        order = self.exchange.create_market_sell_order(symbol, amount)
+                except Exception as e:
+                    METRICS.inc('orders_failed_total')
+                    print(f"❌ Failed to place real order for {symbol}: {e}")
+                    return None
+                METRICS.inc('orders_submitted_total', side=action)
+                print(f"🚀 تم تنفيذ {action} فعلي: {order}")
+            if signal_ts:
+                latency = time.time() - signal_ts
+                METRICS.observe('signal_to_order_seconds', latency)
+                print(f"⏱️ {symbol} signal→order {latency * 1000:.1f} ms")
+            return order
+
+_ORDER_EXECUTOR = None
+_ORDER_EXECUTOR_LOCK = threading.Lock()
+
+def order_executor():
+    """The OrderExecutor for the private exchange, created on first use."""
+    global _ORDER_EXECUTOR
+    if _ORDER_EXECUTOR is None or _ORDER_EXECUTOR.exchange is not exchange:
+        with _ORDER_EXECUTOR_LOCK:
+            if _ORDER_EXECUTOR is None or _ORDER_EXECUTOR.exchange is not exchange:
+                _ORDER_EXECUTOR = OrderExecutor(exchange)
+    return _ORDER_EXECUTOR
+
+def place_real_order(symbol, action, usdt_size, signal_ts=None, price=None):
+    return order_executor().execute(symbol, action, usdt_size, signal_ts=signal_ts, price=price)
+
+# --------- تغذية الأسعار المشتركة ---------
+# One PriceFeed per exchange polls tickers for every symbol any consumer is
+# watching: one fetch_tickers call per interval (or PRICE_FEED_BATCH-sized
+# chunks) instead of one request per tracker or per symbol. Each poll lands
+# in the venue's PriceCache (PRICES for EXCHANGE) and is passed to every
+# subscriber; OrderExecutor reads the cache and only asks the feed for a
+# refresh when its price is stale.
+_VENUE_PRICES = {}
+_VENUE_PRICES_LOCK = threading.Lock()
+
+def venue_prices(venue):
+    """The PriceCache for a venue; PRICES is the one for EXCHANGE."""
+    venue = str(venue or CONFIG.get("exchange") or "").strip().lower()
+    if venue == str(CONFIG.get("exchange") or "").strip().lower():
+        return PRICES
+    with _VENUE_PRICES_LOCK:
+        return _VENUE_PRICES.setdefault(venue, PriceCache())
+
+class PriceFeed:
+    """Bulk ticker polling for the union of symbols watched by its consumers.
+
+    watch(owner, symbols) replaces one consumer's symbol set, subscribe(fn)
+    registers fn({symbol: price}) to be called after every poll. The
+    background thread runs while anything is watched.
+    """
+
+    def __init__(self, exchange_obj=None, interval_s=None, prices=None, batch=None):
+        self.exchange = exchange_obj if exchange_obj is not None else exchange
+        self.venue = str(getattr(self.exchange, 'id', '') or '').lower() or None
+        self.interval_s = interval_s if interval_s is not None else CONFIG.get("poll_interval_s", 10)
+        self.prices = prices if prices is not None else venue_prices(self.venue)
+        self.batch = int(CONFIG.get("price_feed_batch") or 0) if batch is None else batch
+        self._watched = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, owner, symbols):
+        symbols = set(symbols or ())
+        with self._lock:
+            if symbols:
+                self._watched[id(owner)] = symbols
+            else:
+                self._watched.pop(id(owner), None)
+            self._changed.notify_all()
+        if symbols:
+            self.start()
+
+    def unwatch(self, owner):
+        self.watch(owner, ())
+
+    def symbols(self):
+        with self._lock:
+            return sorted(set().union(*self._watched.values())) if self._watched else []
+
+    def subscribe(self, fn):
+        with self._lock:
+            if fn not in self._subscribers:
+                self._subscribers.append(fn)
+
+    def unsubscribe(self, fn):
+        with self._lock:
+            if fn in self._subscribers:
+                self._subscribers.remove(fn)
+
+    def fetch(self, symbols):
+        """{symbol: price} for symbols: fetch_tickers per batch, fetch_ticker per symbol as fallback."""
+        prices = {}
+        if not symbols:
+            return prices
+        ex = self.exchange
+        symbols = list(symbols)
+        size = self.batch if self.batch > 0 else len(symbols)
+        missing = []
+        if (getattr(ex, 'has', {}) or {}).get('fetchTickers'):
+            for i in range(0, len(symbols), size):
+                chunk = symbols[i:i + size]
+                METRICS.inc('price_feed_requests_total', venue=self.venue, method='fetch_tickers')
+                try:
+                    tickers = ex.fetch_tickers(chunk)
+                except Exception as e:
+                    print(f"⚠️ Failed to fetch tickers: {e}")
+                    missing.extend(chunk)
+                    continue
+                for sym in chunk:
+                    price = _ticker_price(tickers.get(sym))
+                    if price is not None:
+                        prices[sym] = price
         else:
-            order = exchange.create_market_sell_order(symbol, amount)
-        print(f"🚀 تم تنفيذ {action} فعلي: {order}")
-        return order
+            missing = symbols
+        # venue without (working) bulk tickers: one request per symbol
+        for sym in missing:
+            METRICS.inc('price_feed_requests_total', venue=self.venue, method='fetch_ticker')
+            try:
+                price = _ticker_price(ex.fetch_ticker(sym))
+                if price is not None:
+                    prices[sym] = price
+            except Exception as e:
+                print(f"⚠️ Failed to fetch ticker for {sym}: {e}")
+        self.prices.update(prices)
+        return prices
+
+    def publish(self, prices):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for fn in subscribers:
+            try:
+                fn(prices)
+            except Exception as e:
+                print(f"⚠️ Price subscriber failed: {e}")
+
+    def poll_once(self, extra=()):
+        """Fetch every watched symbol (plus extra) once and publish the result."""
+        symbols = sorted(set(self.symbols()).union(extra))
+        METRICS.inc('price_feed_polls_total', venue=self.venue)
+        prices = self.fetch(symbols)
+        self.publish(prices)
+        return prices
+
+    def price(self, symbol, max_age_s=None):
+        """Cached price if fresh enough, else refreshed now in the caller's request lane."""
+        price = self.prices.get(symbol, max_age_s)
+        if price is None:
+            prices = self.fetch([symbol])
+            self.publish(prices)
+            price = prices.get(symbol)
+        return price
+
+    def _run(self):
+        with request_lane('position'):
+            while not self._stop.is_set():
+                with self._lock:
+                    while not self._watched and not self._stop.is_set():
+                        self._changed.wait(1.0)
+                if self._stop.is_set():
+                    return
+                self.poll_once()
+                self._stop.wait(self.interval_s)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name=f"price-feed-{self.venue}", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+_PRICE_FEEDS_LOCK = threading.Lock()
+
+def price_feed_for(exchange_obj=None):
+    """The shared PriceFeed of an exchange instance, created on first use."""
+    ex = exchange_obj if exchange_obj is not None else exchange
+    feed = getattr(ex, 'price_feed', None)
+    if feed is None:
+        with _PRICE_FEEDS_LOCK:
+            feed = getattr(ex, 'price_feed', None)
+            if feed is None:
+                feed = PriceFeed(ex)
+                ex.price_feed = feed
+    return feed
+
+# --------- ميزانية معدل الطلبات ---------
+# Request weight each venue allows per minute, and the weight of one
+# fetch_ohlcv(limit<=500) call. Values follow the exchanges' published limits;
+# unknown venues fall back to ccxt's rateLimit (ms between requests).
+VENUE_WEIGHT_PER_MIN = {
+    'binance': 6000,
+    'binanceus': 1200,
+    'binanceusdm': 2400,
+    'binancecoinm': 2400,
+    'mexc': 1200,
+    'bybit': 600,
+}
+VENUE_TICKERS_WEIGHT = {
+    'binance': 80,
+    'binanceus': 80,
+    'binanceusdm': 40,
+    'binancecoinm': 40,
+}
+VENUE_OHLCV_WEIGHT = {
+    'binance': 2,
+    'binanceus': 2,
+    'binanceusdm': 2,
+    'binancecoinm': 2,
+}
+
+class RateBudget:
+    """Thread-safe token bucket measured in request weight per minute.
+
+    Workers call acquire(weight) before each request; it blocks until the
+    bucket has enough weight, so a parallel scan never exceeds the budget
+    no matter how many threads are running. Waiters are served in
+    REQUEST_LANES order, and the execution/position lanes may also spend
+    the headroom above the scan capacity. backoff() and note_headers()
+    adapt the bucket to 429/418 responses and the venue's used-weight count.
+    """
+
+    def __init__(self, weight_per_min, headroom=0.8, name=None):
+        self.limit = max(1.0, float(weight_per_min))
+        self.capacity = max(1.0, self.limit * headroom)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.name = name
+        self.scale = 1.0            # refill multiplier, cut on 429/418
+        self.paused_until = 0.0
+        self.strikes = 0
+        self.used_weight = None     # last used-weight header value
+        self.waiting = dict.fromkeys(REQUEST_LANES, 0)
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.scale = min(1.0, self.scale + elapsed * RATE_RECOVERY_PER_S)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate * self.scale)
+        self.updated = now
+
+    def acquire(self, weight=1, lane=None):
+        lane = lane if lane in self.waiting else current_lane()
+        rank = REQUEST_LANES.index(lane)
+        weight = min(float(weight), self.capacity)
+        floor = self.capacity - self.limit if rank < 2 else 0.0
+        t0 = None
+        with self.cond:
+            self.waiting[lane] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self.paused_until:
+                        wait = self.paused_until - now
+                    elif any(self.waiting[l] for l in REQUEST_LANES[:rank]):
+                        wait = 1.0      # woken by notify_all when the higher lane is served
+                    elif self.tokens - weight >= floor:
+                        self.tokens -= weight
+                        break
+                    else:
+                        wait = (weight + floor - self.tokens) / (self.rate * self.scale)
+                    if t0 is None:
+                        t0 = now
+                    self.cond.wait(wait)
+            finally:
+                self.waiting[lane] -= 1
+                self.cond.notify_all()
+        METRICS.inc('rate_budget_weight_total', weight, venue=self.name, lane=lane)
+        if t0 is not None:
+            METRICS.inc('rate_budget_waits_total', venue=self.name, lane=lane)
+            METRICS.inc('rate_budget_wait_seconds_total', time.monotonic() - t0, venue=self.name, lane=lane)
+
+    def backoff(self, status, retry_after=None):
+        """Pause every lane after a 429/418 and halve the refill rate."""
+        with self.cond:
+            self.strikes += 1
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = RATE_BAN_BACKOFF_S if status == 418 else min(
+                    RATE_BACKOFF_MAX_S, RATE_BACKOFF_BASE_S * 2 ** (self.strikes - 1))
+            now = time.monotonic()
+            self._refill(now)
+            self.paused_until = max(self.paused_until, now + delay)
+            self.scale = max(0.1, self.scale * 0.5)
+            self.tokens = min(self.tokens, 0.0)
+        METRICS.inc('rate_limit_backoffs_total', venue=self.name, status=status)
+        print(f"⚠️ {self.name or 'exchange'}: HTTP {status}, pausing requests for {delay:.1f}s")
+
+    def note_headers(self, headers):
+        """Clamp the bucket to the venue's own used-weight count (other processes share the IP limit)."""
+        if self.strikes:
+            with self.cond:
+                self.strikes = 0
+        for name in USED_WEIGHT_HEADERS:
+            used = _header(headers, name)
+            if used is None:
+                continue
+            try:
+                used = float(used)
+            except (TypeError, ValueError):
+                return
+            with self.cond:
+                self._refill(time.monotonic())
+                self.used_weight = used
+                self.tokens = min(self.tokens, self.capacity - used)
+            return
+
+    def stats(self):
+        with self.cond:
+            self._refill(time.monotonic())
+            return {
+                'tokens': round(self.tokens, 1),
+                'capacity': self.capacity,
+                'scale': round(self.scale, 3),
+                'paused_s': round(max(0.0, self.paused_until - time.monotonic()), 3),
+                'used_weight': self.used_weight,
+                'waiting': {lane: n for lane, n in self.waiting.items() if n},
+            }
+
+def rate_budget_for(exchange_obj):
+    """The exchange's scheduler budget, else a RateBudget from SCAN_WEIGHT_PER_MIN or venue defaults."""
+    shared = getattr(exchange_obj, 'rate_budget', None)
+    if shared is not None:
+        return shared
+    weight = CONFIG.get("scan_weight_per_min") or 0
+    if not weight:
+        venue = str(getattr(exchange_obj, 'id', '') or '').lower()
+        weight = VENUE_WEIGHT_PER_MIN.get(venue)
+    if not weight:
+        try:
+            weight = 60000.0 / float(getattr(exchange_obj, 'rateLimit', 0) or 1000)
+        except Exception:
+            weight = 60
+    return RateBudget(weight, name=str(getattr(exchange_obj, 'id', '') or '').lower() or None)
+
+def charge_budget(budget, exchange_obj, weight):
+    """budget.acquire(weight), unless exchange_obj already charges that budget on every request."""
+    if budget is not None and getattr(exchange_obj, 'rate_budget', None) is not budget:
+        budget.acquire(weight)
+
+# --------- الفلترة الأولية ---------
+def prefilter_symbols(exchange_obj, symbols, markets=None, budget=None):
+    """Drop inactive, illiquid, wide-spread or out-of-range symbols with one fetch_tickers call.
+
+    Returns (survivors, {symbol: reason}) where reason is one of inactive,
+    no_ticker, low_volume, wide_spread, low_price, high_price. If the bulk
+    call fails every symbol survives so the scan degrades to the old behaviour.
+    """
+    if not CONFIG.get("prefilter") or not symbols:
+        return list(symbols), {}
+    markets = markets if markets is not None else (getattr(exchange_obj, 'markets', None) or {})
+    charge_budget(budget, exchange_obj, VENUE_TICKERS_WEIGHT.get(str(getattr(exchange_obj, 'id', '')).lower(), 1))
+    try:
+        tickers = exchange_obj.fetch_tickers()
     except Exception as e:
-        print(f"❌ Failed to place real order for {symbol}: {e}")
-        return None
+        print(f"⚠️ Prefilter skipped, fetch_tickers failed: {e}")
+        return list(symbols), {}
+    price_feed_for(exchange_obj).prices.update({sym: _ticker_price(t) for sym, t in tickers.items()})
+    min_vol = CONFIG.get("prefilter_min_quote_volume") or 0
+    max_spread = CONFIG.get("prefilter_max_spread_pct") or 0
+    min_price = CONFIG.get("prefilter_min_price") or 0
+    max_price = CONFIG.get("prefilter_max_price") or 0
+    survivors, dropped = [], {}
+    for sym in symbols:
+        m = (markets.get(sym) if isinstance(markets, dict) else None) or {}
+        t = tickers.get(sym)
+        price = _ticker_price(t)
+        reason = None
+        if m.get('active') is False:
+            reason = 'inactive'
+        elif not t or price is None:
+            reason = 'no_ticker'
+        else:
+            qv = t.get('quoteVolume')
+            if qv is None and t.get('baseVolume') is not None:
+                qv = float(t['baseVolume']) * price
+            bid, ask = t.get('bid'), t.get('ask')
+            if min_vol and qv is not None and float(qv) < min_vol:
+                reason = 'low_volume'
+            elif max_spread and bid and ask and (float(ask) - float(bid)) / price > max_spread:
+                reason = 'wide_spread'
+            elif min_price and price < min_price:
+                reason = 'low_price'
+            elif max_price and price > max_price:
+                reason = 'high_price'
+        if reason:
+            dropped[sym] = reason
+        else:
+            survivors.append(sym)
+    print(f"[prefilter] {len(survivors)}/{len(symbols)} symbols kept")
+    return survivors, dropped
 
 # --------- المراقبة الرئيسية ---------
-def run_once():
-    markets = exchange.load_markets()
+def _drop_open_candle(ohlcv, timeframe, exchange_obj=None):
+    """Drop the last bar if it is still the open (unfinished) candle."""
+    if len(ohlcv) and int(ohlcv[-1][0]) + _timeframe_ms(exchange_obj or exchange, timeframe) > time.time() * 1000:
+        return ohlcv[:-1]
+    return ohlcv
+
+def scan_symbol(symbol, budget=None, closed_only=False, exchange_obj=None):
+    """Fetch, compute indicators and return (signal, entry_price) for one symbol.
+
+    With closed_only the still-open candle is ignored, so the signal is the
+    one of the last closed candle (used by the candle-close scheduler).
+    exchange_obj defaults to the private exchange (see scan_venues).
+    """
+    ex = exchange_obj if exchange_obj is not None else exchange
+    t0 = time.perf_counter()
+    try:
+        return _scan_symbol(ex, symbol, budget, closed_only)
+    finally:
+        # venue only: a symbol label would be one histogram per traded symbol
+        METRICS.observe('scan_symbol_seconds', time.perf_counter() - t0,
+                        venue=str(getattr(ex, 'id', '') or '').lower() or None)
+
+def _scan_symbol(ex, symbol, budget, closed_only):
+    charge_budget(budget, ex, VENUE_OHLCV_WEIGHT.get(str(getattr(ex, 'id', '')).lower(), 1))
+    if CONFIG.get("incremental_indicators"):
+        # only bars newer than the state's last bar are applied, so the CPU
+        # cost per pass does not grow with LIMIT
+        with METRICS.span('fetch_ohlcv', op='scan'):
+            ohlcv = fetch_ohlcv_cached(ex, symbol, CONFIG["timeframe"], CONFIG["limit"])
+        if closed_only:
+            ohlcv = _drop_open_candle(ohlcv, CONFIG["timeframe"], ex)
+        with METRICS.span('update_indicators', op='scan'):
+            state = indicator_state_for(ex, symbol, CONFIG["timeframe"])
+            with _INDICATOR_STATES_LOCK:
+                v = state.update_many(ohlcv)
+                bars = state.bars
+        if bars < 50:
+            raise ValueError("Not enough bars to compute indicators")
+        signal = signal_from_values(v['EMA50'], v['EMA200'], v['MACD'], v['MACD_signal'], v['StochRSI'])
+        return signal, v['close']
+    with METRICS.span('fetch_ohlcv', op='scan'):
+        ohlcv = fetch_ohlcv_cached(ex, symbol, CONFIG["timeframe"], CONFIG["limit"])
+    if closed_only:
+        ohlcv = _drop_open_candle(ohlcv, CONFIG["timeframe"], ex)
+    df = ohlcv_frame(ohlcv)
+    with METRICS.span('add_indicators', op='scan'):
+        df = add_indicators(df)
+    with METRICS.span('get_signal', op='scan'):
+        signal = get_signal(df)
+    return signal, float(df["close"].iloc[-1])
+
+def scan_universe_vectorized(symbols, tracker, budget=None, workers=1):
+    """Fetch all symbols in parallel, then score them in one matrix pass."""
+    from concurrent.futures import ThreadPoolExecutor
+    weight = VENUE_OHLCV_WEIGHT.get(str(getattr(exchange, 'id', '')).lower(), 1)
+
+    def fetch(symbol):
+        t0 = time.perf_counter()
+        try:
+            charge_budget(budget, exchange, weight)
+            with METRICS.span('fetch_ohlcv', op='scan'):
+                return fetch_ohlcv_cached(exchange, symbol, CONFIG["timeframe"], CONFIG["limit"])
+        finally:
+            METRICS.observe('scan_symbol_seconds', time.perf_counter() - t0,
+                            venue=str(getattr(exchange, 'id', '') or '').lower() or None)
+
+    fetched, arrays = [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for symbol, fut in [(s, pool.submit(fetch, s)) for s in symbols]:
+            try:
+                arr = fut.result()
+                if len(arr) < 50:
+                    raise ValueError("Not enough bars to compute indicators")
+                fetched.append(symbol)
+                arrays.append(arr)
+            except Exception as e:
+                print(f"⚠️ خطأ في {symbol}: {e}")
+    if not arrays:
+        return {}
+    with METRICS.span('add_indicators_matrix', op='scan'):
+        mats = ohlcv_matrix(arrays, CONFIG["limit"])
+        ind = add_indicators_matrix(mats["high"], mats["low"], mats["close"])
+        signals = get_signal_matrix(ind)
+    out = {}
+    for i, symbol in enumerate(fetched):
+        out[symbol] = str(signals[i])
+        if signals[i] in ("BUY", "SELL"):
+            tracker.open(symbol, str(signals[i]), float(mats["close"][i, -1]))
+    return out
+
+def _place_order_on_tp(pos):
+    if pos.get('status') == 'tp':
+        # the TP tick is the signal; its price is as fresh as it gets
+        place_real_order(pos['symbol'], pos['action'], CONFIG["trade_size_usdt"],
+                         signal_ts=pos.get('closed_at'), price=pos.get('exit_price'))
+
+def run_once(tracker=None, wait_positions=True):
+    """Scan all filtered symbols once and open simulated trades on signals.
+
+    Pass a running PositionTracker to share it across passes; with
+    wait_positions=False the call returns as soon as the scan finishes.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    run_t0 = time.perf_counter()
+    with METRICS.span('load_markets', op='run_once'):
+        markets = load_markets_cached(exchange)
+        order_executor().warm(markets)
     # markets may be dict symbol->meta
     symbols = [s for s in (list(markets.keys()) if isinstance(markets, dict) else markets) if str(s).endswith(CONFIG["symbol_filter"])]
 
-    for symbol in symbols:
-        try:
-            df = get_ohlcv(symbol)
-            df = add_indicators(df)
-            signal = get_signal(df)
-            if signal in ["BUY", "SELL"]:
-                entry_price = float(df["close"].iloc[-1])
-                success = simulate_trade(symbol, signal, entry_price)
-                if success:
-                    place_real_order(symbol, signal, CONFIG["trade_size_usdt"])
-        except Exception as e:
-            print(f"⚠️ خطأ في {symbol}: {e}")
+    # simulated trades are watched by the tracker thread so a signal never
+    # blocks the scan; a TP hit places the real order as before
+    if tracker is None:
+        tracker = PositionTracker(exchange, on_close=_place_order_on_tp)
+    tracker.start()
 
-if __name__ == "__main__":
-    import sys
-    # If '--analyze' is present, defer to the CLI analyze handler below instead of
-    # running the full run_once (which may call private endpoints like load_markets).
-    if len(sys.argv) > 1 and '--analyze' in sys.argv:
-        # CLI analyze path will be handled later in the file
-        pass
-    else:
-        print(f"Starting trading run: dry_run={CONFIG['dry_run']}, exchange={CONFIG['exchange']}")
-        run_once()
+    # fetch + indicators run on a bounded worker pool under the venue's weight
+    # budget; signals are handled here as results complete
+    budget = rate_budget_for(exchange)
+    with METRICS.span('prefilter', op='run_once'):
+        symbols, _ = prefilter_symbols(exchange, symbols, markets, budget)
+    METRICS.inc('scanned_symbols_total', len(symbols))
+    workers = max(1, int(CONFIG.get("scan_concurrency") or 1))
+    if CONFIG.get("vectorized_scan"):
+        with METRICS.span('scan', op='run_once'):
+            scan_universe_vectorized(symbols, tracker, budget, workers)
+        METRICS.observe('run_once_seconds', time.perf_counter() - run_t0)
+        if wait_positions:
+            tracker.wait()
+            tracker.stop()
+        return tracker
+    with METRICS.span('scan', op='run_once'), ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(scan_symbol, symbol, budget): symbol for symbol in symbols}
+        for fut in as_completed(futures):
+            symbol = futures[fut]
+            try:
+                signal, entry_price = fut.result()
+                METRICS.inc('signals_total', signal=signal)
+                if signal in ["BUY", "SELL"]:
+                    tracker.open(symbol, signal, entry_price)
+            except Exception as e:
+                METRICS.inc('scan_errors_total')
+                print(f"⚠️ خطأ في {symbol}: {e}")
+    if CONFIG.get("incremental_indicators") and CONFIG.get("ohlcv_cache"):
+        with METRICS.span('save_states', op='run_once'):
+            save_indicator_states(exchange)
+    METRICS.observe('run_once_seconds', time.perf_counter() - run_t0)
 
+    if wait_positions:
+        tracker.wait()
+        tracker.stop()
+    return tracker
 
-def analyze_symbol(symbol):
-    """Compute indicators for a single symbol and return a dict summary."""
-    try:
-        # For CLI analysis use a public-only exchange instance to avoid private endpoints
-        def init_public_exchange():
-            params = { "enableRateLimit": True }
-            name = str(CONFIG.get("exchange") or "").strip().lower()
-            alias_map = {
-                'binance': 'binance',
-                'binanceusdm': 'binanceusdm',
-                'binanceus': 'binanceus',
-                'binancecoinm': 'binancecoinm',
-                'mexc': 'mexc',
-                'mxc': 'mexc',
-                'bybit': 'bybit',
-            }
-            cls_name = alias_map.get(name, name)
+# --------- جدولة الفحص على إغلاق الشموع ---------
+class CandleScheduler:
+    """Decide which symbols need a re-score based on TIMEFRAME candle boundaries.
+
+    A symbol is due once per closed candle. Each symbol gets a fixed slot
+    inside the first SCAN_SPREAD_FRACTION of the candle (after a short
+    SCAN_SETTLE_S delay), derived from a hash of its name, so requests are
+    spread across the interval instead of bursting at the boundary.
+    """
+
+    def __init__(self, symbols, timeframe=None, spread_fraction=None, settle_s=None, exchange_obj=None):
+        import zlib
+        self.timeframe = timeframe or CONFIG["timeframe"]
+        self.tf_ms = _timeframe_ms(exchange_obj or exchange, self.timeframe)
+        spread = CONFIG.get("scan_spread_fraction") if spread_fraction is None else spread_fraction
+        settle = CONFIG.get("scan_settle_s") if settle_s is None else settle_s
+        self.settle_ms = int(float(settle or 0) * 1000)
+        window = max(0.0, min(1.0, float(spread or 0))) * self.tf_ms
+        self.offsets = {sym: self.settle_ms + int((zlib.crc32(sym.encode()) % 10000) / 10000.0 * window) for sym in symbols}
+        self.last_eval = {sym: None for sym in symbols}
+
+    def last_closed(self, now_ms):
+        """Open timestamp of the most recently closed candle."""
+        return now_ms - now_ms % self.tf_ms - self.tf_ms
+
+    def due(self, now_ms):
+        closed = self.last_closed(now_ms)
+        boundary = closed + self.tf_ms
+        return [sym for sym, off in self.offsets.items()
+                if now_ms >= boundary + off and (self.last_eval[sym] is None or self.last_eval[sym] < closed)]
+
+    def mark(self, symbol, now_ms):
+        self.last_eval[symbol] = self.last_closed(now_ms)
+
+    def next_run_ms(self, now_ms):
+        closed = self.last_closed(now_ms)
+        boundary = closed + self.tf_ms
+        best = None
+        for sym, off in self.offsets.items():
+            if self.last_eval[sym] is None or self.last_eval[sym] < closed:
+                t = boundary + off
+                if t <= now_ms:
+                    return now_ms
+            else:
+                t = boundary + self.tf_ms + off
+            best = t if best is None else min(best, t)
+        return best if best is not None else now_ms + self.tf_ms
+
+def run_scheduled(symbols=None, tracker=None, stop_event=None):
+    """Re-score each symbol once per closed candle, staggered across the interval."""
+    from concurrent.futures import ThreadPoolExecutor
+    if symbols is None:
+        markets = load_markets_cached(exchange)
+        symbols = [s for s in (list(markets.keys()) if isinstance(markets, dict) else markets) if str(s).endswith(CONFIG["symbol_filter"])]
+    if tracker is None:
+        tracker = PositionTracker(exchange, on_close=_place_order_on_tp)
+    tracker.start()
+    stop_event = stop_event or threading.Event()
+    order_executor().warm()
+    budget = rate_budget_for(exchange)
+    symbols, _ = prefilter_symbols(exchange, symbols, budget=budget)
+    scheduler = CandleScheduler(symbols)
+    workers = max(1, int(CONFIG.get("scan_concurrency") or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while not stop_event.is_set():
+            now_ms = int(time.time() * 1000)
+            due = scheduler.due(now_ms)
+            futures = {pool.submit(scan_symbol, sym, budget, True): sym for sym in due}
+            for fut, sym in futures.items():
+                # marked even on failure so a broken symbol is retried next candle, not in a loop
+                scheduler.mark(sym, now_ms)
+                try:
+                    signal, entry_price = fut.result()
+                    if signal in ["BUY", "SELL"]:
+                        tracker.open(sym, signal, entry_price)
+                except Exception as e:
+                    print(f"⚠️ خطأ في {sym}: {e}")
+            if due and CONFIG.get("incremental_indicators") and CONFIG.get("ohlcv_cache"):
+                save_indicator_states(exchange)
+            wait_s = (scheduler.next_run_ms(int(time.time() * 1000)) - time.time() * 1000) / 1000.0
+            stop_event.wait(max(0.05, min(wait_s, 60.0)))
+    tracker.stop()
+    return tracker
+
+# --------- عدة منصات في عملية واحدة ---------
+# EXCHANGES=binance,mexc,bybit scans several venues from one process. Each
+# venue gets its own keyed exchange (names resolved by init_exchange, keys from
+# <VENUE>_API_KEY/<VENUE>_API_SECRET), RateBudget, PositionTracker and
+# OrderExecutor, and the venues are scanned concurrently.
+def venue_list(spec=None):
+    """Normalize 'binance, MEXC' (or a list) to ['binance', 'mexc']; defaults to EXCHANGES."""
+    spec = CONFIG.get("exchanges") if spec is None else spec
+    items = spec.split(',') if isinstance(spec, str) else list(spec or [])
+    out = []
+    for v in items:
+        v = str(v).strip().lower()
+        if v and v not in out:
+            out.append(v)
+    return out or [str(CONFIG.get("exchange") or "").strip().lower()]
+
+class ExchangePool:
+    """Keyed exchange, rate budget and order executor per venue, created on first use.
+
+    The EXCHANGE venue maps to the process-wide private `exchange`.
+    """
+
+    def __init__(self):
+        self._venues = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, venue):
+        venue = str(venue or CONFIG.get("exchange") or "").strip().lower()
+        entry = self._venues.get(venue)
+        if entry is None:
+            with self._lock:
+                entry = self._venues.get(venue)
+                if entry is None:
+                    if venue == str(CONFIG.get("exchange") or "").strip().lower():
+                        ex = exchange
+                    else:
+                        ex = coalesce_exchange(schedule_exchange(instrument_exchange(init_exchange(venue))))
+                    entry = self._venues[venue] = {'exchange': ex, 'budget': rate_budget_for(ex), 'executor': None}
+        return entry
+
+    def get(self, venue):
+        return self._entry(venue)['exchange']
+
+    def budget(self, venue):
+        return self._entry(venue)['budget']
+
+    def executor(self, venue):
+        entry = self._entry(venue)
+        if entry['exchange'] is exchange:
+            return order_executor()
+        with self._lock:
+            if entry['executor'] is None:
+                entry['executor'] = OrderExecutor(entry['exchange'])
+            return entry['executor']
+
+    def venues(self):
+        return list(self._venues)
+
+EXCHANGE_POOL = ExchangePool()
+
+def scan_venue(venue, tracker=None, symbols=None, pool=None):
+    """Scan one venue under its own budget; returns {symbol: {'signal', 'price'}}."""
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    pool = pool or EXCHANGE_POOL
+    ex = pool.get(venue)
+    markets = load_markets_cached(ex)
+    if symbols is None:
+        symbols = [s for s in (list(markets.keys()) if isinstance(markets, dict) else markets) if str(s).endswith(CONFIG["symbol_filter"])]
+    budget = pool.budget(venue)
+    symbols, _ = prefilter_symbols(ex, symbols, markets, budget)
+    pool.executor(venue).warm(markets)
+    results = {}
+    workers = max(1, int(CONFIG.get("scan_concurrency") or 1))
+    with ThreadPoolExecutor(max_workers=workers) as workers_pool:
+        futures = {workers_pool.submit(scan_symbol, sym, budget, False, ex): sym for sym in symbols}
+        for fut in as_completed(futures):
+            sym = futures[fut]
             try:
-                if hasattr(ccxt, cls_name):
-                    ExchangeClass = getattr(ccxt, cls_name)
-                    return ExchangeClass(params)
-                for attr in dir(ccxt):
-                    if attr.lower() == cls_name.lower():
-                        ExchangeClass = getattr(ccxt, attr)
-                        return ExchangeClass(params)
-            except Exception:
-                pass
-            # fallback to generic constructor using name
+                signal, price = fut.result()
+            except Exception as e:
+                print(f"⚠️ خطأ في {venue} {sym}: {e}")
+                continue
+            results[sym] = {'signal': signal, 'price': price}
+            if tracker is not None and signal in ["BUY", "SELL"]:
+                tracker.open(sym, signal, price)
+    if CONFIG.get("incremental_indicators") and CONFIG.get("ohlcv_cache"):
+        save_indicator_states(ex)
+    return results
+
+def scan_venues(venues=None, trackers=None, pool=None):
+    """Scan every venue concurrently; returns {venue: scan_venue(...) result}."""
+    from concurrent.futures import ThreadPoolExecutor
+    pool = pool or EXCHANGE_POOL
+    venues = venue_list(venues)
+    trackers = trackers or {}
+    out = {}
+    with ThreadPoolExecutor(max_workers=len(venues)) as venue_pool:
+        futures = {v: venue_pool.submit(scan_venue, v, trackers.get(v), None, pool) for v in venues}
+        for venue, fut in futures.items():
             try:
-                return getattr(ccxt, name)(params)
+                out[venue] = fut.result()
+            except Exception as e:
+                print(f"⚠️ Scan failed on {venue}: {e}")
+                out[venue] = {}
+    return out
+
+def cross_venue_view(results, pool=None, min_venues=1):
+    """Group scan results by base asset: each base's signal and price on every venue.
+
+    Each entry also says whether all venues agree on the signal and how far
+    apart the prices are (spread_pct = (max - min) / min).
+    """
+    pool = pool or EXCHANGE_POOL
+    view = {}
+    for venue, by_symbol in results.items():
+        markets = getattr(pool.get(venue), 'markets', None) or {}
+        for sym, res in by_symbol.items():
+            base = (markets.get(sym) or {}).get('base') or str(sym).split('/')[0]
+            view.setdefault(base, {})[venue] = dict(res, symbol=sym)
+    out = {}
+    for base, per_venue in sorted(view.items()):
+        if len(per_venue) < min_venues:
+            continue
+        signals = {r['signal'] for r in per_venue.values()}
+        prices = [r['price'] for r in per_venue.values() if r.get('price')]
+        out[base] = {
+            'venues': per_venue,
+            'agree': len(signals) == 1,
+            'spread_pct': (max(prices) - min(prices)) / min(prices) if len(prices) > 1 else 0.0,
+        }
+    return out
+
+def run_multi(venues=None, wait_positions=True, trade=True, pool=None):
+    """run_once across several venues: one scan per venue, concurrently.
+
+    Returns (results, trackers); with trade=False no simulated trades open.
+    """
+    pool = pool or EXCHANGE_POOL
+    venues = venue_list(venues)
+    trackers = {}
+    if trade:
+        for venue in venues:
+            def on_close(pos, venue=venue):
+                if pos.get('status') == 'tp':
+                    pool.executor(venue).execute(pos['symbol'], pos['action'], CONFIG["trade_size_usdt"],
+                                                 signal_ts=pos.get('closed_at'), price=pos.get('exit_price'))
+            trackers[venue] = PositionTracker(pool.get(venue), on_close=on_close).start()
+    results = scan_venues(venues, trackers, pool)
+    if wait_positions:
+        for tracker in trackers.values():
+            tracker.wait()
+            tracker.stop()
+    return results, trackers
+
+def _cli_venues():
+    import argparse, json
+    p = argparse.ArgumentParser()
+    p.add_argument('--venues', default=None, help="Comma-separated venues (default: EXCHANGES)")
+    p.add_argument('--no-trade', action='store_true', help='Only scan and print the cross-venue view')
+    p.add_argument('--min-venues', type=int, default=2, help='Only list bases listed on at least this many venues')
+    args = p.parse_args()
+    results, _ = run_multi(args.venues, wait_positions=not args.no_trade, trade=not args.no_trade)
+    print(json.dumps({
+        'scanned': {v: len(r) for v, r in results.items()},
+        'view': cross_venue_view(results, min_venues=args.min_venues),
+    }))
+
+# --------- منصات عامة (تحليل) ---------
+# Public-only exchange instances keyed by venue name. Analysis never needs API
+# keys, and keeping one warm instance per venue lets ccxt reuse its loaded
+# markets and HTTP session across calls instead of rebuilding them every time.
+_PUBLIC_EXCHANGES = {}
+_PUBLIC_EXCHANGES_LOCK = threading.Lock()
+
+def init_public_exchange(name=None):
+    params = { "enableRateLimit": True }
+    name = str(name or CONFIG.get("exchange") or "").strip().lower()
+    alias_map = {
+        'binance': 'binance',
+        'binanceusdm': 'binanceusdm',
+        'binanceus': 'binanceus',
+        'binancecoinm': 'binancecoinm',
+        'mexc': 'mexc',
+        'mxc': 'mexc',
+        'bybit': 'bybit',
+    }
+    cls_name = alias_map.get(name, name)
+    try:
+        if hasattr(ccxt, cls_name):
+            ExchangeClass = getattr(ccxt, cls_name)
+            return ExchangeClass(params)
+        for attr in dir(ccxt):
+            if attr.lower() == cls_name.lower():
+                ExchangeClass = getattr(ccxt, attr)
+                return ExchangeClass(params)
+    except Exception:
+        pass
+    # fallback to generic constructor using name
+    try:
+        return getattr(ccxt, name)(params)
+    except Exception:
+        # final fallback: try first available exchange class
+        classes = [n for n in dir(ccxt) if n.islower()]
+        for c in classes:
+            try:
+                return getattr(ccxt, c)(params)
             except Exception:
-                # final fallback: try first available exchange class
-                classes = [n for n in dir(ccxt) if n.islower()]
-                for c in classes:
-                    try:
-                        return getattr(ccxt, c)(params)
-                    except Exception:
-                        continue
-                raise
+                continue
+        raise
+
+def get_public_exchange(name=None):
+    """Return the pooled public exchange for a venue, creating it on first use."""
+    key = str(name or CONFIG.get("exchange") or "").strip().lower()
+    ex = _PUBLIC_EXCHANGES.get(key)
+    if ex is not None:
+        return ex
+    with _PUBLIC_EXCHANGES_LOCK:
+        ex = _PUBLIC_EXCHANGES.get(key)
+        if ex is None:
+            ex = coalesce_exchange(schedule_exchange(instrument_exchange(init_public_exchange(key))))
+            _PUBLIC_EXCHANGES[key] = ex
+    return ex
+
+
+# --------- اتجاه الأطر الزمنية الأعلى ---------
+# The 1h/4h bias is computed from closed candles only, so it cannot change
+# until the next candle of that timeframe closes. Results are cached per
+# venue/symbol/timeframe until that boundary, and the timeframes of one
+# symbol are fetched in parallel.
+HTF_TIMEFRAMES = ['1h', '4h']
+HTF_BARS = 200
+_HTF_BIAS_CACHE = {}
+_HTF_BIAS_LOCK = threading.Lock()
 
-        public_exchange = init_public_exchange()
+def _bias_from_closes(close):
+    if len(close) < 50:
+        return 'UNKNOWN'
+    e50 = ta.trend.EMAIndicator(close, 50).ema_indicator().iloc[-1]
+    e200 = ta.trend.EMAIndicator(close, 200).ema_indicator().iloc[-1] if len(close) >= 200 else None
+    macdo = ta.trend.MACD(close)
+    macd_val = macdo.macd().iloc[-1]
+    macd_sig = macdo.macd_signal().iloc[-1]
+    if e50 is not None and e200 is not None and e50 > e200 and macd_val is not None and macd_val > macd_sig:
+        return 'BULL'
+    elif e50 is not None and e200 is not None and e50 < e200 and macd_val is not None and macd_val < macd_sig:
+        return 'BEAR'
+    return 'MIXED'
+
+def _timeframe_bias(exchange_obj, symbol, tf):
+    venue = str(getattr(exchange_obj, 'id', '') or '').lower()
+    key = (venue, symbol, tf)
+    now_ms = int(time.time() * 1000)
+    with _HTF_BIAS_LOCK:
+        hit = _HTF_BIAS_CACHE.get(key)
+    if hit is not None and now_ms < hit[0]:
+        return hit[1]
+    tf_ms = _timeframe_ms(exchange_obj, tf)
+    try:
+        # one extra bar because the still-open candle is dropped
+        ohl = fetch_ohlcv_cached(exchange_obj, symbol, tf, HTF_BARS + 1)
+        if len(ohl) and int(ohl[-1, 0]) + tf_ms > now_ms:
+            ohl = ohl[:-1]
+        bias = _bias_from_closes(pd.Series(ohl[-HTF_BARS:, 4], copy=True))
+    except Exception:
+        # don't cache failures; the next call retries
+        return 'UNKNOWN'
+    expires = now_ms - now_ms % tf_ms + tf_ms
+    with _HTF_BIAS_LOCK:
+        _HTF_BIAS_CACHE[key] = (expires, bias)
+    return bias
+
+def higher_timeframe_bias(exchange_obj, symbol, timeframes=None):
+    """Return {timeframe: 'BULL'|'BEAR'|'MIXED'|'UNKNOWN'} for the higher timeframes."""
+    from concurrent.futures import ThreadPoolExecutor
+    timeframes = list(timeframes or HTF_TIMEFRAMES)
+    try:
+        with ThreadPoolExecutor(max_workers=len(timeframes)) as pool:
+            task = in_current_lane(_timeframe_bias)
+            futures = {tf: pool.submit(task, exchange_obj, symbol, tf) for tf in timeframes}
+            return {tf: fut.result() for tf, fut in futures.items()}
+    except Exception:
+        return {tf: 'UNKNOWN' for tf in timeframes}
+
+
+def _analyze_symbol(symbol, exchange_name=None, verbose=True):
+    """Compute indicators for a single symbol and return a dict summary.
+
+    exchange_name overrides CONFIG["exchange"] for this call (used by --serve).
+    With verbose=False the advice/explain/rationale text is skipped (empty
+    lists); the numbers are the same, for callers that only want to_compact().
+    """
+    try:
+        # For CLI analysis use a public-only exchange instance to avoid private endpoints;
+        # instances are pooled per venue so a long-lived server reuses warm markets
+        public_exchange = get_public_exchange(exchange_name)
         def get_ohlcv_public(symbol):
-            ohlcv = public_exchange.fetch_ohlcv(symbol, CONFIG["timeframe"], limit=CONFIG["limit"])
-            df = pd.DataFrame(ohlcv, columns=["time","open","high","low","close","volume"])
-            df["close"] = df["close"].astype(float)
-            return df
+            ohlcv = fetch_ohlcv_cached(public_exchange, symbol, CONFIG["timeframe"], CONFIG["limit"])
+            return ohlcv_frame(ohlcv)
 
-        # Resolve symbol against the exchange markets: try variants and fallbacks
+        # Resolve symbol against the exchange markets via the prebuilt index
         def resolve_symbol_on_exchange(exchange_obj, raw_symbol):
             try:
-                # load markets once
-                try:
-                    markets = exchange_obj.load_markets()
-                except Exception:
-                    markets = getattr(exchange_obj, 'markets', {}) or {}
-                # normalize
-                rs = str(raw_symbol or '').strip()
-                candidates = []
-                s = rs
-                candidates.append(s)
-                # replacements
-                candidates.append(s.replace('-', '/'))
-                candidates.append(s.replace('_', '/'))
-                # force uppercase variants
-                candidates = candidates + [c.upper() for c in candidates]
-                # if no slash, try common quote pairs
-                if '/' not in s:
-                    for q in ['USDT', 'USDC', 'BTC', 'ETH']:
-                        candidates.append(f"{s}/{q}")
-                        candidates.append(f"{s.upper()}/{q}")
-                # dedupe preserving order
-                seen = set(); uniq = []
-                for c in candidates:
-                    if not c: continue
-                    if c in seen: continue
-                    seen.add(c); uniq.append(c)
-                # direct match against markets keys
-                market_keys = list(markets.keys()) if isinstance(markets, dict) else []
-                market_lc = {mk.lower(): mk for mk in market_keys}
-                for cand in uniq:
-                    if cand in market_keys: return cand
-                    if cand.lower() in market_lc: return market_lc[cand.lower()]
-                # fallback: search for market where base matches cand token name
-                base_candidate = (s.split('/') or [s])[0].upper()
-                preferred_quotes = ['USDT','USDC','BTC','ETH']
-                for q in preferred_quotes:
-                    key = f"{base_candidate}/{q}"
-                    if key in market_keys: return key
-                    if key.lower() in market_lc: return market_lc[key.lower()]
-                # final fallback: find any market whose base equals base_candidate
-                for mk in market_keys:
-                    m = markets.get(mk) or {}
-                    base = (m.get('base') or '').upper()
-                    if base == base_candidate:
-                        return mk
-                # not found
-                return None
+                return symbol_index_for(exchange_obj).resolve(raw_symbol)
             except Exception:
                 return None
 
-        resolved = resolve_symbol_on_exchange(public_exchange, symbol)
-        if not resolved:
-            # still attempt direct fetch which will give an informative error
-            df = get_ohlcv_public(symbol)
-        else:
-            df = get_ohlcv_public(resolved)
-            # replace symbol variable with resolved for outputs
-            symbol = resolved
-        df = add_indicators(df)
+        with METRICS.span('load_markets', op='analyze'):
+            resolved = resolve_symbol_on_exchange(public_exchange, symbol)
+        with METRICS.span('fetch_ohlcv', op='analyze'):
+            if not resolved:
+                # still attempt direct fetch which will give an informative error
+                df = get_ohlcv_public(symbol)
+            else:
+                df = get_ohlcv_public(resolved)
+                # replace symbol variable with resolved for outputs
+                symbol = resolved
+        with METRICS.span('add_indicators', op='analyze'):
+            df = add_indicators(df)
+        # Multi-timeframe bias (1h and 4h), needed by the recommendation block below
+        with METRICS.span('htf_bias', op='analyze'):
+            ht_bias = higher_timeframe_bias(public_exchange, symbol)
+        summary_t0 = time.perf_counter()
         # provide previous bar for change metrics when available
         last = df.iloc[-1]
         prev = df.iloc[-2] if len(df) >= 2 else last
@@ -423,9 +2080,9 @@ def analyze_symbol(symbol):
                 score_components.append(1 if macd > macd_signal else -1)
             # StochRSI
             if stoch is not None:
-                if stoch < 0.2:
+                if stoch < STRATEGY_PARAMS["stoch_low"]:
                     score_components.append(1)
-                elif stoch > 0.8:
+                elif stoch > STRATEGY_PARAMS["stoch_high"]:
                     score_components.append(-1)
             # volume (higher recent volume = positive)
             if vol_change is not None:
@@ -497,33 +2154,34 @@ def analyze_symbol(symbol):
             # Advice bullets (emit as code + fallback text for translation friendly output)
             adv_objs = []
             def_adv = []
-            if trend == 'BULL':
-                adv_objs.append({'code': 'advice_trend_bull', 'text': 'Trend is bullish on the selected timeframe.'})
-                def_adv.append('Trend is bullish on the selected timeframe.')
-                if rsi is not None and rsi > 70:
-                    adv_objs.append({'code': 'advice_rsi_high', 'text': 'RSI high -> consider risk of short-term pullback.'})
-                    def_adv.append('RSI high -> consider risk of short-term pullback.')
-                if atr is not None and close:
-                    if (atr/close) > 0.1:
-                        adv_objs.append({'code': 'advice_high_volatility', 'text': 'High volatility detected; prefer smaller position sizes.'})
-                        def_adv.append('High volatility detected; prefer smaller position sizes.')
-            elif trend == 'BEAR':
-                adv_objs.append({'code': 'advice_trend_bear', 'text': 'Trend is bearish. Prefer wait-or-short strategies.'})
-                def_adv.append('Trend is bearish. Prefer wait-or-short strategies.')
-                if rsi is not None and rsi < 30:
-                    adv_objs.append({'code': 'advice_rsi_oversold', 'text': 'RSI oversold -> short-term bounce possible.'})
-                    def_adv.append('RSI oversold -> short-term bounce possible.')
-            else:
-                adv_objs.append({'code': 'advice_mixed', 'text': 'Market mixed: consider waiting for clearer confirmation or use reduced size.'})
-                def_adv.append('Market mixed: consider waiting for clearer confirmation or use reduced size.')
+            if verbose:
+                if trend == 'BULL':
+                    adv_objs.append({'code': 'advice_trend_bull', 'text': 'Trend is bullish on the selected timeframe.'})
+                    def_adv.append('Trend is bullish on the selected timeframe.')
+                    if rsi is not None and rsi > 70:
+                        adv_objs.append({'code': 'advice_rsi_high', 'text': 'RSI high -> consider risk of short-term pullback.'})
+                        def_adv.append('RSI high -> consider risk of short-term pullback.')
+                    if atr is not None and close:
+                        if (atr/close) > 0.1:
+                            adv_objs.append({'code': 'advice_high_volatility', 'text': 'High volatility detected; prefer smaller position sizes.'})
+                            def_adv.append('High volatility detected; prefer smaller position sizes.')
+                elif trend == 'BEAR':
+                    adv_objs.append({'code': 'advice_trend_bear', 'text': 'Trend is bearish. Prefer wait-or-short strategies.'})
+                    def_adv.append('Trend is bearish. Prefer wait-or-short strategies.')
+                    if rsi is not None and rsi < 30:
+                        adv_objs.append({'code': 'advice_rsi_oversold', 'text': 'RSI oversold -> short-term bounce possible.'})
+                        def_adv.append('RSI oversold -> short-term bounce possible.')
+                else:
+                    adv_objs.append({'code': 'advice_mixed', 'text': 'Market mixed: consider waiting for clearer confirmation or use reduced size.'})
+                    def_adv.append('Market mixed: consider waiting for clearer confirmation or use reduced size.')
 
-            # Volume note
-            if vol_vs_ma is not None and vol_vs_ma > 0.5:
-                adv_objs.append({'code': 'advice_volume_high', 'text': 'Volume is above recent average — move has momentum.'})
-                def_adv.append('Volume is above recent average — move has momentum.')
-            elif vol_vs_ma is not None and vol_vs_ma < -0.5:
-                adv_objs.append({'code': 'advice_volume_low', 'text': 'Volume is well below recent average — move lacks conviction.'})
-                def_adv.append('Volume is well below recent average — move lacks conviction.')
+                # Volume note
+                if vol_vs_ma is not None and vol_vs_ma > 0.5:
+                    adv_objs.append({'code': 'advice_volume_high', 'text': 'Volume is above recent average — move has momentum.'})
+                    def_adv.append('Volume is above recent average — move has momentum.')
+                elif vol_vs_ma is not None and vol_vs_ma < -0.5:
+                    adv_objs.append({'code': 'advice_volume_low', 'text': 'Volume is well below recent average — move lacks conviction.'})
+                    def_adv.append('Volume is well below recent average — move lacks conviction.')
 
             # Position sizing suggestion based on score and volatility
             pos = 'normal'
@@ -539,9 +2197,9 @@ def analyze_symbol(symbol):
         try:
             suggested = None
             if atr is not None and close:
-                # Use ATR multiples: SL distance = 1.5 * ATR, TP distance = 3 * ATR
-                sl_dist = 1.5 * atr
-                tp_dist = 3.0 * atr
+                # Use ATR multiples: SL distance = 1.5 * ATR, TP distance = 3 * ATR (defaults)
+                sl_dist = STRATEGY_PARAMS["atr_sl_mult"] * atr
+                tp_dist = STRATEGY_PARAMS["atr_tp_mult"] * atr
                 if trend == 'BULL' or signal == 'BUY':
                     entry = close
                     sl = max(0.0, entry - sl_dist)
@@ -583,20 +2241,21 @@ def analyze_symbol(symbol):
 
             # Weighted confirmation: EMA=2, MACD=2, RSI=1, Volume=1
             try:
-                w_ema = 2
-                w_macd = 2
-                w_rsi = 1
-                w_vol = 1
+                w_ema = STRATEGY_PARAMS["w_ema"]
+                w_macd = STRATEGY_PARAMS["w_macd"]
+                w_rsi = STRATEGY_PARAMS["w_rsi"]
+                w_vol = STRATEGY_PARAMS["w_vol"]
+                macd_floor = STRATEGY_PARAMS["macd_strength_min"]
 
                 vote_ema = 1 if (ema50 is not None and ema200 is not None and ema50 > ema200) else 0
-                vote_macd = 1 if (macd is not None and macd_signal is not None and macd > macd_signal and macd_strength and macd_strength > 0.00005) else 0
+                vote_macd = 1 if (macd is not None and macd_signal is not None and macd > macd_signal and macd_strength and macd_strength > macd_floor) else 0
                 vote_rsi = 1 if (rsi is not None and rsi > 50 and rsi < 80) else 0
                 vote_vol = 1 if (vol_vs_ma is not None and vol_vs_ma > 0.05) else 0
 
                 bull_weight = (vote_ema * w_ema) + (vote_macd * w_macd) + (vote_rsi * w_rsi) + (vote_vol * w_vol)
 
                 vote_ema_b = 1 if (ema50 is not None and ema200 is not None and ema50 < ema200) else 0
-                vote_macd_b = 1 if (macd is not None and macd_signal is not None and macd < macd_signal and macd_strength and macd_strength > 0.00005) else 0
+                vote_macd_b = 1 if (macd is not None and macd_signal is not None and macd < macd_signal and macd_strength and macd_strength > macd_floor) else 0
                 vote_rsi_b = 1 if (rsi is not None and rsi < 50 and rsi > 20) else 0
                 vote_vol_b = 1 if (vol_vs_ma is not None and vol_vs_ma < -0.05) else 0
                 bear_weight = (vote_ema_b * w_ema) + (vote_macd_b * w_macd) + (vote_rsi_b * w_rsi) + (vote_vol_b * w_vol)
@@ -615,8 +2274,9 @@ def analyze_symbol(symbol):
                 pass
 
             # Weighted threshold: require >=3 points (EMA+anything else OR MACD+something)
-            strong_bull = (bull_weight >= 3 and score >= 50 and htf_allows_bull)
-            strong_bear = (bear_weight >= 3 and score >= 50 and htf_allows_bear)
+            vote_threshold = STRATEGY_PARAMS["vote_threshold"]
+            strong_bull = (bull_weight >= vote_threshold and score >= 50 and htf_allows_bull)
+            strong_bear = (bear_weight >= vote_threshold and score >= 50 and htf_allows_bear)
 
             if strong_bull:
                 rec_action = 'enter_long'
@@ -626,10 +2286,10 @@ def analyze_symbol(symbol):
                 zone_up = entry_center + (0.2 * atr) if atr else entry_center
                 rec_entry_zone = [zone_down, zone_up]
                 rec_entry = entry_center
-                # SL and multi TP levels (conservative: TP1=1*atr, TP2=2*atr, TP3=3*atr)
+                # SL and multi TP levels (conservative: TP1..TP3 at 1/3, 2/3, 1 x atr_tp_mult ATRs)
                 if atr:
-                    rec_sl = max(0.0, entry_center - 1.5 * atr)
-                    rec_tps = [entry_center + 1.0 * atr, entry_center + 2.0 * atr, entry_center + 3.0 * atr]
+                    rec_sl = max(0.0, entry_center - STRATEGY_PARAMS["atr_sl_mult"] * atr)
+                    rec_tps = [entry_center + f * STRATEGY_PARAMS["atr_tp_mult"] * atr for f in (1/3, 2/3, 1.0)]
                 else:
                     rec_sl = max(0.0, entry_center * (1 - CONFIG.get('sl_pct', 0.03)))
                     rec_tps = [entry_center * (1 + CONFIG.get('tp_pct', 0.05))]
@@ -642,8 +2302,8 @@ def analyze_symbol(symbol):
                 rec_entry_zone = [zone_down, zone_up]
                 rec_entry = entry_center
                 if atr:
-                    rec_sl = entry_center + 1.5 * atr
-                    rec_tps = [entry_center - 1.0 * atr, entry_center - 2.0 * atr, entry_center - 3.0 * atr]
+                    rec_sl = entry_center + STRATEGY_PARAMS["atr_sl_mult"] * atr
+                    rec_tps = [entry_center - f * STRATEGY_PARAMS["atr_tp_mult"] * atr for f in (1/3, 2/3, 1.0)]
                 else:
                     rec_sl = entry_center * (1 + CONFIG.get('sl_pct', 0.03))
                     rec_tps = [entry_center * (1 - CONFIG.get('tp_pct', 0.05))]
@@ -662,27 +2322,28 @@ def analyze_symbol(symbol):
             # human explanation lines (short) plus stable explain codes for translation
             rec_explain = []
             rec_explain_codes = []
-            if rec_action in ('enter_long','enter_short','consider_enter'):
-                # action code
-                rec_explain_codes.append({'code': f're_ex_action_{rec_action}', 'text': f'Action: {rec_action}', 'vars': {'action': rec_action}})
-                rec_explain.append(f"Action: {rec_action}")
-                if rec_entry is not None:
-                    rec_explain_codes.append({'code': 're_ex_entry', 'text': f'Entry: {round(rec_entry, 8)}', 'vars': {'val': round(rec_entry,8)}})
-                    rec_explain.append(f"Entry: {round(rec_entry, 8)}")
-                if rec_entry_zone is not None:
-                    rec_explain_codes.append({'code': 're_ex_entry_zone', 'text': f'Entry zone: {round(rec_entry_zone[0],8)} - {round(rec_entry_zone[1],8)}', 'vars': {'low': round(rec_entry_zone[0],8), 'high': round(rec_entry_zone[1],8)}})
-                    rec_explain.append(f"Entry zone: {round(rec_entry_zone[0],8)} - {round(rec_entry_zone[1],8)}")
-                if rec_sl is not None:
-                    rec_explain_codes.append({'code': 're_ex_sl', 'text': f'SL: {round(rec_sl,8)}', 'vars': {'val': round(rec_sl,8)}})
-                    rec_explain.append(f"SL: {round(rec_sl,8)}")
-                if rec_tps:
-                    rec_explain_codes.append({'code': 're_ex_tps', 'text': 'TPs: ' + ", ".join([str(round(x,8)) for x in rec_tps]), 'vars': {'vals': ", ".join([str(round(x,8)) for x in rec_tps])}})
-                    rec_explain.append("TPs: " + ", ".join([str(round(x,8)) for x in rec_tps]))
-                rec_explain_codes.append({'code': 're_ex_risk', 'text': f'Position risk%: {rec_risk_pct}%', 'vars': {'pct': rec_risk_pct}})
-                rec_explain.append(f"Position risk%: {rec_risk_pct}%")
-            else:
-                rec_explain_codes.append({'code': 're_ex_no_setup', 'text': 'No clear setup — consider waiting or reducing size', 'vars': {}})
-                rec_explain.append('No clear setup — consider waiting or reducing size')
+            if verbose:
+                if rec_action in ('enter_long','enter_short','consider_enter'):
+                    # action code
+                    rec_explain_codes.append({'code': f're_ex_action_{rec_action}', 'text': f'Action: {rec_action}', 'vars': {'action': rec_action}})
+                    rec_explain.append(f"Action: {rec_action}")
+                    if rec_entry is not None:
+                        rec_explain_codes.append({'code': 're_ex_entry', 'text': f'Entry: {round(rec_entry, 8)}', 'vars': {'val': round(rec_entry,8)}})
+                        rec_explain.append(f"Entry: {round(rec_entry, 8)}")
+                    if rec_entry_zone is not None:
+                        rec_explain_codes.append({'code': 're_ex_entry_zone', 'text': f'Entry zone: {round(rec_entry_zone[0],8)} - {round(rec_entry_zone[1],8)}', 'vars': {'low': round(rec_entry_zone[0],8), 'high': round(rec_entry_zone[1],8)}})
+                        rec_explain.append(f"Entry zone: {round(rec_entry_zone[0],8)} - {round(rec_entry_zone[1],8)}")
+                    if rec_sl is not None:
+                        rec_explain_codes.append({'code': 're_ex_sl', 'text': f'SL: {round(rec_sl,8)}', 'vars': {'val': round(rec_sl,8)}})
+                        rec_explain.append(f"SL: {round(rec_sl,8)}")
+                    if rec_tps:
+                        rec_explain_codes.append({'code': 're_ex_tps', 'text': 'TPs: ' + ", ".join([str(round(x,8)) for x in rec_tps]), 'vars': {'vals': ", ".join([str(round(x,8)) for x in rec_tps])}})
+                        rec_explain.append("TPs: " + ", ".join([str(round(x,8)) for x in rec_tps]))
+                    rec_explain_codes.append({'code': 're_ex_risk', 'text': f'Position risk%: {rec_risk_pct}%', 'vars': {'pct': rec_risk_pct}})
+                    rec_explain.append(f"Position risk%: {rec_risk_pct}%")
+                else:
+                    rec_explain_codes.append({'code': 're_ex_no_setup', 'text': 'No clear setup — consider waiting or reducing size', 'vars': {}})
+                    rec_explain.append('No clear setup — consider waiting or reducing size')
 
             recommendation = {
                 'action': rec_action,
@@ -697,70 +2358,49 @@ def analyze_symbol(symbol):
         except Exception:
             recommendation = None
 
-        # Multi-timeframe bias (try 1h and 4h if possible)
-        try:
-            ht_bias = {}
-            for tf in ['1h', '4h']:
-                try:
-                    ohl = public_exchange.fetch_ohlcv(symbol, tf, limit=200)
-                    dfo = pd.DataFrame(ohl, columns=["time","open","high","low","close","volume"])
-                    dfo['close'] = dfo['close'].astype(float)
-                    if len(dfo) >= 50:
-                        e50 = ta.trend.EMAIndicator(dfo['close'], 50).ema_indicator().iloc[-1]
-                        e200 = ta.trend.EMAIndicator(dfo['close'], 200).ema_indicator().iloc[-1] if len(dfo) >= 200 else None
-                        macdo = ta.trend.MACD(dfo['close'])
-                        macd_val = macdo.macd().iloc[-1]
-                        macd_sig = macdo.macd_signal().iloc[-1]
-                        if e50 is not None and e200 is not None and e50 > e200 and macd_val is not None and macd_val > macd_sig:
-                            ht_bias[tf] = 'BULL'
-                        elif e50 is not None and e200 is not None and e50 < e200 and macd_val is not None and macd_val < macd_sig:
-                            ht_bias[tf] = 'BEAR'
-                        else:
-                            ht_bias[tf] = 'MIXED'
-                    else:
-                        ht_bias[tf] = 'UNKNOWN'
-                except Exception:
-                    ht_bias[tf] = 'UNKNOWN'
-        except Exception:
-            ht_bias = {'1h':'UNKNOWN','4h':'UNKNOWN'}
-
         # small unicode sparkline for recent closes (no extra deps)
-        try:
-            def make_sparkline(series, length=30):
-                chars = ['▁','▂','▃','▄','▅','▆','▇','█']
-                s = list(series[-length:]) if len(series) >= 1 else list(series)
-                if len(s) == 0:
-                    return ''
-                mn = min(s)
-                mx = max(s)
-                if mx == mn:
-                    return ''.join([chars[0] for _ in s])
-                out = []
-                for v in s:
-                    # normalize 0..1
-                    t = (v - mn) / (mx - mn)
-                    idx = int(round(t * (len(chars)-1)))
-                    out.append(chars[max(0,min(len(chars)-1, idx))])
-                return ''.join(out)
-            spark = make_sparkline(list(df['close'].astype(float)), length=30)
-        except Exception:
-            spark = ''
+        spark = ''
+        if verbose:
+            try:
+                def make_sparkline(series, length=30):
+                    chars = ['▁','▂','▃','▄','▅','▆','▇','█']
+                    s = list(series[-length:]) if len(series) >= 1 else list(series)
+                    if len(s) == 0:
+                        return ''
+                    mn = min(s)
+                    mx = max(s)
+                    if mx == mn:
+                        return ''.join([chars[0] for _ in s])
+                    out = []
+                    for v in s:
+                        # normalize 0..1
+                        t = (v - mn) / (mx - mn)
+                        idx = int(round(t * (len(chars)-1)))
+                        out.append(chars[max(0,min(len(chars)-1, idx))])
+                    return ''.join(out)
+                spark = make_sparkline(list(df['close'].astype(float)), length=30)
+            except Exception:
+                spark = ''
 
         # short textual rationale
         rationale = []
-        try:
-            if ema50 is not None and ema200 is not None:
-                rationale.append('EMA50>EMA200' if ema50 > ema200 else 'EMA50<EMA200')
-            if macd is not None and macd_signal is not None:
-                rationale.append('MACD>Signal' if macd > macd_signal else 'MACD<Signal')
-            if stoch is not None:
-                rationale.append(f'StochRSI={round(stoch,3)}')
-            if atr is not None and close:
-                rationale.append('ATR%=' + str(round((atr/close)*100,2)) + '%')
-            if vol_change is not None:
-                rationale.append('VolΔ=' + str(round(vol_change*100,2)) + '%')
-        except Exception:
-            pass
+        if verbose:
+            try:
+                if ema50 is not None and ema200 is not None:
+                    rationale.append('EMA50>EMA200' if ema50 > ema200 else 'EMA50<EMA200')
+                if macd is not None and macd_signal is not None:
+                    rationale.append('MACD>Signal' if macd > macd_signal else 'MACD<Signal')
+                if stoch is not None:
+                    rationale.append(f'StochRSI={round(stoch,3)}')
+                if atr is not None and close:
+                    rationale.append('ATR%=' + str(round((atr/close)*100,2)) + '%')
+                if vol_change is not None:
+                    rationale.append('VolΔ=' + str(round(vol_change*100,2)) + '%')
+            except Exception:
+                pass
+
+        # scores, votes, levels and (when verbose) the advice text
+        METRICS.observe('stage_seconds', time.perf_counter() - summary_t0, stage='summary', op='analyze')
 
         # Prepare final advice text fallback
         final_advice_texts = def_adv if (('def_adv' in locals()) and def_adv) else (adv if ('adv' in locals()) else [])
@@ -818,20 +2458,328 @@ def analyze_symbol(symbol):
         return { 'error': str(e), 'symbol': symbol }
 
 
+# --------- ذاكرة نتائج التحليل ---------
+# analyze_symbol results are cached per (venue, symbol, timeframe, open time
+# of the current candle) and expire when that candle closes. The in-memory
+# copy is an LRU capped at ANALYZE_CACHE_MAX_MB; ANALYZE_CACHE_DB adds a SQLite
+# file that separate processes (e.g. spawned --analyze calls) share.
+# Concurrent misses for one key wait for the first computation. The cache
+# itself is ANALYSIS_CACHE, an AnalysisCache from cache.py.
+
+def analyze_symbol(symbol, exchange_name=None, verbose=True, use_cache=True):
+    """Cached analyze: see _analyze_symbol for the result format.
+
+    Results are reused until the current TIMEFRAME candle closes; callers get
+    a deep copy, so mutating nested fields cannot corrupt the cached entry.
+    use_cache=False (or ANALYZE_CACHE=false) always recomputes.
+    """
+    with request_lane('analyze'):
+        if not use_cache or not CONFIG.get("analyze_cache"):
+            return _analyze_symbol(symbol, exchange_name, verbose)
+        try:
+            ex = get_public_exchange(exchange_name)
+            resolved = symbol_index_for(ex).resolve(symbol) or symbol
+            timeframe = CONFIG["timeframe"]
+            tf_ms = _timeframe_ms(ex, timeframe)
+            now_ms = int(time.time() * 1000)
+            candle = now_ms - now_ms % tf_ms
+            key = (str(getattr(ex, 'id', '') or exchange_name or '').lower(), resolved, timeframe, candle)
+        except Exception:
+            # let the uncached path report the problem
+            return _analyze_symbol(symbol, exchange_name, verbose)
+        import copy
+        result = ANALYSIS_CACHE.get_or_compute(key, candle + tf_ms, verbose, lambda: _analyze_symbol(symbol, exchange_name, verbose))
+        return copy.deepcopy(result)
+
+
+def _parse_symbol_list(spec):
+    """Split '--analyze' input: 'BTC,ETH', '@watchlist.txt' or '-' (stdin)."""
+    import sys
+    spec = str(spec or '').strip()
+    if spec == '-':
+        text = sys.stdin.read()
+    elif spec.startswith('@'):
+        with open(spec[1:]) as fh:
+            text = fh.read()
+    else:
+        text = spec
+    out = []
+    for line in text.replace(',', '\n').splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line and line not in out:
+            out.append(line)
+    return out
+
+def analyze_symbols(symbols, exchange_name=None, workers=None, verbose=True):
+    """Analyze many symbols concurrently, yielding (query, result) as each finishes.
+
+    The pooled public exchange and its markets are loaded once up front and
+    shared by every worker.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    workers = max(1, int(workers or CONFIG.get("scan_concurrency") or 1))
+    try:
+        with request_lane('analyze'):
+            load_markets_cached(get_public_exchange(exchange_name))
+    except Exception:
+        # analyze_symbol reports the error per symbol
+        pass
+    with ThreadPoolExecutor(max_workers=min(workers, max(1, len(symbols)))) as pool:
+        task = in_current_lane(analyze_symbol)
+        futures = {pool.submit(task, sym, exchange_name, verbose): sym for sym in symbols}
+        for fut in as_completed(futures):
+            sym = futures[fut]
+            try:
+                yield sym, fut.result()
+            except Exception as e:
+                yield sym, {'error': str(e), 'symbol': sym}
+
+# --------- صيغة مضغوطة لنتائج التحليل ---------
+# Fixed numeric schema for bulk analyze output: a record is the symbol plus one
+# number per COMPACT_FIELDS entry (None, or NaN in binary, when not available).
+# Labels are stored as the small integers in COMPACT_CODES.
+COMPACT_SCHEMA_VERSION = 1
+COMPACT_CODES = {
+    'signal': {'HOLD': 0, 'BUY': 1, 'SELL': -1},
+    'trend': {'MIXED': 0, 'BULL': 1, 'BEAR': -1},
+    'htf': {'MIXED': 0, 'BULL': 1, 'BEAR': -1},
+    'position_sizing': {'light': 0, 'normal': 1, 'aggressive': 2},
+    'action': {'wait': 0, 'enter_long': 1, 'enter_short': -1, 'consider_enter': 2},
+}
+COMPACT_FIELDS = (
+    'ts', 'close', 'prev_close', 'close_change', 'volume', 'prev_volume', 'volume_change',
+    'signal', 'score', 'trend', 'position_sizing',
+    'ema50', 'ema200', 'ema_diff', 'macd', 'macd_signal', 'macd_hist', 'stoch_rsi',
+    'rsi', 'atr', 'atr_pct', 'ema_slope', 'macd_strength', 'vol_vs_ma',
+    'vote_ema', 'vote_macd', 'vote_rsi', 'vote_vol', 'bull_weight', 'bear_weight',
+    'htf_allows_bull', 'htf_allows_bear',
+) + tuple(f'htf_{tf}' for tf in HTF_TIMEFRAMES) + (
+    'action', 'entry', 'entry_low', 'entry_high', 'sl', 'tp1', 'tp2', 'tp3', 'risk_pct',
+)
+_COMPACT_MAGIC = b'TPCR'
+_COMPACT_RECORD = None
+
+def _compact_struct():
+    global _COMPACT_RECORD
+    if _COMPACT_RECORD is None:
+        import struct
+        _COMPACT_RECORD = struct.Struct('<%dd' % len(COMPACT_FIELDS))
+    return _COMPACT_RECORD
+
+def _code_of(kind, label):
+    return COMPACT_CODES[kind].get(label)
+
+def to_compact(result):
+    """Flatten an analyze_symbol result to [symbol, *values] in COMPACT_FIELDS order."""
+    def num(v):
+        if v is None:
+            return None
+        v = float(v)
+        return None if v != v else v
+    ind = result.get('indicators') or {}
+    votes = result.get('votes') or {}
+    bias = result.get('higher_timeframe_bias') or {}
+    rec = result.get('recommendation') or {}
+    zone = rec.get('entry_zone') or [None, None]
+    tps = (list(rec.get('tps') or []) + [None, None, None])[:3]
+    values = [
+        result.get('ts'), result.get('close'), result.get('prev_close'), result.get('close_change'),
+        result.get('volume'), result.get('prev_volume'), result.get('volume_change'),
+        _code_of('signal', result.get('signal')), result.get('score'),
+        _code_of('trend', result.get('trend')), _code_of('position_sizing', result.get('position_sizing')),
+        ind.get('EMA50'), ind.get('EMA200'), ind.get('EMA_diff'), ind.get('MACD'),
+        ind.get('MACD_signal'), ind.get('MACD_hist'), ind.get('StochRSI'),
+        result.get('rsi'), result.get('atr'), result.get('atr_pct'), result.get('ema_slope'),
+        result.get('macd_strength'), result.get('vol_vs_ma'),
+        votes.get('vote_ema'), votes.get('vote_macd'), votes.get('vote_rsi'), votes.get('vote_vol'),
+        votes.get('bull_weight'), votes.get('bear_weight'),
+        votes.get('htf_allows_bull'), votes.get('htf_allows_bear'),
+    ]
+    values += [_code_of('htf', bias.get(tf)) for tf in HTF_TIMEFRAMES]
+    values += [_code_of('action', rec.get('action')), rec.get('entry'), zone[0], zone[1],
+               rec.get('sl'), tps[0], tps[1], tps[2], rec.get('risk_pct')]
+    return [result.get('symbol')] + [num(v) for v in values]
+
+def from_compact(record):
+    """Inverse of to_compact: a flat {field: value} dict with labels restored."""
+    kinds = {name: name for name in ('signal', 'trend', 'position_sizing', 'action')}
+    kinds.update({f'htf_{tf}': 'htf' for tf in HTF_TIMEFRAMES})
+    out = {'symbol': record[0]}
+    for name, v in zip(COMPACT_FIELDS, record[1:]):
+        if v is not None and v != v:
+            v = None
+        if v is not None and name in kinds:
+            v = next((k for k, c in COMPACT_CODES[kinds[name]].items() if c == v), None)
+        elif v is not None and name == 'ts':
+            v = int(v)
+        out[name] = v
+    return out
+
+def compact_header():
+    """Binary stream header: magic, schema version and field count."""
+    import struct
+    return _COMPACT_MAGIC + struct.pack('<BH', COMPACT_SCHEMA_VERSION, len(COMPACT_FIELDS))
+
+def pack_compact(record):
+    """One binary record: uint16 symbol length, UTF-8 symbol, float64 values (NaN = missing)."""
+    import struct
+    sym = str(record[0] or '').encode('utf-8')
+    nan = float('nan')
+    return struct.pack('<H', len(sym)) + sym + _compact_struct().pack(*[nan if v is None else v for v in record[1:]])
+
+def unpack_compact(buf):
+    """Yield [symbol, *values] records from a header + records byte string."""
+    import struct
+    buf = memoryview(buf)
+    if bytes(buf[:4]) != _COMPACT_MAGIC:
+        raise ValueError("not a compact analyze stream")
+    version, nfields = struct.unpack_from('<BH', buf, 4)
+    if version != COMPACT_SCHEMA_VERSION or nfields != len(COMPACT_FIELDS):
+        raise ValueError(f"compact schema mismatch: v{version}/{nfields} fields")
+    rec = _compact_struct()
+    pos = 7
+    while pos < len(buf):
+        (n,) = struct.unpack_from('<H', buf, pos)
+        sym = bytes(buf[pos + 2:pos + 2 + n]).decode('utf-8')
+        pos += 2 + n
+        values = rec.unpack_from(buf, pos)
+        pos += rec.size
+        yield [sym] + [None if v != v else v for v in values]
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise RuntimeError("❌ --format msgpack requires the 'msgpack' package (pip install msgpack)")
+    return msgpack
+
+def compact_schema():
+    return {'version': COMPACT_SCHEMA_VERSION, 'fields': list(COMPACT_FIELDS), 'codes': COMPACT_CODES}
+
 def _cli_analyze():
-    import argparse, json
+    import argparse, json, sys
     p = argparse.ArgumentParser()
-    p.add_argument('--analyze', help='Symbol to analyze', required=True)
+    p.add_argument('--analyze', nargs='?', help="Symbol(s) to analyze: 'BTC', 'BTC,ETH,SOL', '@file' or '-' for stdin")
+    p.add_argument('--concurrency', type=int, default=None, help='Parallel analyses in batch mode')
+    p.add_argument('--format', choices=('json', 'compact', 'msgpack', 'binary'), default='json',
+                   help='json: full result dicts; compact: JSON arrays in COMPACT_FIELDS order; '
+                        'msgpack/binary: the same arrays packed')
+    p.add_argument('--text', action='store_true', help='Build advice/explain text even for compact formats')
+    p.add_argument('--schema', action='store_true', help='Print the compact field list and exit')
     args = p.parse_args()
-    out = analyze_symbol(args.analyze)
-    print(json.dumps(out))
+    if args.schema:
+        print(json.dumps(compact_schema()))
+        return
+    if not args.analyze:
+        p.error('--analyze needs a symbol list')
+    fmt = args.format
+    verbose = fmt == 'json' or args.text
+    packer = _msgpack().Packer() if fmt == 'msgpack' else None
+    if fmt == 'binary':
+        sys.stdout.buffer.write(compact_header())
 
+    def emit(query, out):
+        with METRICS.span('serialize', op='analyze'):
+            if fmt == 'json' or 'error' in out:
+                # errors stay dicts in every format
+                if batch or fmt != 'json':
+                    out = dict(out, query=query)
+                if fmt == 'msgpack':
+                    sys.stdout.buffer.write(packer.pack(out))
+                elif fmt == 'binary':
+                    print(json.dumps(out), file=sys.stderr)
+                else:
+                    sys.stdout.write(json.dumps(out) + "\n")
+            elif fmt == 'compact':
+                sys.stdout.write(json.dumps(to_compact(out)) + "\n")
+            elif fmt == 'msgpack':
+                sys.stdout.buffer.write(packer.pack(to_compact(out)))
+            else:
+                sys.stdout.buffer.write(pack_compact(to_compact(out)))
+        sys.stdout.flush()
 
-if __name__ == '__main__':
-    # preserve previous behavior when running without args
+    symbols = _parse_symbol_list(args.analyze)
+    batch = len(symbols) != 1 or args.analyze == '-' or args.analyze.startswith('@')
+    if not batch:
+        # single symbol: unchanged output (one JSON object) in the default format
+        emit(symbols[0], analyze_symbol(symbols[0], verbose=verbose))
+        return
+    # batch mode: one record per symbol, flushed as soon as it is ready
+    for query, out in analyze_symbols(symbols, workers=args.concurrency, verbose=verbose):
+        emit(query, out)
+
+
+# --------- فحص الجاهزية ---------
+_PROCESS_START = time.time()
+
+def health():
+    """Cheap liveness report: no heavy imports, no network."""
     import sys
-    if len(sys.argv) > 1:
-        # if --analyze used, run CLI analyze
-        if '--analyze' in sys.argv:
-            _cli_analyze()
-            sys.exit(0)
+    return {
+        'ok': True,
+        'exchange': CONFIG.get('exchange'),
+        'dry_run': CONFIG.get('dry_run'),
+        'loaded': {name: name in sys.modules for name in ('ccxt', 'pandas', 'ta', 'numpy')},
+        'uptime_s': round(time.time() - _PROCESS_START, 3),
+        'single_flight': {venue: ex.single_flight.stats() for venue, ex in list(_PUBLIC_EXCHANGES.items())
+                          if getattr(ex, 'single_flight', None) is not None},
+        'rate_budgets': {venue: budget.stats() for venue, budget in list(_VENUE_BUDGETS.items())},
+        'candles': CANDLES.memory(),
+    }
+
+
+# --------- نقطة الدخول ---------
+# `python trading.py` with no mode flag runs the scanner (run_once, or
+# run_multi when EXCHANGES lists several venues). Each mode flag hands over
+# to its CLI; the modes that live in other modules are imported only then,
+# so --health and --serve start without loading the backtest or bench code.
+def main():
+    _stdout = sys.stdout
+    if '--serve' in sys.argv and not any(a.startswith('--socket') for a in sys.argv):
+        # stdout is the response stream: diagnostics from here on go to stderr
+        sys.stdout = sys.stderr
+    if '--health' in sys.argv:
+        import json
+        print(json.dumps(health()))
+        return
+    if '--startup-bench' in sys.argv:
+        import json
+        from bench import startup_benchmark
+        print(json.dumps(startup_benchmark()))
+        return
+    start_metrics_exporters()
+    if '--bench' in sys.argv or '--bench-record' in sys.argv:
+        from bench import cli_bench
+        cli_bench()
+    elif '--venues' in sys.argv:
+        _cli_venues()
+    elif '--serve' in sys.argv:
+        from serve import cli_serve
+        cli_serve(_stdout)
+    elif '--analyze' in sys.argv:
+        _cli_analyze()
+    elif '--backtest' in sys.argv:
+        from backtest import cli_backtest
+        cli_backtest()
+    elif '--optimize' in sys.argv:
+        from backtest import cli_optimize
+        cli_optimize()
+    elif '--stream' in sys.argv:
+        from stream import cli_stream
+        cli_stream()
+    elif '--schedule' in sys.argv:
+        print(f"Starting scheduled scanner: dry_run={CONFIG['dry_run']}, exchange={CONFIG['exchange']}")
+        try:
+            run_scheduled()
+        except KeyboardInterrupt:
+            pass
+    elif len(venue_list()) > 1:
+        print(f"Starting trading run: dry_run={CONFIG['dry_run']}, exchanges={','.join(venue_list())}")
+        run_multi()
+    else:
+        print(f"Starting trading run: dry_run={CONFIG['dry_run']}, exchange={CONFIG['exchange']}")
+        run_once()
+
+
+if __name__ == '__main__':
+    main()